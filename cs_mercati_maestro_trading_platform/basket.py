@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+import argparse
+import collections
+import csv
+import itertools
+import logging
+import os
+import sys
+import time
+
+from messages import SIDES, parse_price, parse_quantity
+from tradingclient import PENDING, REJECTED, ROUTER_HOST, ROUTER_PORT, TradingClient
+
+"""
+Basket Orders
+-------------
+Loads a basket of orders from a CSV (or Parquet, if pyarrow is installed) file, validates it column by
+column in a single pass, and streams the valid orders to the Order Router over one TradingClient
+session. Orders are written in batches of --batch per sendall, paced to --rate orders/sec, then
+their acks and rejects are awaited in the client's order table for up to --wait seconds.
+
+File columns: symbol, side, quantity, price (price empty or missing = market order).
+
+Usage:
+    python3 basket.py open_rebalance.csv --batch 200 --rate 5000
+"""
+
+COLUMNS = ('symbol', 'side', 'quantity', 'price')
+MAX_ORDER_QTY = 1000000  # Fat finger limit per order
+WAIT = 5.0  # Seconds to wait for the venue to answer the orders sent
+
+
+def _check_columns(path, names):
+    missing = [c for c in COLUMNS[:3] if c not in names]
+    if missing:
+        raise ValueError(f"Basket {path} is missing columns: {', '.join(missing)}")
+
+
+def load_basket(path):
+    """Return the basket as a dict of columns (lists of strings)."""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet baskets requires pyarrow (pip install pyarrow)")
+        table = {name.strip().lower(): values for name, values in pq.read_table(path).to_pydict().items()}
+        _check_columns(path, table)
+        rows = len(next(iter(table.values()), []))
+        return {column: ['' if v is None else str(v) for v in table.get(column, [''] * rows)]
+                for column in COLUMNS}
+
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip().lower() for name in next(reader, [])]
+        _check_columns(path, header)
+        rows = [row + [''] * (len(header) - len(row)) for row in reader if row]
+    return {column: [row[header.index(column)].strip() for row in rows] if column in header else [''] * len(rows)
+            for column in COLUMNS}
+
+
+def validate_basket(columns):
+    """Validate every column in one pass each.
+
+    Returns (orders, rejects) where orders is a list of (symbol, side, quantity, price) and rejects a
+    list of (row, reason). Row numbers are 1-based data rows.
+    """
+    symbols = columns['symbol']
+    sides = [side.lower() for side in columns['side']]
+    quantities = [q if q is not None and q <= MAX_ORDER_QTY else None for q in map(parse_quantity, columns['quantity'])]
+    prices = [parse_price(p) if p else 0.0 for p in columns['price']]  # empty = market order
+
+    bad = ([not s or not s.isalnum() for s in symbols],
+           [s not in SIDES for s in sides],
+           [q is None for q in quantities],
+           [p is None for p in prices])
+    bad_rows = list(map(any, zip(*bad)))
+    good_rows = [not b for b in bad_rows]
+
+    orders = list(zip(itertools.compress(symbols, good_rows), itertools.compress(sides, good_rows),
+                      itertools.compress(quantities, good_rows),
+                      [p or None for p in itertools.compress(prices, good_rows)]))
+    rejects = [(row + 1, f"invalid {', '.join(itertools.compress(COLUMNS, checks))}")
+               for row, checks in zip(itertools.compress(range(len(bad_rows)), bad_rows),
+                                      itertools.compress(zip(*bad), bad_rows))]
+    return orders, rejects
+
+
+def submit_basket(client, path, batch=100, rate=0, wait=WAIT):
+    """Load, validate and stream a basket, wait for the venue's answers; return a report dict."""
+    start = time.perf_counter()
+    orders, invalid = validate_basket(load_basket(path))
+    for row, reason in invalid:
+        logging.warning(f"Basket {path} row {row} rejected: {reason}")
+    validated = time.perf_counter()
+
+    sent = []
+    failed = 0
+    for i in range(0, len(orders), batch):
+        chunk = orders[i:i + batch]
+        try:
+            sent.extend(client.send_orders(chunk))
+        except OSError as e:
+            logging.error(f"Basket {path}: could not send orders {i + 1}-{i + len(chunk)}: {e}")
+            failed = len(orders) - i
+            break
+        if rate:
+            # Pace to the requested rate: sleep until this batch's slot has passed
+            delay = (i + len(chunk)) / rate - (time.perf_counter() - validated)
+            if delay > 0:
+                time.sleep(delay)
+    elapsed = time.perf_counter() - validated
+
+    # The order table moves each order on from pending when its ack, fill or reject comes back
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline and any(order.status == PENDING for order in sent):
+        time.sleep(0.01)
+    rejected = [order for order in sent if order.status == REJECTED]
+    pending = sum(order.status == PENDING for order in sent)
+
+    reasons = collections.Counter(reason for _, reason in invalid)
+    reasons.update(f"venue reject: {order.reason or 'no reason'}" for order in rejected)
+    report = {
+        'file': path,
+        'orders': len(orders) + len(invalid),
+        'invalid': len(invalid),
+        'sent': len(sent),
+        'accepted': len(sent) - len(rejected) - pending,
+        'rejected': len(rejected),
+        'pending': pending,
+        'failed': failed,
+        'reject_reasons': dict(reasons),
+        'validate_seconds': round(validated - start, 6),
+        'submit_seconds': round(elapsed, 6),
+        'orders_per_sec': round(len(sent) / elapsed, 1) if elapsed else 0.0,
+    }
+    logging.info(f"Basket report: {report}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Submit a basket of orders from a file")
+    parser.add_argument("path", help="CSV or Parquet basket file")
+    parser.add_argument("--host", default=ROUTER_HOST, help="Order Router host")
+    parser.add_argument("--port", type=int, default=ROUTER_PORT, help="Order Router port")
+    parser.add_argument("--batch", type=int, default=100, help="orders per write")
+    parser.add_argument("--rate", type=float, default=0, help="max orders/sec (0 = unlimited)")
+    parser.add_argument("--wait", type=float, default=WAIT, help="seconds to wait for acks and rejects after sending")
+    args = parser.parse_args(argv)
+
+    log_dir = "logs"
+    os.makedirs(log_dir, exist_ok=True)
+    logging.basicConfig(filename=os.path.join(log_dir, f'basket_{time.strftime("%y%m%d%H%M%S")}.log'),
+                        level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    client = TradingClient(args.host, args.port, market_data=False)
+    try:
+        report = submit_basket(client, args.path, batch=max(1, args.batch), rate=args.rate, wait=args.wait)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Basket submission failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        client.stop()
+
+    print(f"{report['sent']} sent of {report['orders']} orders in {report['submit_seconds']:.3f}s "
+          f"({report['orders_per_sec']:.0f} orders/sec): {report['accepted']} accepted, {report['rejected']} rejected "
+          f"by the venue, {report['pending']} unanswered, {report['invalid']} invalid, {report['failed']} not sent")
+    for reason, count in report['reject_reasons'].items():
+        print(f"  {count} x {reason}")
+    return 0 if not report['failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
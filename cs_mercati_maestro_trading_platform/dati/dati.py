@@ -12,7 +12,8 @@ import sys
 Market Data App
 ---------------
 This application simulates a market data feed, sending random "blue" or "red" messages via multicast
-every 1-3 seconds. It acts as the data source for the trading platform.
+every 1-3 seconds. The platform's feed now comes from the Market Simulator's books (see
+sim/marketdata.py); this app is kept to exercise a market data reader without the simulator.
 
 - Sending: Multicast to 224.1.1.1 on port 5007.
 - Dependencies: None
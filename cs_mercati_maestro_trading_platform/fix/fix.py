@@ -1,18 +1,33 @@
-import socket
+import argparse
 import logging
 import os
 import signal
 import sys
-import threading
 import time
 
+# Shared platform modules live one directory up
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from fixengine import DICTIONARY, FixEngine
+from fixsession import HEARTBEAT_INTERVAL
+from fixstore import FSYNC_INTERVAL, FSYNC_POLICIES
+from passthrough import PassThroughRelay
+from relaycore import QUEUE_DEPTH, SHED_POLICIES, run_relay
+
 """
 FIX Engine App
 --------------
 This application receives orders from the Order Router and forwards them to the Market Simulator.
 
 - Receiving: TCP from Order Router on localhost:5009.
-- Sending: TCP to Market Simulator on localhost:5010.
+- Sending: TCP to Market Simulator on localhost:5010, as FIX 4.4 sessions with sequence numbers,
+  heartbeats and gap recovery (see fixengine.py, fixsession.py). Session state is kept under
+  fixstore/ so a restart resumes the sequence instead of replaying the day; --fsync picks when
+  stored messages are forced to disk.
+- Connections: all clients are served by one asyncio event loop and multiplexed onto
+  UPSTREAM_SESSIONS shared upstream connections (see relaycore.py), each behind a bounded
+  queue (--queue-depth, --shed-policy). With --passthrough, every client instead gets its own
+  simulator connection and bytes are spliced kernel to kernel (see passthrough.py).
 - Dependencies: None
 """
 
@@ -28,6 +43,7 @@ logging.basicConfig(filename=os.path.join(log_dir, f'fixengine_{time.strftime("%
 HOST = 'localhost'
 PORT_RECEIVE = 5009
 PORT_SEND = 5010
+UPSTREAM_SESSIONS = 4  # Upstream connections shared by all clients
 
 def signal_handler(sig, frame):
     logging.info("FIX Engine App interrupted and exiting gracefully.")
@@ -35,31 +51,30 @@ def signal_handler(sig, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
-def handle_client(conn, addr):
-    logging.debug(f'Connected by {addr}')
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST, PORT_SEND))
-        try:
-            while True:
-                data = conn.recv(1024)
-                if not data:
-                    break
-                logging.debug(f'Received order: {data.decode("utf-8")}')
-                s.sendall(data)
-        except Exception as e:
-            logging.error(f'Exception in handling client: {e}')
-        finally:
-            conn.close()
-
-def start_server():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, PORT_RECEIVE))
-        s.listen()
-        logging.info('FIX Engine listening for connections')
-        while True:
-            conn, addr = s.accept()
-            thread = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
-            thread.start()
+def start_server(port=PORT_RECEIVE, upstream_port=PORT_SEND, queue_depth=QUEUE_DEPTH, shed_policy='block',
+                 passthrough=False, heartbeat_interval=HEARTBEAT_INTERVAL, fsync='interval',
+                 fsync_interval=FSYNC_INTERVAL, sessions=UPSTREAM_SESSIONS, dictionary=DICTIONARY):
+    if passthrough:
+        run_relay(PassThroughRelay('FIX Engine', HOST, port, HOST, upstream_port))
+        return
+    relay = FixEngine('FIX Engine', HOST, port, HOST, upstream_port, sessions=sessions,
+                      queue_depth=queue_depth, shed_policy=shed_policy, heartbeat_interval=heartbeat_interval,
+                      fsync=fsync, fsync_interval=fsync_interval, dictionary=dictionary)
+    run_relay(relay)
 
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser(description="FIX Engine")
+    parser.add_argument("--port", type=int, default=PORT_RECEIVE, help="port to accept the Order Router on")
+    parser.add_argument("--sim-port", type=int, default=PORT_SEND, help="Market Simulator port")
+    parser.add_argument("--queue-depth", type=int, default=QUEUE_DEPTH, help="messages queued per upstream session")
+    parser.add_argument("--shed-policy", choices=SHED_POLICIES, default="block", help="what to do when a queue is full")
+    parser.add_argument("--passthrough", action="store_true", help="splice bytes to the simulator without parsing")
+    parser.add_argument("--heartbeat", type=int, default=HEARTBEAT_INTERVAL, help="FIX HeartBtInt in seconds")
+    parser.add_argument("--fsync", choices=FSYNC_POLICIES, default="interval", help="when the message store syncs to disk")
+    parser.add_argument("--fsync-interval", type=int, default=FSYNC_INTERVAL, help="ms between syncs for --fsync interval")
+    parser.add_argument("--sessions", type=int, default=UPSTREAM_SESSIONS, help="FIX sessions to the simulator")
+    parser.add_argument("--dictionary", default=DICTIONARY, help="FIX data dictionary to validate against")
+    parser.add_argument("--no-validate", action="store_true", help="skip data dictionary validation")
+    args = parser.parse_args()
+    start_server(args.port, args.sim_port, args.queue_depth, args.shed_policy, args.passthrough, args.heartbeat,
+                 args.fsync, args.fsync_interval, args.sessions, None if args.no_validate else args.dictionary)
@@ -0,0 +1,116 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from fixcodec import (CL_ORD_ID, CUM_QTY, EXEC_TYPE, LAST_PX, LAST_QTY, ORDER_QTY, PRICE, SIDE, SYMBOL,
+                      FixEncoder, FixParser, parse)
+from fixdict import load_dictionary
+from fixstore import FSYNC_POLICIES, MessageStore
+
+"""
+FIX Codec Benchmark
+-------------------
+Encode and parse rates of fixcodec.py for NewOrderSingle and ExecutionReport, in messages/sec.
+Parsing includes checksum validation and reading the fields the FIX Engine uses; the validate
+case also checks every field against the FIX44.xml data dictionary (fixdict.py). The store
+cases append ExecutionReports to a MessageStore (fixstore.py) in a temporary directory under
+each fsync policy, then read them back by MsgSeqNum in random order.
+
+Usage:
+    python3 fixbench.py --count 200000
+"""
+
+
+def rate(count, seconds):
+    return f'{count / seconds:>12,.0f} msgs/s  ({seconds / count * 1e6:.2f} us/msg)'
+
+
+def bench(results, name, count, function):
+    started = time.perf_counter()
+    function(count)
+    seconds = time.perf_counter() - started
+    results[name] = round(count / seconds)
+    print(f'{name:<34} {rate(count, seconds)}')
+
+
+def run_all(count):
+    """Run every case with count messages. Returns {case: messages/sec} (also used by fixperf.py)."""
+    results = {}
+    encoder = FixEncoder('FIXENGINE', 'MARKETSIM')
+    new_order = encoder.new_order_single(1, 'T1234-1', 'red', 'buy', 100, 10.25)
+    report = encoder.execution_report(2, 'O1', 'T1234-1', 'E1', b'F', b'2', 'red', 'buy', 0, 100, 10.25,
+                                      last_qty=100, last_px=10.25)
+
+    def encode_new_orders(count):
+        for seq in range(count):
+            encoder.new_order_single(seq, 'T1234-1', 'red', 'buy', 100, 10.25)
+
+    def encode_reports(count):
+        for seq in range(count):
+            encoder.execution_report(seq, 'O1', 'T1234-1', 'E1', b'F', b'2', 'red', 'buy', 0, 100, 10.25,
+                                     last_qty=100, last_px=10.25)
+
+    def parse_new_orders(count):
+        for _ in range(count):
+            message = parse(new_order)
+            message.get(CL_ORD_ID), message.get(SYMBOL), message.get(SIDE), message.get(ORDER_QTY), message.get(PRICE)
+
+    def parse_reports(count):
+        for _ in range(count):
+            message = parse(report)
+            message.get(CL_ORD_ID), message.get(EXEC_TYPE), message.get(LAST_QTY), message.get(LAST_PX), message.get(CUM_QTY)
+
+    def validate_reports(count):
+        for _ in range(count):
+            dictionary.validate(parse(report))
+
+    def stream_parse(count):
+        stream = (new_order + report) * (count // 2)
+        fix_parser = FixParser()
+        for start in range(0, len(stream), 65536):
+            fix_parser.feed(stream[start:start + 65536])
+
+    def store_append(fsync):
+        def run(count):
+            for seq in range(1, count + 1):
+                store.append(seq, report)
+                store.set_seqnums(1, seq + 1)
+        store = MessageStore(directory, f'bench-{fsync}', fsync)
+        return run
+
+    def store_get(count):
+        store = MessageStore(directory, 'bench-os')
+        for seq in random.sample(range(1, count + 1), count):
+            store.get(seq)
+
+    print(f'NewOrderSingle {len(new_order)} bytes, ExecutionReport {len(report)} bytes, {count:,} per case')
+    bench(results, 'encode NewOrderSingle', count, encode_new_orders)
+    bench(results, 'encode ExecutionReport', count, encode_reports)
+    bench(results, 'parse NewOrderSingle (5 tags)', count, parse_new_orders)
+    bench(results, 'parse ExecutionReport (5 tags)', count, parse_reports)
+    bench(results, 'stream parse (64 KiB reads)', count, stream_parse)
+    dictionary = load_dictionary(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FIX44.xml'))
+    bench(results, 'parse + validate ExecutionReport', count, validate_reports)
+    directory = tempfile.mkdtemp(prefix='fixbench-')
+    try:
+        for fsync in FSYNC_POLICIES:
+            bench(results, f'store append (fsync {fsync})', count if fsync != 'always' else min(count, 10000),
+                  store_append(fsync))
+        bench(results, 'store get by MsgSeqNum (random)', count, store_get)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FIX codec benchmark")
+    parser.add_argument("--count", type=int, default=200000, help="messages per case")
+    args = parser.parse_args()
+    run_all(args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import decimal
+import math
+import time
+
+"""
+FIX 4.4 Codec
+-------------
+tag=value encoding and decoding for the FIX Engine's session with the Market Simulator.
+
+- Parsing works on bytes (or a memoryview of a receive buffer) without splitting the whole
+  message: FixMessage finds a tag with one bytes.find() the first time it is read and caches it.
+  parse() checks BeginString, BodyLength and CheckSum before anything else is read.
+- FixParser cuts complete messages out of a TCP stream using BodyLength, so FIX needs no extra
+  framing on the wire.
+- FixEncoder keeps one precomputed header template per MsgType (35/49/56 and the 34= prefix) and
+  one reusable bytearray. Encoding appends the body fields, then patches in BodyLength and the
+  CheckSum. new_order_single() and execution_report() use fixed body templates for the two
+  messages on the hot path; optional fields (Price, TimeInForce, LastQty, ...) are appended.
+- Floats are written in plain decimal form (FIX has no exponent: 0.00001, not 1e-05), with the
+  digits of their shortest repr.
+
+See fixbench.py for parse and encode rates.
+"""
+
+SOH = b'\x01'
+BEGIN_STRING = b'FIX.4.4'
+
+# Tags
+BEGIN_STRING_TAG = 8
+BODY_LENGTH = 9
+CHECKSUM = 10
+MSG_TYPE = 35
+MSG_SEQ_NUM = 34
+SENDER_COMP_ID = 49
+TARGET_COMP_ID = 56
+SENDING_TIME = 52
+POSS_DUP_FLAG = 43
+ORIG_SENDING_TIME = 122
+ENCRYPT_METHOD = 98
+HEART_BT_INT = 108
+TEST_REQ_ID = 112
+BEGIN_SEQ_NO = 7
+END_SEQ_NO = 16
+NEW_SEQ_NO = 36
+GAP_FILL_FLAG = 123
+RESET_SEQ_NUM_FLAG = 141
+REF_SEQ_NUM = 45
+REF_TAG_ID = 371
+REF_MSG_TYPE = 372
+SESSION_REJECT_REASON = 373
+CXL_REJ_RESPONSE_TO = 434
+CL_ORD_ID = 11
+ORIG_CL_ORD_ID = 41
+ORDER_ID = 37
+EXEC_ID = 17
+EXEC_TYPE = 150
+ORD_STATUS = 39
+SYMBOL = 55
+SIDE = 54
+ORDER_QTY = 38
+ORD_TYPE = 40
+PRICE = 44
+TIME_IN_FORCE = 59
+TRANSACT_TIME = 60
+LAST_QTY = 32
+LAST_PX = 31
+LEAVES_QTY = 151
+CUM_QTY = 14
+AVG_PX = 6
+TEXT = 58
+
+# MsgTypes
+HEARTBEAT = b'0'
+TEST_REQUEST = b'1'
+RESEND_REQUEST = b'2'
+REJECT = b'3'
+SEQUENCE_RESET = b'4'
+LOGOUT = b'5'
+EXECUTION_REPORT = b'8'
+ORDER_CANCEL_REJECT = b'9'
+LOGON = b'A'
+NEW_ORDER_SINGLE = b'D'
+ORDER_CANCEL_REQUEST = b'F'
+ORDER_CANCEL_REPLACE_REQUEST = b'G'
+
+SIDES = {'buy': b'1', 'sell': b'2'}
+SIDE_NAMES = {code: name for name, code in SIDES.items()}
+MARKET = b'1'
+LIMIT = b'2'
+TIMES_IN_FORCE = {'day': b'0', 'gtc': b'1', 'ioc': b'3', 'fok': b'4'}
+TIME_IN_FORCE_NAMES = {code: name for name, code in TIMES_IN_FORCE.items()}
+
+CHECKSUM_SIZE = 7  # 10=NNN<SOH>
+MAX_BODY_LENGTH = 1 << 16
+TAG_KEYS = {}  # tag -> b'<SOH>tag=', the search key for FixMessage.get()
+
+
+class FixError(ValueError):
+    pass
+
+
+def checksum(data):
+    """FIX CheckSum: sum of the bytes modulo 256."""
+    return sum(data) & 0xFF
+
+
+class FixMessage:
+    """A parsed message. Tags are located on first access, not up front."""
+
+    __slots__ = ('data', 'cache')
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.cache = {}
+
+    def get(self, tag, default=None):
+        """Return the value of tag as bytes (first occurrence), or default."""
+        value = self.cache.get(tag)
+        if value is not None:
+            return value
+        data = self.data
+        key = TAG_KEYS.get(tag) or TAG_KEYS.setdefault(tag, b'\x01%d=' % tag)
+        start = data.find(key)
+        if start < 0:
+            return default
+        start += len(key)
+        value = data[start:data.index(SOH, start)]
+        self.cache[tag] = value
+        return value
+
+    def __getitem__(self, tag):
+        value = self.get(tag)
+        if value is None:
+            raise KeyError(tag)
+        return value
+
+    def __contains__(self, tag):
+        return self.get(tag) is not None
+
+    def get_int(self, tag, default=None):
+        value = self.get(tag)
+        return default if value is None else int(value)
+
+    def get_str(self, tag, default=None):
+        value = self.get(tag)
+        return default if value is None else value.decode('ascii')
+
+    @property
+    def msg_type(self):
+        return self.get(MSG_TYPE)
+
+    @property
+    def seq_num(self):
+        return self.get_int(MSG_SEQ_NUM)
+
+    def fields(self):
+        """All (tag, value) pairs in order, repeating groups included."""
+        pairs = []
+        for field in self.data.split(SOH)[:-1]:
+            tag, _, value = field.partition(b'=')
+            pairs.append((int(tag), value))
+        return pairs
+
+    def __repr__(self):
+        return f"FixMessage({self.data.replace(SOH, b'|').decode('ascii', 'replace')})"
+
+
+def frame_length(data, start=0):
+    """Length of the message starting at data[start:] if it is all there, 0 if more bytes are needed."""
+    if len(data) - start < 16:
+        return 0
+    if data[start:start + 10] != b'8=FIX.4.4\x01':
+        raise FixError(f'bad BeginString: {bytes(data[start:start + 10])!r}')
+    if data[start + 10:start + 12] != b'9=':
+        raise FixError('BodyLength must be the second field')
+    end = data.find(SOH, start + 12, start + 20)
+    if end < 0:
+        raise FixError('BodyLength too long')
+    body_length = int(data[start + 12:end])
+    if body_length > MAX_BODY_LENGTH:
+        raise FixError(f'BodyLength {body_length} too large')
+    total = end + 1 - start + body_length + CHECKSUM_SIZE
+    return total if len(data) - start >= total else 0
+
+
+def parse(data):
+    """Validate one complete message (bytes or memoryview) and return a FixMessage."""
+    data = bytes(data)  # one copy out of the receive buffer; no-op for bytes
+    length = frame_length(data)
+    if length != len(data):
+        raise FixError(f'message is {len(data)} bytes, BodyLength says {length or "more"}')
+    trailer = data[-CHECKSUM_SIZE:]
+    if trailer[:3] != b'10=' or trailer[-1:] != SOH:
+        raise FixError('CheckSum must be the last field')
+    expected = int(trailer[3:6])
+    actual = checksum(data[:-CHECKSUM_SIZE])
+    if actual != expected:
+        raise FixError(f'CheckSum {expected:03d} does not match {actual:03d}')
+    return FixMessage(data)
+
+
+class FixParser:
+    """Streaming parser: feed() raw bytes, get back the FixMessages completed so far."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        start = 0
+        view = memoryview(buffer)
+        try:
+            while True:
+                length = frame_length(buffer, start)
+                if not length:
+                    break
+                messages.append(parse(view[start:start + length]))
+                start += length
+        finally:
+            view.release()
+        if start:
+            del buffer[:start]
+        return messages
+
+    def pending(self):
+        return len(self.buffer)
+
+
+class SendingTimeClock:
+    """UTC SendingTime / TransactTime (YYYYMMDD-HH:MM:SS.sss), formatting the date part once a second."""
+
+    def __init__(self):
+        self.second = None
+        self.prefix = b''
+
+    def now(self):
+        now = time.time()
+        second = int(now)
+        if second != self.second:
+            self.second = second
+            self.prefix = time.strftime('%Y%m%d-%H:%M:%S', time.gmtime(second)).encode('ascii')
+        return b'%s.%03d' % (self.prefix, int((now - second) * 1000))
+
+
+def _field_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f'FIX has no form for {value}')
+        text = repr(value)
+        if 'e' in text:
+            text = format(decimal.Decimal(text), 'f')
+        return text.encode('ascii')
+    return str(value).encode('ascii')
+
+
+class FixEncoder:
+    """Encodes messages for one session (SenderCompID -> TargetCompID)."""
+
+    NEW_ORDER_SINGLE_BODY = b'11=%s\x0155=%s\x0154=%s\x0160=%s\x0138=%d\x0140=%s\x01'
+    EXECUTION_REPORT_BODY = (b'37=%s\x0111=%s\x0117=%s\x01150=%s\x0139=%s\x0155=%s\x0154=%s\x01'
+                             b'151=%d\x0114=%d\x016=%s\x01')
+
+    def __init__(self, sender, target, clock=None):
+        self.sender = _field_bytes(sender)
+        self.target = _field_bytes(target)
+        self.clock = clock or SendingTimeClock()
+        self.templates = {}  # MsgType -> b'35=..|49=..|56=..|34='
+        self.buffer = bytearray()
+
+    def template(self, msg_type):
+        template = self.templates.get(msg_type)
+        if template is None:
+            template = self.templates[msg_type] = (b'35=' + msg_type + SOH + b'49=' + self.sender + SOH
+                                                   + b'56=' + self.target + SOH + b'34=')
+        return template
+
+    def encode(self, msg_type, seq_num, fields=(), body=b'', sending_time=None):
+        """Encode a message from (tag, value) fields and/or a preformatted body. Returns bytes."""
+        buffer = self.buffer
+        del buffer[:]
+        buffer += self.template(msg_type)
+        buffer += b'%d\x0152=%s\x01' % (seq_num, sending_time or self.clock.now())
+        for tag, value in fields:
+            buffer += b'%d=%s\x01' % (tag, _field_bytes(value))
+        buffer += body
+        # Patch the header in front of the body, and the CheckSum behind it
+        buffer[0:0] = b'8=FIX.4.4\x019=%d\x01' % len(buffer)
+        buffer += b'10=%03d\x01' % checksum(buffer)
+        return bytes(buffer)
+
+    def new_order_single(self, seq_num, cl_ord_id, symbol, side, quantity, price=None, time_in_force=None):
+        transact_time = self.clock.now()
+        body = self.NEW_ORDER_SINGLE_BODY % (_field_bytes(cl_ord_id), _field_bytes(symbol), SIDES[side],
+                                             transact_time, quantity, MARKET if price is None else LIMIT)
+        if price is not None:
+            body += b'44=%s\x01' % _field_bytes(price)
+        if time_in_force is not None:
+            body += b'59=%s\x01' % TIMES_IN_FORCE[time_in_force]
+        return self.encode(NEW_ORDER_SINGLE, seq_num, body=body, sending_time=transact_time)
+
+    def execution_report(self, seq_num, *args, **kwargs):
+        return self.encode(EXECUTION_REPORT, seq_num, body=self.execution_report_body(*args, **kwargs))
+
+    @classmethod
+    def execution_report_body(cls, order_id, cl_ord_id, exec_id, exec_type, ord_status, symbol, side, leaves_qty,
+                              cum_qty, avg_px=0.0, last_qty=None, last_px=None, text=None, orig_cl_ord_id=None):
+        """The ExecutionReport fields after the header, for a sender that leaves the session to encode() it."""
+        body = cls.EXECUTION_REPORT_BODY % (_field_bytes(order_id), _field_bytes(cl_ord_id), _field_bytes(exec_id),
+                                            exec_type, ord_status, _field_bytes(symbol), SIDES[side],
+                                            leaves_qty, cum_qty, _field_bytes(avg_px))
+        if last_qty is not None:
+            body += b'32=%d\x01' % last_qty
+        if last_px is not None:
+            body += b'31=%s\x01' % _field_bytes(last_px)
+        if text is not None:
+            body += b'58=%s\x01' % _field_bytes(text)
+        if orig_cl_ord_id is not None:
+            body += b'41=%s\x01' % _field_bytes(orig_cl_ord_id)
+        return body
@@ -0,0 +1,207 @@
+import logging
+import marshal
+import os
+import xml.etree.ElementTree as ElementTree
+
+from fixcodec import MSG_TYPE
+
+"""
+FIX Data Dictionary
+-------------------
+Validates messages against a FIX data dictionary (QuickFIX XML layout, e.g. FIX44.xml): the
+MsgType is known, every tag is defined for it and appears once, CHAR/INT/... values have the
+right format and enum fields hold one of their values, and no required tag is missing.
+
+The XML is compiled once into flat tables, so validating a message costs one dict lookup per
+field plus a set membership test for enum fields:
+
+- messages: MsgType -> (required tags, {tag: (type code, frozenset of enum values or None)}),
+  keyed by the tag bytes as they appear on the wire so no field is converted to int. Components
+  and repeating groups are flattened in (group members are allowed, never required, and may
+  repeat).
+- types: a bytes array indexed by tag number holding a type code (UNDEFINED for unknown tags),
+  to tell an unknown tag from one not defined for the MsgType when reporting an error.
+
+The tables are cached with marshal in __pycache__ next to the spec, keyed by the spec's size and
+mtime like a .pyc, so only the first start after a dictionary change pays for parsing the XML.
+"""
+
+CACHE_VERSION = 2
+UNDEFINED = 0xFF
+
+# Type codes
+STRING, INT, FLOAT, CHAR, BOOLEAN, TIMESTAMP = range(6)
+TYPE_CODES = {
+    'INT': INT, 'LENGTH': INT, 'SEQNUM': INT, 'NUMINGROUP': INT, 'DAYOFMONTH': INT, 'TAGNUM': INT,
+    'FLOAT': FLOAT, 'PRICE': FLOAT, 'QTY': FLOAT, 'AMT': FLOAT, 'PRICEOFFSET': FLOAT, 'PERCENTAGE': FLOAT,
+    'CHAR': CHAR, 'BOOLEAN': BOOLEAN, 'UTCTIMESTAMP': TIMESTAMP,
+}
+
+# SessionRejectReason (373)
+INVALID_TAG_NUMBER = 0
+REQUIRED_TAG_MISSING = 1
+TAG_NOT_DEFINED_FOR_MESSAGE = 2
+TAG_WITHOUT_VALUE = 4
+VALUE_OUT_OF_RANGE = 5
+INCORRECT_DATA_FORMAT = 6
+INVALID_MSG_TYPE = 11
+TAG_REPEATED = 13
+
+
+def is_int(value):
+    return (value[1:] if value[:1] == b'-' else value).isdigit()
+
+
+def is_float(value):
+    return (value[1:] if value[:1] == b'-' else value).replace(b'.', b'', 1).isdigit()
+
+
+def is_char(value):
+    return len(value) == 1
+
+
+def is_boolean(value):
+    return value == b'Y' or value == b'N'
+
+
+def is_timestamp(value):
+    # YYYYMMDD-HH:MM:SS[.sss]
+    return len(value) in (17, 21) and value[8:9] == b'-' and value[:8].isdigit()
+
+
+CHECKS = (None, is_int, is_float, is_char, is_boolean, is_timestamp)  # indexed by type code
+
+
+class DataDictionary:
+    def __init__(self, tables):
+        self.types = tables['types']
+        self.messages = tables['messages']
+        self.names = tables['names']
+        self.repeatable = tables['repeatable']
+
+    def validate(self, message):
+        """Check a FixMessage. Returns None, or (SessionRejectReason, tag or None, text)."""
+        msg_type = message.msg_type
+        spec = self.messages.get(msg_type)
+        if spec is None:
+            return INVALID_MSG_TYPE, MSG_TYPE, f'invalid MsgType {msg_type!r}'
+        required, fields = spec
+        seen = set()
+        for field in message.data.split(b'\x01')[:-1]:
+            tag, _, value = field.partition(b'=')
+            field_spec = fields.get(tag)
+            if field_spec is None:
+                return self.unknown_tag(tag, msg_type)
+            if tag in seen and tag not in self.repeatable:
+                return TAG_REPEATED, int(tag), f'{self.names[int(tag)]} appears more than once'
+            seen.add(tag)
+            if not value:
+                return TAG_WITHOUT_VALUE, int(tag), f'{self.names[int(tag)]} has no value'
+            code, values = field_spec
+            if code and not CHECKS[code](value):
+                return INCORRECT_DATA_FORMAT, int(tag), f'{self.names[int(tag)]} has a bad value {value!r}'
+            if values is not None and value not in values:
+                return VALUE_OUT_OF_RANGE, int(tag), f'{self.names[int(tag)]} value {value!r} is not in the dictionary'
+        if not required <= seen:
+            tag = int(min(required - seen))
+            return REQUIRED_TAG_MISSING, tag, f'required tag {self.names[tag]} missing'
+        return None
+
+    def unknown_tag(self, tag, msg_type):
+        try:
+            tag = int(tag)
+        except ValueError:
+            return INVALID_TAG_NUMBER, None, f'invalid tag {tag!r}'
+        if tag >= len(self.types) or self.types[tag] == UNDEFINED:
+            return INVALID_TAG_NUMBER, tag, f'undefined tag {tag}'
+        return TAG_NOT_DEFINED_FOR_MESSAGE, tag, f'{self.names[tag]} not defined for MsgType {msg_type!r}'
+
+
+def compile_dictionary(path):
+    """Parse a QuickFIX-style XML dictionary into the flat tables DataDictionary uses."""
+    root = ElementTree.parse(path).getroot()
+    numbers = {}  # field name -> tag
+    names = {}
+    type_codes = {}
+    enums = {}
+    for field in root.find('fields'):
+        tag = int(field.get('number'))
+        numbers[field.get('name')] = tag
+        names[tag] = field.get('name')
+        type_codes[tag] = TYPE_CODES.get(field.get('type'), STRING)
+        values = [value.get('enum').encode('ascii') for value in field.findall('value')]
+        if values and field.get('type') != 'BOOLEAN':
+            enums[tag] = frozenset(values)
+    components = root.find('components')
+    components = {component.get('name'): component for component in components} if components is not None else {}
+    group_members = set()  # tags that may repeat, inside repeating groups
+
+    def flatten(element, required, allowed, is_required):
+        for child in element:
+            child_required = is_required and child.get('required') == 'Y'
+            if child.tag == 'field':
+                tag = numbers[child.get('name')]
+                allowed.add(tag)
+                if child_required:
+                    required.add(tag)
+            elif child.tag == 'component':
+                flatten(components[child.get('name')], required, allowed, child_required)
+            elif child.tag == 'group':
+                tag = numbers[child.get('name')]
+                allowed.add(tag)
+                if child_required:
+                    required.add(tag)
+                members = set()
+                flatten(child, set(), members, False)
+                group_members.update(members)
+                allowed.update(members)
+
+    header, trailer = set(), set()
+    header_required, trailer_required = set(), set()
+    flatten(root.find('header'), header_required, header, True)
+    flatten(root.find('trailer'), trailer_required, trailer, True)
+    def key(tag):
+        return str(tag).encode('ascii')
+
+    messages = {}
+    for message in root.find('messages'):
+        required, allowed = set(header_required | trailer_required), set(header | trailer)
+        flatten(message, required, allowed, True)
+        messages[message.get('msgtype').encode('ascii')] = (
+            frozenset(key(tag) for tag in required),
+            {key(tag): (type_codes[tag], enums.get(tag)) for tag in allowed})
+    types = bytearray([UNDEFINED]) * (max(type_codes) + 1)
+    for tag, code in type_codes.items():
+        types[tag] = code
+    return {'types': bytes(types), 'messages': messages, 'names': names,
+            'repeatable': frozenset(key(tag) for tag in group_members)}
+
+
+def cache_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, '__pycache__', name + '.dict')
+
+
+def load_dictionary(path):
+    """The DataDictionary for a spec file, from the cache when it is current."""
+    stat = os.stat(path)
+    key = (CACHE_VERSION, stat.st_size, stat.st_mtime_ns)
+    cache = cache_path(path)
+    try:
+        with open(cache, 'rb') as f:
+            cached_key, tables = marshal.load(f)
+        if tuple(cached_key) == key:
+            return DataDictionary(tables)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    tables = compile_dictionary(path)
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        temporary = f'{cache}.{os.getpid()}'
+        with open(temporary, 'wb') as f:
+            marshal.dump((key, tables), f)
+        os.replace(temporary, cache)
+    except OSError as e:
+        logging.warning(f'Cannot cache the FIX dictionary {path}: {e}')
+    logging.info(f'Compiled FIX dictionary {path}: {len(tables["names"])} fields, {len(tables["messages"])} messages')
+    return DataDictionary(tables)
@@ -0,0 +1,255 @@
+import asyncio
+import itertools
+import logging
+import os
+
+from fixcodec import (CL_ORD_ID, CXL_REJ_RESPONSE_TO, EXEC_TYPE, EXECUTION_REPORT, LAST_PX, LAST_QTY, LEAVES_QTY,
+                      LIMIT, MARKET, ORD_STATUS, ORD_TYPE, ORDER_CANCEL_REJECT, ORDER_CANCEL_REPLACE_REQUEST,
+                      ORDER_CANCEL_REQUEST, ORDER_QTY, ORIG_CL_ORD_ID, PRICE, REF_SEQ_NUM, REJECT, SIDE, SIDES,
+                      SYMBOL, TEXT, TIMES_IN_FORCE, TRANSACT_TIME)
+from fixdict import load_dictionary
+from fixsession import FixSession
+from fixstore import FSYNC_INTERVAL, MessageStore
+from messages import format_message, parse_message, parse_price, parse_quantity
+from relaycore import MessageRejected, Relay, UpstreamSession
+
+"""
+FIX Engine Core
+---------------
+Relay whose upstream sessions speak FIX 4.4 to the Market Simulator. Platform messages from the
+Order Router are translated to FIX on the way up, and execution reports back to platform
+messages on the way down:
+
+    order id=.. sym=.. side=.. qty=.. [px=..] [tif=day|gtc|ioc|fok]  ->  NewOrderSingle (D)
+    cancel id=..                               ->  OrderCancelRequest (F)
+    replace id=.. [qty=..] [px=..]             ->  OrderCancelReplaceRequest (G)
+    ExecutionReport (8) New / Trade / Canceled / Replaced / Rejected  ->  ack / fill / cancelled /
+                                                  replaced id=.. leaves=.. / reject
+    OrderCancelReject (9)                      ->  cancelreject id=.. reason=..
+    Reject (3) of one of the above             ->  reject id=.. / cancelreject id=.. of the message
+                                                  its RefSeqNum refers to
+
+An order or replace whose qty or px is not a number is answered here instead of being sent, with
+reject id=.. reason=bad_qty|bad_px for an order and cancelreject id=.. reason=.. to=2 for a replace.
+A cancel or replace of an order this session has no working order for is answered with
+cancelreject reason=unknown_order.
+
+Platform order IDs are the ClOrdIDs on the FIX side until a replace, which gives the order a new
+ClOrdID (<id>.rpl<n>); reports under it are translated back to the platform ID.
+
+Each upstream connection is its own FIX session (SenderCompID FIXENG<n>, TargetCompID MKTSIM)
+with its sequence numbers and sent messages kept in a store under STORE_DIR (see fixstore.py
+for the fsync policies), so after a reconnect or restart the two sides only exchange the gap.
+Session timers for all sessions run from one task. Execution reports are checked against the
+FIX44.xml data dictionary (see fixdict.py) before they are translated.
+"""
+
+SENDER_COMP_ID = 'FIXENG'
+TARGET_COMP_ID = 'MKTSIM'
+STORE_DIR = 'fixstore'
+DICTIONARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FIX44.xml')
+TIMER_INTERVAL = 1.0  # Seconds between session timer checks
+EXEC_TYPE_KINDS = {b'0': 'ack', b'F': 'fill', b'4': 'cancelled', b'5': 'replaced', b'8': 'reject'}
+TERMINAL_STATUSES = {b'2', b'4', b'8'}  # OrdStatus filled, canceled, rejected
+SENT_KEPT = 10000  # Recent application messages remembered per session, for the session Rejects of them
+
+
+def reason(message):
+    """Text (58) as a single token for the key=value platform format."""
+    text = message.get_str(TEXT)
+    return text.replace(' ', '_') if text else None
+
+
+class FixUpstreamSession(UpstreamSession):
+    resends_lost = True  # sequenced and stored before the write: served again on the resend request
+
+    def __init__(self, relay, index, host, port):
+        super().__init__(relay, index, host, port)
+        sender = f'{SENDER_COMP_ID}{index}'
+        store = MessageStore(relay.store_dir, f'{sender}-{TARGET_COMP_ID}', relay.fsync, relay.fsync_interval)
+        self.session = FixSession(sender, TARGET_COMP_ID, store, relay.heartbeat_interval,
+                                  dictionary=relay.dictionary)
+        self.orders = {}  # platform ID -> [symbol, side, quantity, price, ClOrdID] of working orders
+        self.platform_ids = {}  # ClOrdID -> platform ID, for ClOrdIDs given by a replace
+        self.replaces = {}  # ClOrdID of a replace not yet confirmed -> (quantity, price)
+        self.cancel_ids = itertools.count(1)
+        self.sent = {}  # MsgSeqNum -> (kind, platform ID, ClOrdID) of recent application messages
+
+    @property
+    def ready(self):
+        return self.connected and self.session.active
+
+    def on_connected(self):
+        self.session.connected(initiator=True)
+        self.flush()
+
+    def on_disconnected(self):
+        self.session.disconnected()
+
+    def flush(self):
+        """Write whatever the FIX session queued (logon, heartbeats, resends) outside the write loop."""
+        data = self.session.take_output()
+        if data and self.connected:
+            self.writer.write(data)
+            self.stats.bytes_out += len(data)
+
+    def encode(self, message):
+        self.to_fix(message)
+        return self.session.take_output()
+
+    def decode(self, data):
+        reports = self.session.on_data(data)
+        self.flush()
+        if self.session.logged_out:
+            self.writer.close()
+        messages = []
+        for report in reports:
+            message = self.from_fix(report)
+            if message is not None:
+                messages.append(message.encode('utf-8'))
+        return messages
+
+    def to_fix(self, message):
+        text = message.decode('utf-8')
+        kind, fields = parse_message(text)
+        order_id = fields.get('id')
+        seq = self.session.next_out
+        if kind == 'order':
+            symbol = fields.get('sym') or fields.get('args', ['red'])[0]
+            side = fields.get('side') if fields.get('side') in SIDES else 'buy'
+            if order_id is None:
+                order_id = f'{self.session.sender}-{self.session.next_out}'
+            quantity = parse_quantity(fields.get('qty', '1'))
+            if quantity is None:
+                raise MessageRejected('bad_qty')
+            if 'px' in fields and parse_price(fields['px']) is None:
+                raise MessageRejected('bad_px')
+            time_in_force = fields.get('tif') if fields.get('tif') in TIMES_IN_FORCE else None
+            self.orders[order_id] = [symbol, side, quantity, fields.get('px'), order_id]
+            self.session.new_order_single(order_id, symbol, side, quantity, fields.get('px'), time_in_force)
+            self.remember(seq, kind, order_id, order_id)
+        elif kind in ('cancel', 'replace') and order_id not in self.orders:
+            raise MessageRejected('unknown_order')
+        elif kind == 'cancel':
+            symbol, side, _, _, cl_ord_id = self.orders[order_id]
+            self.session.send(ORDER_CANCEL_REQUEST, [
+                (CL_ORD_ID, f'{order_id}.cxl{next(self.cancel_ids)}'), (ORIG_CL_ORD_ID, cl_ord_id),
+                (SYMBOL, symbol), (SIDE, SIDES[side]), (TRANSACT_TIME, self.session.encoder.clock.now())])
+            self.remember(seq, kind, order_id, None)
+        elif kind == 'replace':
+            symbol, side, quantity, price, cl_ord_id = self.orders[order_id]
+            if 'qty' in fields:
+                quantity = parse_quantity(fields['qty'])
+                if quantity is None:
+                    raise MessageRejected('bad_qty')
+            if 'px' in fields:
+                if parse_price(fields['px']) is None:
+                    raise MessageRejected('bad_px')
+                price = fields['px']
+            new_cl_ord_id = f'{order_id}.rpl{next(self.cancel_ids)}'
+            self.platform_ids[new_cl_ord_id] = order_id
+            self.replaces[new_cl_ord_id] = (quantity, price)
+            request = [(CL_ORD_ID, new_cl_ord_id), (ORIG_CL_ORD_ID, cl_ord_id), (SYMBOL, symbol), (SIDE, SIDES[side]),
+                       (TRANSACT_TIME, self.session.encoder.clock.now()), (ORDER_QTY, quantity),
+                       (ORD_TYPE, MARKET if price is None else LIMIT)]
+            if price is not None:
+                request.append((PRICE, price))
+            self.session.send(ORDER_CANCEL_REPLACE_REQUEST, request)
+            self.remember(seq, kind, order_id, new_cl_ord_id)
+        else:
+            logging.warning(f'{self.relay.name}: no FIX translation for {text}')
+
+    def remember(self, seq, kind, order_id, cl_ord_id):
+        self.sent[seq] = (kind, order_id, cl_ord_id)
+        if len(self.sent) > SENT_KEPT:
+            del self.sent[next(iter(self.sent))]
+
+    def from_session_reject(self, reject):
+        """The platform answer to a session Reject of a message this session sent, or None."""
+        ref = reject.get(REF_SEQ_NUM)
+        sent = self.sent.pop(int(ref), None) if ref and ref.isdigit() else None
+        if sent is None:
+            return None
+        kind, order_id, cl_ord_id = sent
+        text = reason(reject) or 'session_reject'
+        if kind == 'order':
+            self.orders.pop(order_id, None)
+            return format_message('reject', id=order_id, reason=text)
+        if kind == 'replace':
+            self.platform_ids.pop(cl_ord_id, None)
+            self.replaces.pop(cl_ord_id, None)
+        return format_message('cancelreject', id=order_id, reason=text, to=1 if kind == 'cancel' else 2)
+
+    def from_fix(self, report):
+        msg_type = report.msg_type
+        if msg_type == REJECT:
+            return self.from_session_reject(report)
+        if msg_type == ORDER_CANCEL_REJECT:
+            self.platform_ids.pop(report.get_str(CL_ORD_ID), None)
+            self.replaces.pop(report.get_str(CL_ORD_ID), None)
+            return format_message('cancelreject', id=self.platform_id(report.get_str(ORIG_CL_ORD_ID)),
+                                  reason=reason(report), to=report.get_str(CXL_REJ_RESPONSE_TO))
+        if msg_type != EXECUTION_REPORT:
+            logging.warning(f'{self.relay.name}: unhandled FIX message {report}')
+            return None
+        kind = EXEC_TYPE_KINDS.get(report.get(EXEC_TYPE))
+        cl_ord_id = report.get_str(CL_ORD_ID)
+        if kind == 'cancelled':
+            cl_ord_id = report.get_str(ORIG_CL_ORD_ID, cl_ord_id)
+        order_id = self.platform_id(cl_ord_id)
+        order = self.orders.get(order_id)
+        if kind == 'replaced' and order is not None:
+            if order[4] != order_id:
+                self.platform_ids.pop(order[4], None)
+            order[2:] = *self.replaces.pop(cl_ord_id, order[2:4]), cl_ord_id
+            return format_message('replaced', id=order_id, leaves=report.get_int(LEAVES_QTY))
+        if report.get(ORD_STATUS) in TERMINAL_STATUSES or report.get(LEAVES_QTY) == b'0':
+            if order is not None:
+                self.platform_ids.pop(order[4], None)
+            self.orders.pop(order_id, None)
+        if kind == 'fill':
+            return format_message('fill', id=order_id, sym=report.get_str(SYMBOL), qty=report.get_int(LAST_QTY),
+                                  px=report.get_str(LAST_PX))
+        if kind == 'reject':
+            return format_message('reject', id=order_id, reason=reason(report))
+        if kind is None:
+            logging.debug(f'{self.relay.name}: ignoring execution report {report}')
+            return None
+        return format_message(kind, id=order_id)
+
+    def platform_id(self, cl_ord_id):
+        return self.platform_ids.get(cl_ord_id, cl_ord_id)
+
+
+class FixEngine(Relay):
+    session_class = FixUpstreamSession
+
+    def __init__(self, *args, store_dir=STORE_DIR, heartbeat_interval=30, fsync='interval',
+                 fsync_interval=FSYNC_INTERVAL, dictionary=DICTIONARY, **kwargs):
+        self.dictionary = load_dictionary(dictionary) if dictionary else None
+        self.store_dir = store_dir
+        self.heartbeat_interval = heartbeat_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        super().__init__(*args, **kwargs)
+
+    async def run_session_timers(self):
+        while True:
+            await asyncio.sleep(TIMER_INTERVAL)
+            for upstream in self.upstreams:
+                if not upstream.session.check_timers():
+                    if upstream.writer is not None:
+                        upstream.writer.close()
+                    continue
+                upstream.flush()
+
+    async def serve_forever(self):
+        asyncio.create_task(self.run_session_timers())
+        await super().serve_forever()
+
+    def stats(self):
+        stats = super().stats()
+        stats['fix_sessions'] = [dict(upstream.session.stats, sender=upstream.session.sender,
+                                      next_in=upstream.session.next_in, next_out=upstream.session.next_out,
+                                      state=upstream.session.state) for upstream in self.upstreams]
+        return stats
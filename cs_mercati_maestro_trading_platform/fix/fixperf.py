@@ -0,0 +1,337 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Shared platform modules live one directory up
+FIX_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(FIX_DIR)
+sys.path.insert(0, BASE_DIR)
+import fixbench
+from fixcodec import CL_ORD_ID, NEW_ORDER_SINGLE, ORDER_QTY, PRICE, SYMBOL
+from fixsession import FixSession, peek_sender
+from fixstore import MessageStore
+from framing import FrameParser, encode_frame, encode_frames
+from messages import format_message, format_order
+from relaycore import message_id, message_kind
+
+"""
+FIX Engine Performance Suite
+----------------------------
+Starts fix/fix.py on loopback between a stub client and a stub counterparty (a FIX acceptor that
+fills every NewOrderSingle at once), and measures:
+
+- codec: fixbench.py's encode, parse and store rates, in messages/sec.
+- latency: order -> fill round trips through the engine, one at a time (percentiles in us).
+- saturation: orders sent open loop at rising rates; achieved fill rate, latency and rejects at
+  each step, until the engine falls behind the offered rate.
+- memory: engine RSS per FIX session (1 vs --sessions sessions) and per client connection.
+
+Results are written as JSON (--output) with the commit and machine they were measured on, so
+runs can be compared across versions. Each run uses its own temporary directory for the engine's
+logs and message stores.
+
+Usage:
+    python3 fixperf.py --output fixperf.json
+"""
+
+HOST = 'localhost'
+FIX_APP = os.path.join(FIX_DIR, 'fix.py')
+STARTUP_TIMEOUT = 10.0  # Seconds for the engine to accept and fill a first order
+DRAIN_TIMEOUT = 3.0  # Seconds to wait for answers after a saturation step
+SATURATED = 0.9  # Achieved / offered rate below which the engine is saturated
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def summarize(latencies):
+    """Latency percentiles in microseconds."""
+    if not latencies:
+        return {'count': 0}
+    latencies = sorted(latencies)
+    summary = {'count': len(latencies), 'mean_us': round(sum(latencies) / len(latencies) * 1e6, 1)}
+    for p in PERCENTILES:
+        summary[f'p{p}_us'] = round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1e6, 1)
+    summary['max_us'] = round(latencies[-1] * 1e6, 1)
+    return summary
+
+
+# Stub counterparty
+
+def run_counterparty(port, store_dir):
+    """Stub Market Simulator: a FIX acceptor that fills every NewOrderSingle in full."""
+    listener = socket.create_server((HOST, port))
+    while True:
+        conn, _ = listener.accept()
+        threading.Thread(target=serve_counterparty, args=(conn, store_dir), daemon=True).start()
+
+
+def serve_counterparty(conn, store_dir):
+    data = b''
+    with conn:
+        while (sender := peek_sender(data)) is None:
+            more = conn.recv(65536)
+            if not more:
+                return
+            data += more
+        session = FixSession('MKTSIM', sender, MessageStore(store_dir, f'MKTSIM-{sender}'))
+        session.connected(initiator=False)
+        order_ids = itertools.count(1)
+        while data:
+            for message in session.on_data(data):
+                if message.msg_type != NEW_ORDER_SINGLE:
+                    continue
+                order_id = f'S{next(order_ids)}'
+                quantity = message.get_int(ORDER_QTY)
+                price = message.get_str(PRICE, '0')
+                cl_ord_id, symbol = message.get(CL_ORD_ID), message.get(SYMBOL)
+                session.execution_report(order_id, cl_ord_id, order_id + '-0', b'0', b'0', symbol, 'buy',
+                                         quantity, 0)
+                session.execution_report(order_id, cl_ord_id, order_id + '-1', b'F', b'2', symbol, 'buy', 0,
+                                         quantity, price, last_qty=quantity, last_px=price)
+            output = session.take_output()
+            if output:
+                conn.sendall(output)
+            if session.logged_out:
+                return
+            data = conn.recv(65536)
+
+
+# Engine under test
+
+class Engine:
+    """fix.py in a subprocess, with a stub counterparty process upstream of it."""
+
+    def __init__(self, directory, sessions=4, shed_policy='block'):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.port, self.sim_port = free_port(), free_port()
+        self.counterparty = multiprocessing.Process(target=run_counterparty, daemon=True,
+                                                    args=(self.sim_port, os.path.join(directory, 'stub')))
+        self.counterparty.start()
+        self.process = subprocess.Popen([sys.executable, FIX_APP, '--port', str(self.port),
+                                         '--sim-port', str(self.sim_port), '--sessions', str(sessions),
+                                         '--shed-policy', shed_policy], cwd=directory)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                client = OrderClient(self.port, 'warmup')
+                break
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise
+                time.sleep(0.05)
+        with client:
+            client.sock.settimeout(STARTUP_TIMEOUT)
+            client.round_trip()
+
+    def rss_kb(self):
+        with open(f'/proc/{self.process.pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+        return None
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+        self.counterparty.terminate()
+        self.counterparty.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class OrderClient:
+    """A trader's order session to the engine: framed platform messages, as TradingClient sends them."""
+
+    def __init__(self, port, trader):
+        self.sock = socket.create_connection((HOST, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.sendall(encode_frame(format_message('logon', trader=trader)))
+        self.trader = trader
+        self.order_ids = itertools.count(1)
+        self.parser = FrameParser()
+
+    def order(self):
+        """A new order ID and its encoded message."""
+        order_id = f'{self.trader}-{next(self.order_ids)}'
+        return order_id, format_order('red', 'buy', 10, 1.5, order_id=order_id)
+
+    def read(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise ConnectionError('engine closed the order session')
+        return self.parser.feed(data)
+
+    def round_trip(self):
+        """Send one order and wait for its fill. Returns the latency in seconds."""
+        order_id, message = self.order()
+        order_id = order_id.encode('utf-8')
+        started = time.perf_counter()
+        self.sock.sendall(encode_frame(message))
+        while True:
+            for reply in self.read():
+                if message_kind(reply) == b'fill' and message_id(reply) == order_id:
+                    return time.perf_counter() - started
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Measurements
+
+def measure_latency(engine, count):
+    with OrderClient(engine.port, 'latency') as client:
+        for _ in range(min(count, 100)):
+            client.round_trip()  # warm up
+        return summarize([client.round_trip() for _ in range(count)])
+
+
+def saturation_step(engine, rate, seconds):
+    """Offer orders at rate/s for seconds, open loop. Returns what came back."""
+    sent_at = {}
+    latencies = []
+    replies = {'rejects': 0, 'last_fill': None}
+    with OrderClient(engine.port, f'load{rate}') as client:
+
+        def receive():
+            try:
+                while True:
+                    for reply in client.read():
+                        kind = message_kind(reply)
+                        order_id = (message_id(reply) or b'').decode('utf-8')
+                        if kind == b'fill' and order_id in sent_at:
+                            now = time.perf_counter()
+                            latencies.append(now - sent_at.pop(order_id))
+                            replies['last_fill'] = now
+                        elif kind == b'reject':
+                            sent_at.pop(order_id, None)
+                            replies['rejects'] += 1
+            except OSError:
+                pass
+
+        receiver = threading.Thread(target=receive, daemon=True)
+        receiver.start()
+        started = time.perf_counter()
+        sent = 0
+        while (elapsed := time.perf_counter() - started) < seconds:
+            due = min(int(rate * elapsed) + 1, int(rate * seconds)) - sent
+            if due > 0:
+                batch = [client.order() for _ in range(due)]
+                now = time.perf_counter()
+                for order_id, _ in batch:
+                    sent_at[order_id] = now
+                client.sock.sendall(encode_frames([message for _, message in batch]))
+                sent += due
+            time.sleep(0.001)
+        deadline = time.perf_counter() + DRAIN_TIMEOUT
+        while sent_at and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        client.sock.shutdown(socket.SHUT_RDWR)
+        receiver.join()
+    fill_seconds = (replies['last_fill'] or started + seconds) - started
+    achieved = len(latencies) / max(fill_seconds, seconds)
+    return {'offered_per_s': rate, 'sent': sent, 'filled': len(latencies), 'rejected': replies['rejects'],
+            'unanswered': len(sent_at), 'achieved_per_s': round(achieved), 'latency': summarize(latencies)}
+
+
+def measure_saturation(engine, rates, seconds):
+    steps = []
+    for rate in rates:
+        step = saturation_step(engine, rate, seconds)
+        steps.append(step)
+        print(f"  offered {rate:>7,}/s  achieved {step['achieved_per_s']:>7,}/s  "
+              f"p99 {step['latency'].get('p99_us', 0) / 1000:8.2f} ms  rejected {step['rejected']}")
+        if step['achieved_per_s'] < rate * SATURATED:
+            break  # saturated: higher rates only queue up more
+    return steps
+
+
+def measure_memory(directory, sessions, clients):
+    with Engine(os.path.join(directory, 'memory-1'), sessions=1) as engine:
+        time.sleep(1)
+        single = engine.rss_kb()
+    with Engine(os.path.join(directory, f'memory-{sessions}'), sessions=sessions) as engine:
+        time.sleep(1)
+        several = engine.rss_kb()
+        connections = [OrderClient(engine.port, f'mem{i}') for i in range(clients)]
+        connections[-1].round_trip()  # all logons ahead of it have been read
+        time.sleep(0.5)
+        connected = engine.rss_kb()
+        for connection in connections:
+            connection.close()
+    return {'rss_kb_1_session': single, f'rss_kb_{sessions}_sessions': several,
+            'kb_per_session': round((several - single) / max(sessions - 1, 1), 1),
+            f'rss_kb_{clients}_clients': connected, 'kb_per_client': round((connected - several) / max(clients, 1), 1)}
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=FIX_DIR, capture_output=True,
+                                text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FIX Engine performance suite")
+    parser.add_argument("--output", default=f'fixperf-{time.strftime("%Y%m%d-%H%M%S")}.json', help="JSON results file")
+    parser.add_argument("--codec-count", type=int, default=100000, help="messages per codec case")
+    parser.add_argument("--round-trips", type=int, default=2000, help="orders for the latency measurement")
+    parser.add_argument("--rates", default="500,1000,2000,5000,10000,20000", help="saturation steps, orders/sec")
+    parser.add_argument("--step-seconds", type=float, default=2.0, help="duration of each saturation step")
+    parser.add_argument("--sessions", type=int, default=16, help="FIX sessions for the memory measurement")
+    parser.add_argument("--clients", type=int, default=200, help="client connections for the memory measurement")
+    args = parser.parse_args()
+    results = {'meta': {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                        'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count(), 'args': vars(args)}}
+    directory = tempfile.mkdtemp(prefix='fixperf-')
+    try:
+        print('codec')
+        results['codec'] = fixbench.run_all(args.codec_count)
+        with Engine(os.path.join(directory, 'engine')) as engine:
+            print('latency')
+            results['latency'] = measure_latency(engine, args.round_trips)
+            print(f"  {results['latency']}")
+            print('saturation')
+            results['saturation'] = measure_saturation(engine, [int(r) for r in args.rates.split(',')],
+                                                       args.step_seconds)
+        print('memory')
+        results['memory'] = measure_memory(directory, args.sessions, args.clients)
+        print(f"  {results['memory']}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import logging
+import time
+
+from fixcodec import (BEGIN_SEQ_NO, CHECKSUM_SIZE, END_SEQ_NO, ENCRYPT_METHOD, GAP_FILL_FLAG, HEART_BT_INT,
+                      HEARTBEAT, LOGON, LOGOUT, NEW_SEQ_NO, ORIG_SENDING_TIME, POSS_DUP_FLAG, REF_MSG_TYPE,
+                      REF_SEQ_NUM, REF_TAG_ID, REJECT, RESEND_REQUEST, RESET_SEQ_NUM_FLAG, SENDER_COMP_ID,
+                      SEQUENCE_RESET, SESSION_REJECT_REASON, SOH, TEST_REQ_ID, TEST_REQUEST, TEXT, FixEncoder,
+                      FixError, FixMessage, FixParser)
+
+"""
+FIX Session Layer
+-----------------
+Logon, MsgSeqNum tracking, Heartbeat/TestRequest and gap recovery for one FIX 4.4 session. It
+does no I/O: the caller feeds received bytes to on_data(), writes whatever take_output() returns,
+and calls check_timers() every second or so from its own loop (an asyncio task in the FIX
+Engine, the receive timeout in the Market Simulator). No thread or timer is created per session.
+
+- Every outbound message is stored (see fixstore.py) under its MsgSeqNum before it is written.
+  The first connection of a new day rolls the store over, and the initiator's Logon then carries
+  ResetSeqNumFlag so the acceptor starts its new sequence as well.
+- An inbound MsgSeqNum above the expected one triggers a ResendRequest for the gap; messages that
+  arrive ahead of the gap are held and delivered in order once it is filled. One below, without
+  PossDupFlag, is fatal and the session logs out.
+- A ResendRequest is served from the store: application messages again with PossDupFlag=Y and
+  OrigSendingTime, administrative ones (and anything not stored) as SequenceReset-GapFill.
+- Given a DataDictionary (see fixdict.py), application messages that fail validation are answered
+  with a session Reject (RefSeqNum, RefTagID, SessionRejectReason) instead of being delivered.
+  A session Reject from the peer is delivered with the application messages, so the application
+  can fail the message its RefSeqNum refers to.
+- No traffic for HeartBtInt sends a Heartbeat; nothing received for HeartBtInt plus a grace
+  period sends a TestRequest, and no answer within another HeartBtInt drops the session.
+"""
+
+HEARTBEAT_INTERVAL = 30  # Seconds (HeartBtInt)
+GRACE = 0.2  # Fraction of HeartBtInt to wait beyond it before a TestRequest
+ADMIN_TYPES = {HEARTBEAT, TEST_REQUEST, RESEND_REQUEST, REJECT, SEQUENCE_RESET, LOGOUT, LOGON}
+
+# Session states
+DISCONNECTED = 'disconnected'
+LOGON_SENT = 'logon-sent'
+ACTIVE = 'active'
+LOGOUT_SENT = 'logout-sent'
+
+
+def split_resend(data):
+    """Return (SendingTime, body after the standard header) of a stored message, for resending it."""
+    start = data.index(b'\x0152=') + 4
+    end = data.index(SOH, start)
+    return data[start:end], data[end + 1:-CHECKSUM_SIZE]
+
+
+class FixSession:
+    def __init__(self, sender, target, store, heartbeat_interval=HEARTBEAT_INTERVAL, clock=time.monotonic,
+                 dictionary=None):
+        self.sender = sender
+        self.target = target
+        self.store = store
+        self.heartbeat_interval = heartbeat_interval
+        self.clock = clock
+        self.dictionary = dictionary
+        self.encoder = FixEncoder(sender, target)
+        self.parser = FixParser()
+        self.state = DISCONNECTED
+        self.initiator = False
+        self.logged_out = False  # the Logout exchange completed: the connection can be closed
+        self.next_in = store.next_in
+        self.next_out = store.next_out
+        self.held = {}  # MsgSeqNum -> message received ahead of a gap
+        self.resend_until = 0  # last MsgSeqNum of the outstanding ResendRequest, 0 if none
+        self.output = []
+        self.last_sent = self.last_received = clock()
+        self.test_request = None  # (TestReqID, sent at) while waiting for the answer
+        self.stats = {'sent': 0, 'received': 0, 'resend_requests': 0, 'resent': 0, 'gap_fills': 0, 'rejected': 0}
+
+    @property
+    def active(self):
+        return self.state == ACTIVE
+
+    def connected(self, initiator):
+        """A new connection is up. The initiator sends Logon; the acceptor waits for one."""
+        self.parser = FixParser()
+        self.output.clear()
+        self.held.clear()
+        self.resend_until = 0
+        self.test_request = None
+        self.logged_out = False
+        self.initiator = initiator
+        self.last_sent = self.last_received = self.clock()
+        self.state = DISCONNECTED
+        if self.store.rollover_due():
+            self.store.roll_over()
+            self.next_in, self.next_out = self.store.next_in, self.store.next_out
+        if initiator:
+            self.send_logon()
+
+    def disconnected(self):
+        if self.state != DISCONNECTED:
+            logging.info(f'FIX session {self.sender}->{self.target} disconnected at in={self.next_in} out={self.next_out}')
+        self.state = DISCONNECTED
+        self.save_seqnums()
+
+    def send_logon(self):
+        fields = [(ENCRYPT_METHOD, b'0'), (HEART_BT_INT, self.heartbeat_interval)]
+        if self.initiator and self.next_out == 1:
+            fields.append((RESET_SEQ_NUM_FLAG, b'Y'))  # a new day or a new store: the peer starts over too
+        self.send(LOGON, fields)
+        self.state = LOGON_SENT if self.initiator else ACTIVE
+
+    def logout(self, text=None):
+        self.send(LOGOUT, [(TEXT, text)] if text else ())
+        self.state = LOGOUT_SENT
+
+    # Sending
+
+    def send(self, msg_type, fields=(), body=b''):
+        """Encode, store and queue a message under the next MsgSeqNum. Returns the encoded bytes."""
+        return self.queue(self.encoder.encode(msg_type, self.next_out, fields, body))
+
+    def queue(self, data):
+        """Store and queue a message the encoder built with MsgSeqNum next_out."""
+        self.store.append(self.next_out, data)
+        self.next_out += 1
+        self.save_seqnums()
+        self.output.append(data)
+        self.last_sent = self.clock()
+        self.stats['sent'] += 1
+        return data
+
+    def new_order_single(self, *args, **kwargs):
+        return self.queue(self.encoder.new_order_single(self.next_out, *args, **kwargs))
+
+    def execution_report(self, *args, **kwargs):
+        return self.queue(self.encoder.execution_report(self.next_out, *args, **kwargs))
+
+    def take_output(self):
+        """Everything queued for the wire since the last call, as one buffer."""
+        data = b''.join(self.output)
+        self.output.clear()
+        return data
+
+    def save_seqnums(self):
+        self.store.set_seqnums(self.next_in, self.next_out)
+
+    # Receiving
+
+    def on_data(self, data):
+        """Process received bytes. Returns the application messages, in MsgSeqNum order."""
+        application = []
+        for message in self.parser.feed(data):
+            self.last_received = self.clock()
+            self.test_request = None
+            self.stats['received'] += 1
+            self.on_message(message, application)
+        return application
+
+    def on_message(self, message, application):
+        msg_type = message.msg_type
+        seq = message.seq_num
+        if seq is None:
+            raise FixError(f'message without MsgSeqNum: {message}')
+        if msg_type == SEQUENCE_RESET:
+            self.on_sequence_reset(message, application)
+            return
+        if msg_type == LOGON:
+            self.on_logon(message)
+        elif msg_type == RESEND_REQUEST and seq >= self.next_in:
+            # Served even when out of sequence, or two sides that both have gaps would deadlock
+            self.on_resend_request(message)
+        if seq > self.next_in:
+            if not self.resend_until:
+                self.request_resend(self.next_in, seq - 1)
+            self.held[seq] = message
+            return
+        if seq < self.next_in:
+            if message.get(POSS_DUP_FLAG) != b'Y' and msg_type != LOGON:
+                logging.error(f'FIX session {self.sender}->{self.target}: MsgSeqNum {seq} too low, '
+                              f'expected {self.next_in}')
+                self.logout(f'MsgSeqNum too low, expecting {self.next_in} but received {seq}')
+            return
+        self.deliver(message, application)
+        self.drain(application)
+
+    def drain(self, application):
+        """Deliver held messages that are now in sequence."""
+        while self.next_in in self.held:
+            held = self.held.pop(self.next_in)
+            if held.msg_type == SEQUENCE_RESET:
+                self.on_sequence_reset(held, application)
+                return
+            self.deliver(held, application)
+        if self.resend_until and self.next_in > self.resend_until:
+            self.resend_until = 0
+
+    def deliver(self, message, application):
+        """Process an in-sequence message."""
+        self.next_in += 1
+        self.save_seqnums()
+        msg_type = message.msg_type
+        if msg_type in (LOGON, RESEND_REQUEST, HEARTBEAT):
+            return  # handled on arrival, or nothing to do
+        if msg_type == TEST_REQUEST:
+            self.send(HEARTBEAT, [(TEST_REQ_ID, message.get(TEST_REQ_ID, b''))])
+        elif msg_type == LOGOUT:
+            if self.state != LOGOUT_SENT:
+                self.logout()
+            self.state = DISCONNECTED
+            self.logged_out = True
+        elif msg_type == REJECT:
+            logging.error(f'FIX session {self.sender}->{self.target}: session reject of '
+                          f'{message.get(REF_SEQ_NUM)}: {message.get(TEXT)}')
+            application.append(message)  # the application's message it refers to went nowhere
+        else:
+            error = self.dictionary.validate(message) if self.dictionary is not None else None
+            if error is None:
+                application.append(message)
+            else:
+                self.reject(message, *error)
+
+    def reject(self, message, reason, tag, text):
+        logging.warning(f'FIX session {self.sender}->{self.target}: rejecting {message.seq_num}: {text}')
+        self.stats['rejected'] += 1
+        fields = [(REF_SEQ_NUM, message.seq_num), (REF_TAG_ID, tag), (REF_MSG_TYPE, message.msg_type),
+                  (SESSION_REJECT_REASON, reason), (TEXT, text)]
+        self.send(REJECT, [(tag, value) for tag, value in fields if value is not None])
+
+    def on_logon(self, message):
+        if message.get(RESET_SEQ_NUM_FLAG) == b'Y' and not self.initiator:
+            self.store.reset()
+            self.next_in, self.next_out = message.seq_num, 1
+        heartbeat_interval = message.get_int(HEART_BT_INT)
+        if heartbeat_interval:
+            self.heartbeat_interval = heartbeat_interval
+        if self.state == LOGON_SENT:
+            self.state = ACTIVE
+        elif not self.initiator:
+            self.send_logon()
+        logging.info(f'FIX session {self.sender}->{self.target} logged on: next in {self.next_in} '
+                     f'(peer sent {message.seq_num}), next out {self.next_out}')
+
+    def on_sequence_reset(self, message, application):
+        new_seq = message.get_int(NEW_SEQ_NO)
+        if message.get(GAP_FILL_FLAG) == b'Y' and message.seq_num != self.next_in:
+            if message.seq_num > self.next_in:
+                self.held[message.seq_num] = message  # a gap fill for a later gap: wait for ours
+            return
+        if new_seq > self.next_in:
+            self.stats['gap_fills'] += 1
+            self.next_in = new_seq
+            self.save_seqnums()
+        for seq in [seq for seq in self.held if seq < self.next_in]:
+            del self.held[seq]
+        self.drain(application)
+
+    def request_resend(self, begin, end):
+        logging.warning(f'FIX session {self.sender}->{self.target}: gap, resend {begin}..{end}')
+        self.stats['resend_requests'] += 1
+        self.resend_until = end
+        self.send(RESEND_REQUEST, [(BEGIN_SEQ_NO, begin), (END_SEQ_NO, 0)])
+
+    def on_resend_request(self, message):
+        begin = message.get_int(BEGIN_SEQ_NO, 1)
+        end = message.get_int(END_SEQ_NO, 0)
+        last = self.next_out - 1 if not end else min(end, self.next_out - 1)
+        logging.info(f'FIX session {self.sender}->{self.target}: resending {begin}..{last}')
+        gap_start = None
+        for seq in range(begin, last + 1):
+            data = self.store.get(seq)
+            msg_type = FixMessage(data).msg_type if data is not None else None
+            if data is None or msg_type in ADMIN_TYPES:
+                if gap_start is None:
+                    gap_start = seq
+                continue
+            if gap_start is not None:
+                self.gap_fill(gap_start, seq)
+                gap_start = None
+            sending_time, body = split_resend(data)
+            self.output.append(self.encoder.encode(msg_type, seq, [(POSS_DUP_FLAG, b'Y'),
+                                                                   (ORIG_SENDING_TIME, sending_time)], body))
+            self.stats['resent'] += 1
+        if gap_start is not None:
+            self.gap_fill(gap_start, last + 1)
+        self.last_sent = self.clock()
+
+    def gap_fill(self, seq, new_seq):
+        self.output.append(self.encoder.encode(SEQUENCE_RESET, seq, [(POSS_DUP_FLAG, b'Y'), (GAP_FILL_FLAG, b'Y'),
+                                                                     (NEW_SEQ_NO, new_seq)]))
+
+    # Timers
+
+    def check_timers(self, now=None):
+        """Send Heartbeats/TestRequests as due. Returns False when the peer stopped answering."""
+        if self.state not in (ACTIVE, LOGON_SENT):
+            return True
+        now = self.clock() if now is None else now
+        interval = self.heartbeat_interval
+        if self.state == LOGON_SENT:
+            if now - self.last_sent >= interval:
+                logging.error(f'FIX session {self.sender}->{self.target}: no Logon response')
+                return False
+            return True
+        if self.test_request is not None:
+            if now - self.test_request[1] >= interval:
+                logging.error(f'FIX session {self.sender}->{self.target}: TestRequest unanswered, dropping')
+                return False
+        elif now - self.last_received >= interval * (1 + GRACE):
+            test_id = f'TEST{int(now)}'
+            self.test_request = (test_id, now)
+            self.send(TEST_REQUEST, [(TEST_REQ_ID, test_id)])
+        if now - self.last_sent >= interval:
+            self.send(HEARTBEAT)
+        return True
+
+
+def peek_sender(data):
+    """SenderCompID of the first complete message in data (an acceptor's first read), or None."""
+    messages = FixParser().feed(data)
+    return messages[0].get_str(SENDER_COMP_ID) if messages else None
@@ -0,0 +1,227 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+"""
+FIX Message Store
+-----------------
+Persistent outbound messages and sequence numbers of one FIX session, so a reconnect picks up
+where the session left off: the counterparty only asks for the gap, never a full-day replay.
+
+Files are per session and per day, <name>-<YYYYMMDD>.*, both memory-mapped and grown in chunks:
+
+- .data: append-only records of (MsgSeqNum, length) + the encoded message.
+- .index: a header with the next inbound and next outbound MsgSeqNum, then one fixed-width slot
+  per MsgSeqNum holding the offset of its record in .data, so get(seq) is one slot read and one
+  slice however long the day gets.
+
+append() and set_seqnums() only copy into the mappings, so no system call is made per message.
+When the pages reach the disk depends on the fsync policy:
+
+- 'always': msync the record's pages and the index on every append (durable, slowest).
+- 'interval': a background thread msyncs whatever was written every fsync_interval ms.
+- 'os': leave write-back to the kernel (a process crash loses nothing, a machine crash may).
+
+A new day starts new files with both sequence numbers back to 1 (see FixSession.connected);
+earlier days are left in place for audit.
+"""
+
+FSYNC_POLICIES = ('always', 'interval', 'os')
+FSYNC_INTERVAL = 100  # Milliseconds between background syncs for the 'interval' policy
+RECORD = struct.Struct('>II')  # MsgSeqNum, length
+HEADER = struct.Struct('>QQ')  # next inbound, next outbound
+SLOT = struct.Struct('>Q')  # offset of the record + 1, 0 if the MsgSeqNum was not stored
+DATA_CHUNK = 16 << 20  # Bytes the data file grows by
+INDEX_CHUNK = 1 << 16  # Slots the index file grows by
+
+
+def trading_day(now=None):
+    return time.strftime('%Y%m%d', time.localtime(now))
+
+
+def page_start(offset):
+    return offset - offset % mmap.ALLOCATIONGRANULARITY
+
+
+class MappedFile:
+    """A file mapped in full, grown (and remapped) in chunks of at least `chunk` bytes."""
+
+    def __init__(self, path, chunk):
+        self.path = path
+        self.chunk = chunk
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self.fd).st_size
+        if size == 0:
+            size = chunk
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+
+    def __len__(self):
+        return len(self.map)
+
+    def ensure(self, size):
+        """Grow the file so that size bytes are mapped."""
+        if size <= len(self.map):
+            return
+        new_size = len(self.map)
+        while new_size < size:
+            new_size += self.chunk
+        self.map.close()
+        os.ftruncate(self.fd, new_size)
+        self.map = mmap.mmap(self.fd, new_size)
+
+    def sync(self, start=0, end=None):
+        end = len(self.map) if end is None else min(end, len(self.map))
+        start = page_start(start)
+        if end > start:
+            self.map.flush(start, end - start)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+class MessageStore:
+    def __init__(self, directory, name, fsync='os', fsync_interval=FSYNC_INTERVAL):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'fsync policy must be one of {FSYNC_POLICIES}, not {fsync!r}')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = name
+        self.fsync = fsync
+        self.lock = threading.RLock()  # held while remapping and while the background thread syncs
+        self.data = self.index = None
+        self.open_day(trading_day())
+        self.syncer = None
+        if fsync == 'interval':
+            self.stopped = threading.Event()
+            self.syncer = threading.Thread(target=self.sync_loop, args=(fsync_interval / 1000,), daemon=True,
+                                           name=f'fixstore-{name}')
+            self.syncer.start()
+
+    def open_day(self, day):
+        self.day = day
+        self.path = os.path.join(self.directory, f'{self.name}-{day}')
+        self.data = MappedFile(self.path + '.data', DATA_CHUNK)
+        self.index = MappedFile(self.path + '.index', HEADER.size + INDEX_CHUNK * SLOT.size)
+        self.next_in, self.next_out = HEADER.unpack_from(self.index.map, 0)
+        if not self.next_in:
+            self.set_seqnums(1, 1)
+        self.load()
+        self.synced_data, self.synced_seq = self.end, 1
+
+    def load(self):
+        """Find the end of the data and re-index records written after the index was last updated."""
+        data = self.data.map
+        offset = 0
+        last_seq = 0
+        while offset + RECORD.size <= len(data):
+            seq, length = RECORD.unpack_from(data, offset)
+            if not seq:
+                break
+            if offset + RECORD.size + length > len(data):
+                logging.warning(f'{self.path}: dropping a torn record at offset {offset}')
+                data[offset:offset + RECORD.size] = bytes(RECORD.size)
+                break
+            self.set_slot(seq, offset)
+            last_seq = max(last_seq, seq)
+            offset += RECORD.size + length
+        self.end = offset
+        if last_seq >= self.next_out:
+            self.set_seqnums(self.next_in, last_seq + 1)
+
+    def slot_offset(self, seq):
+        return HEADER.size + (seq - 1) * SLOT.size
+
+    def set_slot(self, seq, offset):
+        position = self.slot_offset(seq)
+        if position + SLOT.size > len(self.index):
+            with self.lock:
+                self.index.ensure(position + SLOT.size)
+        SLOT.pack_into(self.index.map, position, offset + 1)
+
+    def append(self, seq, data):
+        offset = self.end
+        end = offset + RECORD.size + len(data)
+        if end > len(self.data):
+            with self.lock:
+                self.data.ensure(end)
+        mapped = self.data.map
+        mapped[offset + RECORD.size:end] = data
+        RECORD.pack_into(mapped, offset, seq, len(data))  # header last: a torn append reads as the end
+        self.end = end
+        self.set_slot(seq, offset)
+        if self.fsync == 'always':
+            self.data.sync(offset, end)
+            self.index.sync(self.slot_offset(seq), self.slot_offset(seq + 1))
+
+    def get(self, seq):
+        """The message sent as seq, or None if it was not stored."""
+        position = self.slot_offset(seq)
+        if seq < 1 or position + SLOT.size > len(self.index):
+            return None
+        offset = SLOT.unpack_from(self.index.map, position)[0] - 1
+        if offset < 0:
+            return None
+        _, length = RECORD.unpack_from(self.data.map, offset)
+        start = offset + RECORD.size
+        return self.data.map[start:start + length]
+
+    def set_seqnums(self, next_in, next_out):
+        self.next_in, self.next_out = next_in, next_out
+        HEADER.pack_into(self.index.map, 0, next_in, next_out)
+        if self.fsync == 'always':
+            self.index.sync(0, HEADER.size)
+
+    def sync(self):
+        """Write back everything appended since the last sync."""
+        with self.lock:
+            end, next_out = self.end, self.next_out
+            self.data.sync(self.synced_data, end)
+            self.index.sync(0, HEADER.size)
+            self.index.sync(self.slot_offset(self.synced_seq), self.slot_offset(next_out))
+            self.synced_data, self.synced_seq = end, next_out
+
+    def sync_loop(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.sync()
+            except (OSError, ValueError) as e:  # ValueError: the map was closed under us
+                logging.error(f'{self.path}: background sync failed: {e}')
+
+    def rollover_due(self):
+        return trading_day() != self.day
+
+    def roll_over(self):
+        """Close the current day's files and start the files of today with new sequence numbers."""
+        self.close_files()
+        with self.lock:
+            self.open_day(trading_day())
+        logging.info(f'{self.path}: new store for {self.day}')
+
+    def reset(self):
+        """Start a new sequence (both directions back to 1) and drop today's stored messages."""
+        self.close_files()
+        day = trading_day()
+        for suffix in ('.data', '.index'):
+            path = os.path.join(self.directory, f'{self.name}-{day}{suffix}')
+            if os.path.exists(path):
+                os.remove(path)
+        with self.lock:
+            self.open_day(day)
+
+    def close_files(self):
+        if self.fsync != 'os':
+            self.sync()
+        with self.lock:
+            self.data.close()
+            self.index.close()
+
+    def close(self):
+        if self.syncer is not None:
+            self.stopped.set()
+            self.syncer.join()
+        self.close_files()
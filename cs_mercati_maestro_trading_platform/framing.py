@@ -0,0 +1,63 @@
+import struct
+
+"""
+Message Framing
+---------------
+Length-prefixed framing for every TCP hop of the order path (Trading App -> Order Router ->
+FIX Engine -> Market Simulator and back). Each frame is a 4-byte big-endian payload length
+followed by the payload, so messages survive TCP merging or splitting them.
+
+Senders batch with encode_frames() and write many frames in one sendall; receivers feed
+whatever recv() returned into a FrameParser and get back only complete payloads.
+"""
+
+HEADER = struct.Struct('>I')
+HEADER_SIZE = HEADER.size
+MAX_FRAME_SIZE = 1 << 20  # Anything bigger is a corrupt or hostile stream
+
+
+class FrameError(ValueError):
+    pass
+
+
+def encode_frame(payload):
+    """Return one frame for payload (bytes or str)."""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_frames(payloads):
+    """Return many frames as one buffer, ready for a single sendall."""
+    return b''.join([encode_frame(payload) for payload in payloads])
+
+
+class FrameParser:
+    """Streaming parser: feed() raw bytes, get back the payloads of all frames completed so far."""
+
+    def __init__(self, max_size=MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.max_size = max_size
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        pos = 0
+        end = len(buffer)
+        while end - pos >= HEADER_SIZE:
+            (length,) = HEADER.unpack_from(buffer, pos)
+            if length > self.max_size:
+                raise FrameError(f'frame of {length} bytes exceeds limit of {self.max_size}')
+            stop = pos + HEADER_SIZE + length
+            if stop > end:
+                break
+            frames.append(bytes(buffer[pos + HEADER_SIZE:stop]))
+            pos = stop
+        if pos:
+            del buffer[:pos]
+        return frames
+
+    def pending(self):
+        """Number of buffered bytes belonging to an incomplete frame."""
+        return len(self.buffer)
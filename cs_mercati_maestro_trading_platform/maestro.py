@@ -1,20 +1,21 @@
-import socket
-import struct
 import logging
 import os
 import tkinter as tk
 from tkinter import messagebox
 import signal
 import sys
-import threading
 import time
 import queue
 
+from tradingclient import TradingClient
+
 """
 Trading Front End App
 ---------------------
-This application listens to the Market Data App for "blue" or "red" messages, logs received messages, 
-sends orders to the Order Router, and logs orders to a database.
+This application listens to the market data feed (quotes and trades from the Market Simulator's
+books), logs received messages, sends orders to the Order Router, and logs orders to a database.
+It is a Tk consumer of TradingClient (tradingclient.py), which owns the listener, the order session
+and the state and can be used headless.
 
 - Receiving: Multicast from 224.1.1.1 on port 5007.
 - Sending: TCP to Order Router on localhost:5008.
@@ -31,81 +32,25 @@ logging.basicConfig(filename=os.path.join(log_dir, f'trading_{time.strftime("%y%
                     level=logging.DEBUG,
                     format='%(asctime)s %(levelname)s %(message)s')
 
-# Multicast setup
-MCAST_GRP = '224.1.1.1'
-MCAST_PORT = 5007
-
-class MarketDataListener(threading.Thread):
-    def __init__(self, data_queue, update_status_callback):
-        super().__init__()
-        self.data_queue = data_queue
-        self.update_status_callback = update_status_callback
-        self.running = True
-
-        logging.debug("Initializing MarketDataListener")
-
-        # Set up the socket for receiving multicast data
-        try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.sock.bind(('', MCAST_PORT))
-            logging.info(f"Socket bound to ('', {MCAST_PORT})")
-
-            # Join the multicast group
-            mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
-            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-            logging.info(f"MarketDataListener joined multicast group {MCAST_GRP} on port {MCAST_PORT}")
-            
-            # Set socket timeout
-            self.sock.settimeout(1)  # 1 second timeout
-        except Exception as e:
-            logging.error(f"Failed to initialize MarketDataListener: {e}")
-
-    def run(self):
-        logging.debug("MarketDataListener thread started")
-        while self.running:
-            try:
-                # Receive data from the multicast group
-                data, addr = self.sock.recvfrom(1024)
-                source_ip, source_port = addr
-                message = data.decode('utf-8')
-                self.data_queue.put((message, source_ip, source_port))
-                logging.debug(f"Received market data message from {source_ip}:{source_port}: {message}")
-                self.update_status_callback("green")  # Update status light to green on successful data reception
-            except socket.timeout:
-                # This is normal, just continue
-                continue
-            except Exception as e:
-                logging.error(f"Error receiving market data message: {e}")
-                self.update_status_callback("red")  # Update status light to red on error
-                time.sleep(1)  # Avoid tight loop on persistent errors
-
-    def stop(self):
-        self.running = False
-        try:
-            self.sock.close()
-            logging.info("MarketDataListener stopped")
-        except Exception as e:
-            logging.error(f"Error closing MarketDataListener socket: {e}")
-
 def signal_handler(sig, frame):
     logging.info("Trading App interrupted and exiting gracefully.")
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
 
+ORDERS_SHOWN = 50  # Rows in the order status table
+
 class TradingApp:
-    def __init__(self, root):
+    def __init__(self, root, client):
         self.root = root
         self.root.title("Trading App")
         self.root.geometry("800x600")
-        self.data_queue = queue.Queue()
+        self.client = client
         self.status_update_queue = queue.Queue()
 
-        # Initialize the MarketDataListener
-        logging.debug("Starting MarketDataListener")
-        self.listener = MarketDataListener(self.data_queue, self.schedule_update_market_data_status)
-        self.listener.start()
+        # Market data status changes arrive on the listener thread
+        self.client.add_status_callback(self.schedule_update_market_data_status)
+        self.client.start()
 
         # Create and layout the widgets
         self.create_widgets()
@@ -114,6 +59,7 @@ class TradingApp:
         self.update_status_lights()
         self.root.after(100, self.process_status_updates)
         self.root.after(2000, self.update_market_data)
+        self.root.after(500, self.update_orders_display)
         self.check_dependencies()
 
     def create_widgets(self):
@@ -160,11 +106,14 @@ class TradingApp:
         self.market_data_display = tk.Label(self.middle_frame, text="Loading Market Data", width=30, height=5, bg="#001f3f", fg="#add8e6", font=("Arial", 18, "bold"))
         self.market_data_display.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+        # Order status table (most recent orders first)
+        self.orders_display = tk.Listbox(self.empty_frame, width=90, height=8, font=("Courier", 10))
+        self.orders_display.pack(fill=tk.BOTH, expand=True)
+
     def update_market_data(self):
         logging.debug("Updating market data display")
         try:
-            while not self.data_queue.empty():
-                message, source_ip, source_port = self.data_queue.get_nowait()
+            for message, source_ip, source_port in self.client.get_market_data():
                 logging.debug(f"Processing message: {message} from {source_ip}:{source_port}")
                 self.root.after(0, self.log_market_data, message, source_ip, source_port)
             self.root.after(1000, self.update_market_data)  # Keep checking for new data
@@ -179,19 +128,24 @@ class TradingApp:
         logging.info(log_message)
         self.market_data_display.config(text=log_message, bg="#001f3f", fg="#add8e6", font=("Arial", 18, "bold"))
 
+    def update_orders_display(self):
+        # Refresh the live order status table from the client's order state
+        try:
+            recent = list(self.client.orders.values())[-ORDERS_SHOWN:]
+            self.orders_display.delete(0, tk.END)
+            for order in reversed(recent):
+                latency = f"{order.ack_latency * 1000:.1f}ms" if order.ack_latency is not None else "-"
+                self.orders_display.insert(tk.END, f"{order}  ack {latency}")
+        except Exception as e:
+            logging.error(f"Error in update_orders_display: {e}")
+        finally:
+            self.root.after(500, self.update_orders_display)
+
     def send_order(self, color):
-        # Send an order to the Order Router via TCP
-        logging.debug(f"Preparing to send order: {color}")
+        # Send an order to the Order Router over the client's order session
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                destination_ip = 'localhost'
-                destination_port = 5008
-                logging.info(f"Connecting to Order Router at {destination_ip}:{destination_port}")
-                s.connect((destination_ip, destination_port))
-                order = f'order {color}'
-                s.sendall(order.encode('utf-8'))
-                logging.debug(f'Sent order to {destination_ip}:{destination_port}: {order}')
-                self.status_bar.config(text=f"Status: Sent order {color}")
+            order = self.client.send_order(color)
+            self.status_bar.config(text=f"Status: Sent order {order.order_id} {color}")
         except ConnectionRefusedError:
             messagebox.showerror("Error", "Order Router is down. Cannot send order.")
             logging.error("Order Router is down. Cannot send order.")
@@ -210,51 +164,10 @@ class TradingApp:
             messagebox.showerror("Error", f"Exception occurred: {e}")
 
     def check_dependencies(self):
-        logging.debug("Checking dependencies")
         # Check the status of various components and update the status lights
-        components = {
-            "OrderRouter": 5008,
-            "FIXEngine": 5009,
-            "MarketSimulator": 5010
-        }
-        for component, port in components.items():
-            status = self.ping_component(port)
+        for component, status in self.client.check_dependencies().items():
             color = "green" if status else "grey"
-            logging.debug(f"Component {component} status: {'up' if status else 'down'}")
             self.root.after(0, self.status_lights[component].configure, {'bg': color})
-        
-        # Check the status of MarketData multicast reception
-        market_data_status = self.check_market_data_multicast()
-        color = "green" if market_data_status else "grey"
-        logging.debug(f"MarketData component status: {'up' if market_data_status else 'down'}")
-        self.root.after(0, self.status_lights["MarketData"].configure, {'bg': color})
-
-    def check_market_data_multicast(self):
-        logging.debug("Checking market data multicast")
-        try:
-            # Set up the socket for receiving multicast data
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            sock.bind(('', MCAST_PORT))
-
-            # Join the multicast group
-            mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
-            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-
-            # Attempt to receive data
-            sock.settimeout(1)
-            try:
-                data, _ = sock.recvfrom(1024)
-                logging.debug("Successfully received multicast data")
-                return True
-            except socket.timeout:
-                logging.error("Failed to receive multicast data within the timeout period")
-                return False
-            finally:
-                sock.close()
-        except Exception as e:
-            logging.error(f"Error checking market data multicast: {e}")
-            return False
 
     def schedule_update_market_data_status(self, color):
         logging.debug(f"Scheduling update for Market Data status light to {color}")
@@ -278,29 +191,12 @@ class TradingApp:
             logging.error(f"Error updating market data status light: {e}")
             messagebox.showerror("Error", f"Exception occurred: {e}")
 
-    def ping_component(self, port):
-        logging.debug(f"Pinging component on port {port}")
-        # Check if a component is reachable via TCP
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                destination_ip = 'localhost'
-                logging.info(f"Trying to connect to {destination_ip}:{port}")
-                s.connect((destination_ip, port))
-            logging.debug(f"Component on port {port} is up")
-            return True
-        except ConnectionRefusedError:
-            logging.debug(f"Component on port {port} is down")
-            return False
-        except Exception as e:
-            logging.error(f"Error pinging component on port {port}: {e}")
-            return False
-
 if __name__ == "__main__":
     try:
         logging.debug("Starting TradingApp")
         root = tk.Tk()
-        app = TradingApp(root)
-        root.protocol("WM_DELETE_WINDOW", lambda: (app.listener.stop(), root.destroy()))
+        app = TradingApp(root, TradingClient())
+        root.protocol("WM_DELETE_WINDOW", lambda: (app.client.stop(), root.destroy()))
         root.mainloop()
     except Exception as e:
         logging.error(f"Exception occurred: {e}")
@@ -0,0 +1,60 @@
+"""
+Platform Messages
+-----------------
+Helpers for the text messages exchanged between the Trading App, Order Router, FIX Engine and
+Market Simulator. A message is a kind followed by key=value fields, e.g.
+
+    order sym=red side=buy qty=100 px=10.25
+
+Bare tokens (the legacy "order red" / "fill 1 red" forms) are kept in order under the "args" key.
+"""
+import math
+
+SIDES = ('buy', 'sell')
+
+
+def format_message(kind, **fields):
+    """Return the text form of a message, skipping fields whose value is None."""
+    parts = [kind]
+    for key, value in fields.items():
+        if value is not None:
+            parts.append(f'{key}={value}')
+    return ' '.join(parts)
+
+
+def parse_message(text):
+    """Split a message into (kind, fields). Values are left as strings."""
+    tokens = text.split()
+    if not tokens:
+        return '', {}
+    fields = {}
+    args = []
+    for token in tokens[1:]:
+        key, sep, value = token.partition('=')
+        if sep:
+            fields[key] = value
+        else:
+            args.append(token)
+    if args:
+        fields['args'] = args
+    return tokens[0], fields
+
+
+def parse_quantity(text, minimum=1):
+    """A quantity field as an int of at least minimum, or None if it is not one (qty=1.5, qty=abc)."""
+    if text is None or not text.isdecimal():
+        return None
+    quantity = int(text)
+    return quantity if quantity >= minimum else None
+
+
+def parse_price(text):
+    """A price field as a positive finite float, or None if it is not one (px=abc, px=-1, px=nan, px=1e400)."""
+    if text is None or not text.replace('.', '', 1).isdecimal():
+        return None
+    price = float(text)
+    return price if 0 < price < math.inf else None
+
+
+def format_order(symbol, side='buy', quantity=1, price=None, order_id=None):
+    return format_message('order', id=order_id, sym=symbol, side=side, qty=quantity, px=price)
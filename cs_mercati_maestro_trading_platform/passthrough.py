@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from relaycore import LISTEN_BACKLOG, ConnectionStats, Relay
+
+"""
+Pass-Through Relay
+------------------
+Opt-in raw mode for the Order Router and FIX Engine (--passthrough) when they only forward
+bytes. Each client gets its own upstream connection, and bytes move kernel to kernel in both
+directions with os.splice through a pipe, so they never get copied into Python.
+
+- Nothing is parsed: no routing, queueing or shedding, and no per-message logging.
+- Logging is a sampled tap instead: at most every TAP_INTERVAL seconds per direction, the bytes
+  waiting on the socket are peeked (MSG_PEEK, so the splice still moves them) and logged.
+- Byte and splice counts per connection are in the stats.
+- Needs Linux and Python 3.10+ (os.splice).
+"""
+
+PIPE_SIZE = 1 << 20  # Bytes per pipe (F_SETPIPE_SZ), and per splice call
+TAP_INTERVAL = 1.0  # Seconds between tap samples per direction
+TAP_BYTES = 256
+SPLICE_FLAGS = getattr(os, 'SPLICE_F_MOVE', 0) | getattr(os, 'SPLICE_F_NONBLOCK', 0)
+
+
+class SpliceStream:
+    """Moves bytes from one non-blocking socket to another through a pipe."""
+
+    def __init__(self, relay, src, dst, stats, direction):
+        self.relay = relay
+        self.loop = asyncio.get_running_loop()
+        self.src = src
+        self.dst = dst
+        self.stats = stats
+        self.direction = direction
+        self.pipe_r, self.pipe_w = os.pipe()
+        try:
+            import fcntl
+            fcntl.fcntl(self.pipe_w, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+        except (ImportError, OSError):
+            pass  # Default pipe size (64 KiB) still works, with more splice calls
+        self.buffered = 0  # Bytes in the pipe not yet spliced out to dst
+        self.last_tap = 0.0
+        self.done = self.loop.create_future()
+
+    def start(self):
+        self.loop.add_reader(self.src.fileno(), self.on_readable)
+        return self.done
+
+    def on_readable(self):
+        now = time.monotonic()
+        if now - self.last_tap >= TAP_INTERVAL:
+            self.last_tap = now
+            self.tap()
+        try:
+            moved = os.splice(self.src.fileno(), self.pipe_w, PIPE_SIZE, flags=SPLICE_FLAGS)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.finish(e)
+            return
+        if not moved:
+            self.finish()
+            return
+        self.buffered += moved
+        self.stats.bytes_in += moved
+        self.stats.messages_in += 1  # splice calls: the stream is not parsed into messages
+        try:
+            flushed = self.flush()
+        except OSError as e:
+            self.finish(e)
+            return
+        if not flushed:
+            # dst is full: stop reading until it drains, so the pipe and the sender back off
+            self.loop.remove_reader(self.src.fileno())
+            self.loop.add_writer(self.dst.fileno(), self.on_writable)
+
+    def on_writable(self):
+        try:
+            flushed = self.flush()
+        except OSError as e:
+            self.finish(e)
+            return
+        if flushed:
+            self.loop.remove_writer(self.dst.fileno())
+            self.loop.add_reader(self.src.fileno(), self.on_readable)
+
+    def flush(self):
+        """Splice the pipe out to dst. Returns False if dst would block with bytes still buffered."""
+        while self.buffered:
+            try:
+                moved = os.splice(self.pipe_r, self.dst.fileno(), self.buffered, flags=SPLICE_FLAGS)
+            except BlockingIOError:
+                self.stats.dropped += 1  # times dst pushed back
+                return False
+            self.buffered -= moved
+            self.stats.bytes_out += moved
+            self.stats.messages_out += 1
+        return True
+
+    def tap(self):
+        try:
+            sample = self.src.recv(TAP_BYTES, socket.MSG_PEEK)
+        except (BlockingIOError, OSError):
+            return
+        if sample:
+            logging.debug(f'{self.relay.name}: connection {self.stats.conn_id} {self.direction} tap: {sample!r}')
+
+    def finish(self, error=None):
+        if self.done.done():
+            return
+        self.loop.remove_reader(self.src.fileno())
+        self.loop.remove_writer(self.dst.fileno())
+        if error is not None:
+            logging.error(f'{self.relay.name}: connection {self.stats.conn_id} {self.direction} error: {error}')
+        else:
+            try:
+                self.dst.shutdown(socket.SHUT_WR)  # Pass the EOF on
+            except OSError:
+                pass
+        os.close(self.pipe_r)
+        os.close(self.pipe_w)
+        self.done.set_result(error)
+
+
+class PassThroughRelay(Relay):
+    """Relay that splices every client to its own upstream connection without parsing."""
+
+    def __init__(self, name, listen_host, listen_port, upstream_host, upstream_port, stats_interval=60,
+                 reuse_port=False):
+        if not hasattr(os, 'splice'):
+            raise RuntimeError('pass-through mode needs os.splice (Linux, Python 3.10+)')
+        super().__init__(name, listen_host, listen_port, upstream_host, upstream_port, sessions=0,
+                         stats_interval=stats_interval, reuse_port=reuse_port)
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.total_bytes = 0
+        self.returns = {}  # conn_id -> ConnectionStats of the upstream -> client direction
+
+    async def handle_connection(self, client):
+        loop = asyncio.get_running_loop()
+        conn_id = next(self.conn_ids)
+        peer = client.getpeername()
+        self.total_connections += 1
+        upstream = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        upstream.setblocking(False)
+        try:
+            await loop.sock_connect(upstream, (socket.gethostbyname(self.upstream_host), self.upstream_port))
+        except OSError as e:
+            logging.error(f'{self.name}: no upstream for connection {conn_id} from {peer}: {e}')
+            upstream.close()
+            client.close()
+            return
+        for sock in (client, upstream):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        inbound = ConnectionStats(conn_id, peer)
+        outbound = ConnectionStats(conn_id, (self.upstream_host, self.upstream_port))
+        self.connections[conn_id] = inbound
+        self.returns[conn_id] = outbound
+        logging.debug(f'Connected by {peer} (connection {conn_id}, pass-through)')
+        streams = [SpliceStream(self, client, upstream, inbound, 'client->upstream'),
+                   SpliceStream(self, upstream, client, outbound, 'upstream->client')]
+        pending = {stream.start() for stream in streams}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                error = next((f.result() for f in done if f.result() is not None), None)
+                if error is not None:
+                    # A reset on one side ends both directions
+                    for stream in streams:
+                        stream.finish(error)
+        finally:
+            del self.connections[conn_id]
+            del self.returns[conn_id]
+            self.total_bytes += inbound.bytes_out + outbound.bytes_out
+            upstream.close()
+            client.close()
+            logging.debug(f'Connection {conn_id} closed: in {inbound.as_dict()} out {outbound.as_dict()}')
+
+    def stats(self):
+        return {
+            'open_connections': len(self.connections),
+            'total_connections': self.total_connections,
+            'total_bytes': self.total_bytes + sum(c.bytes_out for c in self.connections.values())
+                           + sum(c.bytes_out for c in self.returns.values()),
+        }
+
+    async def serve_forever(self):
+        loop = asyncio.get_running_loop()
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listener.bind((self.listen_host, self.listen_port))
+        listener.listen(LISTEN_BACKLOG)
+        listener.setblocking(False)
+        logging.info(f'{self.name} listening for connections (pass-through)')
+        asyncio.create_task(self.log_stats())
+        while True:
+            client, _ = await loop.sock_accept(listener)
+            client.setblocking(False)
+            asyncio.create_task(self.handle_connection(client))
@@ -0,0 +1,637 @@
+import asyncio
+import collections
+import itertools
+import logging
+import socket
+import time
+
+from framing import FrameError, FrameParser, encode_frame, encode_frames
+from messages import format_message, parse_message
+
+"""
+Relay Core
+----------
+Shared asyncio engine for the Order Router (sor/sor.py) and the FIX Engine (fix/fix.py).
+All client connections are served by one event loop, and their messages are multiplexed onto
+a small fixed pool of upstream sessions instead of one thread and one upstream socket per client.
+
+- A client is pinned to one upstream session (connection ID modulo pool size), so the order of
+  its messages is preserved.
+- A client may open with logon trader=<ID>. It is kept in the connection stats, not forwarded.
+- Messages are length-prefixed frames (see framing.py). Only complete frames are forwarded, so
+  messages from different clients never interleave on a shared upstream session, and all frames
+  from one read are written upstream in one batch.
+- Per-connection stats (bytes, messages, drops) are logged on disconnect, and totals every
+  stats_interval seconds.
+- Every upstream session has a bounded queue (queue_depth messages) drained by one writer task.
+  When it is full the shed policy decides: "block" stops reading from the clients feeding it, so
+  TCP pushes back on them; "reject-new" answers new orders with reject ... reason=overloaded, and
+  replaces with cancelreject ... to=2 (their order stays live). Cancels are always queued,
+  whatever the depth. Queue depth, high-water marks, rejects and
+  blocked time are part of the stats.
+- The queue has priority lanes: cancels, then risk messages, then new orders and everything
+  else, so a cancel sent during a burst overtakes the orders queued ahead of it. Queueing delay
+  is recorded per lane (count, mean, p50, p99, max).
+- The writer encodes a batch message by message. One the session cannot encode (a subclass's
+  encode() raising, e.g. the FIX Engine on qty=abc) is dropped alone and answered with a reject
+  or cancelreject to its client, so no message can stop the writer every client shares.
+  Messages lost with the upstream connection mid-write are answered the same way
+  (reason=disconnected), unless the session's protocol sends them again after a reconnect (the
+  FIX Engine's message store).
+- Execution reports (ack, fill, cancelled, reject, ...) read back on an upstream session are
+  written to the client connection the order came in on, found by its id= in an order ID ->
+  connection map. An order leaves the map when it is cancelled, rejected or fully filled (a
+  'replaced' report resets its open quantity to the leaves it carries), or when its connection
+  closes.
+- Writes to a client are drained before its next read, so a client that stops reading its reports
+  stops being read from too. One that lets more than CLIENT_BUFFER_LIMIT bytes of reports pile up
+  anyway (they keep coming for its resting orders) is disconnected as too slow.
+- A relay given a channel (a Unix socket from a front acceptor, see sor/shards.py) does not
+  listen itself: it serves the client connections passed to it over the channel as file
+  descriptors.
+"""
+
+READ_SIZE = 65536
+RECONNECT_DELAY = 1.0  # Seconds between upstream connection attempts
+READY_POLL = 0.01  # Seconds between checks for a connected session to become ready (e.g. logged on)
+LISTEN_BACKLOG = 1024
+QUEUE_DEPTH = 10000  # Messages per upstream session queue
+WRITE_BATCH = 512  # Messages per upstream write
+HIGH_WATER = 0.8  # Queue fill fraction that is logged as overload
+SHED_POLICIES = ('block', 'reject-new')
+LANES = ('cancel', 'risk', 'order')  # Message classes, highest priority first
+PRIORITY_LANES = {b'cancel': 0, b'risk': 1}  # Message kind -> lane; everything else is an order
+ORDER_LANE = LANES.index('order')
+DELAY_SAMPLES = 4096  # Recent queueing delays kept per lane for percentiles
+DONE_KINDS = {b'cancelled', b'reject'}  # Reports after which an order gets no more
+CLIENT_BUFFER_LIMIT = 1 << 22  # Bytes of reports buffered for one client before it is disconnected
+
+
+class ConnectionStats:
+    __slots__ = ('conn_id', 'peer', 'trader', 'connected_at', 'bytes_in', 'bytes_out',
+                 'messages_in', 'messages_out', 'dropped')
+
+    def __init__(self, conn_id, peer):
+        self.conn_id = conn_id
+        self.peer = peer
+        self.trader = None  # from the client's logon message, if it sent one
+        self.connected_at = time.monotonic()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages_in = 0
+        self.messages_out = 0
+        self.dropped = 0
+
+    def as_dict(self):
+        stats = {name: getattr(self, name) for name in self.__slots__}
+        stats['connected_for'] = round(time.monotonic() - self.connected_at, 3)
+        return stats
+
+
+def message_kind(message):
+    return message.split(b' ', 1)[0]
+
+
+def message_field(message, key):
+    """One key=value field of an encoded message, without parsing the rest of it."""
+    key = b' ' + key + b'='
+    start = message.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    end = message.find(b' ', start)
+    return message[start:end if end >= 0 else len(message)]
+
+
+def message_id(message):
+    return message_field(message, b'id')
+
+
+def rejection(message, reason):
+    """What the upstream would have answered a message it never got: reject for an order, cancelreject
+    for a cancel or replace (the order is still working). None for anything else or without an id."""
+    kind, order_id = message_kind(message), message_id(message)
+    if order_id is None:
+        return None
+    order_id = order_id.decode('utf-8', 'replace')
+    if kind == b'order':
+        return format_message('reject', id=order_id, reason=reason).encode('utf-8')
+    if kind in (b'cancel', b'replace'):
+        return format_message('cancelreject', id=order_id, reason=reason,
+                              to=1 if kind == b'cancel' else 2).encode('utf-8')
+    return None
+
+
+class LaneStats:
+    """Queueing delay of the messages dispatched from one priority lane."""
+
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = collections.deque(maxlen=DELAY_SAMPLES)  # most recent delays, for percentiles
+
+    def record(self, delay):
+        self.count += 1
+        self.total += delay
+        if delay > self.max:
+            self.max = delay
+        self.samples.append(delay)
+
+    def as_dict(self):
+        if not self.count:
+            return {'count': 0}
+        samples = sorted(self.samples)
+        return {'count': self.count,
+                'mean_ms': round(self.total / self.count * 1000, 3),
+                'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+                'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+                'max_ms': round(self.max * 1000, 3)}
+
+
+class SessionQueue:
+    """Bounded priority queue of message payloads in front of one upstream session.
+
+    Messages wait in one FIFO lane per class (LANES) and are dispatched highest class first.
+    Cancels and risk messages are never shed, and only new orders count against the shed policy.
+    A cancel whose order is still queued stays behind it in the order lane, so it never reaches
+    the venue before the order it cancels.
+    """
+
+    def __init__(self, name, max_depth=QUEUE_DEPTH, policy='block'):
+        if policy not in SHED_POLICIES:
+            raise ValueError(f'unknown shed policy {policy}')
+        self.name = name
+        self.max_depth = max_depth
+        self.policy = policy
+        self.lanes = [collections.deque() for _ in LANES]  # (enqueued at, message)
+        self.depth = 0
+        self.queued_orders = {}  # order ID -> messages for it waiting in the order lane
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+        self.overloaded = False
+        # Metrics
+        self.enqueued = 0
+        self.rejected = 0
+        self.blocked = 0
+        self.blocked_time = 0.0
+        self.max_seen = 0
+        self.delays = [LaneStats() for _ in LANES]
+
+    def __len__(self):
+        return self.depth
+
+    def full(self):
+        return self.depth >= self.max_depth
+
+    def lane_for(self, message):
+        lane = PRIORITY_LANES.get(message_kind(message), ORDER_LANE)
+        if lane != ORDER_LANE and self.queued_orders and message_id(message) in self.queued_orders:
+            return ORDER_LANE
+        return lane
+
+    def put_nowait(self, message):
+        """Queue one message. Returns False if it was shed because the queue is full."""
+        lane = self.lane_for(message)
+        if self.full() and message_kind(message) not in PRIORITY_LANES:
+            self.rejected += 1
+            return False
+        self._append(message, lane)
+        return True
+
+    async def put(self, message):
+        """Queue one message, applying the shed policy. Returns False if it was shed."""
+        if self.full() and message_kind(message) not in PRIORITY_LANES:
+            if self.policy == 'reject-new':
+                self.rejected += 1
+                return False
+            self.blocked += 1
+            started = time.monotonic()
+            while self.full():
+                self.not_full.clear()
+                await self.not_full.wait()
+            self.blocked_time += time.monotonic() - started
+        self._append(message, self.lane_for(message))
+        return True
+
+    def _append(self, message, lane):
+        self.lanes[lane].append((time.perf_counter(), message))
+        if lane == ORDER_LANE:
+            order_id = message_id(message)
+            if order_id is not None:
+                self.queued_orders[order_id] = self.queued_orders.get(order_id, 0) + 1
+        self.depth += 1
+        self.enqueued += 1
+        if self.depth > self.max_seen:
+            self.max_seen = self.depth
+        if not self.overloaded and self.depth >= self.max_depth * HIGH_WATER:
+            self.overloaded = True
+            logging.warning(f'{self.name}: queue above high water ({self.depth}/{self.max_depth})')
+        self.not_empty.set()
+
+    async def get_batch(self, limit=WRITE_BATCH):
+        """Take up to limit messages, highest priority lane first."""
+        while not self.depth:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        now = time.perf_counter()
+        batch = []
+        for lane, messages in enumerate(self.lanes):
+            if not messages:
+                continue
+            delays = self.delays[lane]
+            for _ in range(min(limit - len(batch), len(messages))):
+                enqueued_at, message = messages.popleft()
+                delays.record(now - enqueued_at)
+                batch.append(message)
+                if lane == ORDER_LANE:
+                    self._dequeued(message)
+            if len(batch) >= limit:
+                break
+        self.depth -= len(batch)
+        if not self.full():
+            self.not_full.set()
+        if self.overloaded and self.depth < self.max_depth * HIGH_WATER / 2:
+            self.overloaded = False
+            logging.info(f'{self.name}: queue back under high water ({self.depth}/{self.max_depth})')
+        return batch
+
+    def _dequeued(self, message):
+        order_id = message_id(message)
+        count = self.queued_orders.get(order_id)
+        if count == 1:
+            del self.queued_orders[order_id]
+        elif count:
+            self.queued_orders[order_id] = count - 1
+
+    def as_dict(self):
+        return {'depth': self.depth, 'max_depth': self.max_depth, 'max_seen': self.max_seen,
+                'enqueued': self.enqueued, 'rejected': self.rejected, 'blocked': self.blocked,
+                'blocked_time': round(self.blocked_time, 3), 'overloaded': self.overloaded,
+                'lanes': {name: len(lane) for name, lane in zip(LANES, self.lanes)},
+                'queueing_delay': {name: delays.as_dict() for name, delays in zip(LANES, self.delays)}}
+
+
+class MessageRejected(ValueError):
+    """Raised by UpstreamSession.encode() for a message it will not send; the argument is the reject reason."""
+
+
+class UpstreamSession:
+    """One long-lived connection to the upstream component, shared by many clients.
+
+    The wire format is framed text (see framing.py). Subclasses speaking another protocol
+    override encode(), decode(), on_connected() and ready. A message that encode() raises on is
+    dropped alone and rejected back to its client (with the reason of a MessageRejected, else
+    bad_message); the rest of the batch is written. A batch lost with the connection is rejected the
+    same way (disconnected), unless resends_lost: the subclass's protocol delivers it after a reconnect.
+    """
+
+    resends_lost = False
+
+    def __init__(self, relay, index, host, port):
+        self.relay = relay
+        self.index = index
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.stats = ConnectionStats(f'upstream-{index}', (host, port))
+        self.queue = SessionQueue(f'{relay.name} upstream session {index}', relay.queue_depth, relay.shed_policy)
+        self.connect_lock = asyncio.Lock()
+        self.parser = FrameParser()
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    @property
+    def ready(self):
+        """Connected and able to take messages (a subclass may need a logon first)."""
+        return self.connected
+
+    def on_connected(self):
+        """Called when a new connection is up, before anything else is written or read."""
+        self.parser = FrameParser()
+
+    def on_disconnected(self):
+        """Called when the connection has dropped."""
+
+    def encode(self, message):
+        """Bytes to write for one queued message payload."""
+        return encode_frame(message)
+
+    def decode(self, data):
+        """Message payloads completed by bytes read from the upstream connection."""
+        return self.parser.feed(data)
+
+    async def connect(self):
+        async with self.connect_lock:
+            if self.connected:
+                return True
+            try:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                logging.error(f'{self.relay.name}: upstream session {self.index} cannot connect to '
+                              f'{self.host}:{self.port}: {e}')
+                return False
+            logging.info(f'{self.relay.name}: upstream session {self.index} connected to {self.host}:{self.port}')
+            self.on_connected()
+            asyncio.create_task(self.read_loop(self.reader))
+            return True
+
+    async def keep_connected(self):
+        while True:
+            if not self.connected:
+                await self.connect()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def send(self, messages, client_stats):
+        """Queue message payloads for the writer task. Returns the messages shed by the queue."""
+        shed = []
+        for message in messages:
+            if not await self.queue.put(message):
+                shed.append(message)
+        client_stats.dropped += len(shed)
+        return shed
+
+    def send_nowait(self, messages):
+        """Queue message payloads without waiting (for timer callbacks). Returns the messages shed."""
+        return [message for message in messages if not self.queue.put_nowait(message)]
+
+    async def write_loop(self):
+        """Drain the queue to the upstream socket in batches, one write and drain per batch."""
+        while True:
+            batch = await self.queue.get_batch()
+            while not self.ready:
+                if self.connected:
+                    await asyncio.sleep(READY_POLL)
+                elif not await self.connect():
+                    await asyncio.sleep(RECONNECT_DELAY)
+            chunks = []
+            sent = []
+            for message in batch:
+                try:
+                    chunks.append(self.encode(message))
+                    sent.append(message)
+                except MessageRejected as e:
+                    logging.warning(f'{self.relay.name}: rejecting {message.decode("utf-8", "replace")}: {e}')
+                    self.reject(message, str(e))
+                except Exception as e:  # one client's message must not stop the writer every client shares
+                    logging.error(f'{self.relay.name}: upstream session {self.index} cannot send '
+                                  f'{message.decode("utf-8", "replace")}: {e!r}')
+                    self.reject(message, 'bad_message')
+            if not chunks:
+                continue
+            data = b''.join(chunks)
+            try:
+                self.writer.write(data)
+                await self.writer.drain()
+            except (ConnectionError, OSError) as e:
+                logging.error(f'{self.relay.name}: upstream session {self.index} lost {len(chunks)} messages: {e}')
+                if not self.resends_lost:
+                    for message in sent:
+                        self.reject(message, 'disconnected')
+                continue
+            self.stats.bytes_out += len(data)
+            self.stats.messages_out += len(chunks)
+
+    def reject(self, message, reason):
+        """Answer a message that will not be sent upstream as the upstream would have: an order with
+        reject, a cancel or replace with cancelreject, so its client does not wait for it."""
+        self.stats.dropped += 1
+        answer = rejection(message, reason)
+        if answer is not None:
+            self.relay.on_upstream_message(self, answer)
+
+    async def read_loop(self, reader):
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                self.stats.bytes_in += len(data)
+                messages = self.decode(data)
+                self.stats.messages_in += len(messages)
+                for message in messages:
+                    self.relay.on_upstream_message(self, message)
+        except (ConnectionError, OSError, ValueError) as e:  # ValueError: FrameError or a protocol error
+            logging.error(f'{self.relay.name}: upstream session {self.index} error: {e}')
+        logging.warning(f'{self.relay.name}: upstream session {self.index} disconnected')
+        if self.writer is not None:
+            self.writer.close()
+        self.on_disconnected()
+
+
+class Relay:
+    """Accepts clients on listen_host:listen_port and relays their messages upstream."""
+
+    session_class = UpstreamSession
+
+    def __init__(self, name, listen_host, listen_port, upstream_host, upstream_port,
+                 sessions=4, stats_interval=60, queue_depth=QUEUE_DEPTH, shed_policy='block', reuse_port=False,
+                 channel=None):
+        self.name = name
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.reuse_port = reuse_port  # SO_REUSEPORT, for several worker processes on one port
+        self.channel = channel  # Unix socket that client connections are handed over on, instead of listening
+        self.queue_depth = queue_depth
+        self.shed_policy = shed_policy
+        self.upstreams = [self.session_class(self, i, upstream_host, upstream_port) for i in range(sessions)]
+        self.stats_interval = stats_interval
+        self.connections = {}  # conn_id -> ConnectionStats
+        self.clients = {}  # conn_id -> StreamWriter, for messages back to the client
+        self.routes = {}  # order ID -> [conn_id, open quantity], for reports back to the client
+        self.conn_ids = itertools.count(1)
+        self.total_connections = 0
+        self.total_messages = 0
+        self.server = None
+
+    def upstream_for(self, conn_id):
+        return self.upstreams[conn_id % len(self.upstreams)]
+
+    async def handle_client(self, reader, writer):
+        conn_id = next(self.conn_ids)
+        stats = ConnectionStats(conn_id, writer.get_extra_info('peername'))
+        self.connections[conn_id] = stats
+        self.clients[conn_id] = writer
+        self.total_connections += 1
+        logging.debug(f'Connected by {stats.peer} (connection {conn_id})')
+        parser = FrameParser()
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                stats.bytes_in += len(data)
+                messages = parser.feed(data)
+                if not messages:
+                    continue
+                if not stats.messages_in and messages[0].startswith(b'logon'):
+                    stats.trader = parse_message(messages[0].decode('utf-8'))[1].get('trader')
+                    logging.debug(f'{self.name}: connection {conn_id} logged on as trader {stats.trader}')
+                    stats.messages_in += 1
+                    messages = messages[1:]
+                    if not messages:
+                        continue
+                stats.messages_in += len(messages)
+                self.total_messages += len(messages)
+                for message in messages:
+                    logging.debug(f'Received order: {message.decode("utf-8")}')
+                await self.dispatch(conn_id, stats, messages)
+                await writer.drain()  # what the client has not read yet holds up its next read
+        except FrameError as e:
+            logging.error(f'Connection {conn_id} sent a corrupt frame, closing: {e}')
+        except (ConnectionError, OSError) as e:
+            logging.error(f'Exception in handling client: {e}')
+        finally:
+            del self.connections[conn_id]
+            del self.clients[conn_id]
+            self.drop_routes(conn_id)
+            writer.close()
+            logging.debug(f'Connection {conn_id} closed: {stats.as_dict()}')
+
+    async def dispatch(self, conn_id, stats, messages):
+        """Forward a batch of client messages upstream. Subclasses override this to route per message.
+
+        A cancel or replace of an order the client has no working order for is answered with
+        cancelreject reason=unknown_order and not forwarded: nothing would route the answer back.
+        """
+        forwarded = []
+        unknown = []
+        for message in messages:
+            kind, order_id = message_kind(message), message_id(message)
+            if order_id is not None:
+                if kind == b'order':
+                    quantity = message_field(message, b'qty')
+                    self.routes[order_id] = [conn_id, int(quantity) if quantity and quantity.isdigit() else 1]
+                elif kind in (b'cancel', b'replace') and self.routes.get(order_id, (None,))[0] != conn_id:
+                    unknown.append(rejection(message, 'unknown_order'))
+                    continue
+            forwarded.append(message)
+        if unknown:
+            stats.dropped += len(unknown)
+            self.send_to_client(conn_id, unknown)
+        await self.forward(self.upstream_for(conn_id), conn_id, stats, forwarded)
+
+    async def forward(self, upstream, conn_id, stats, messages):
+        """Queue messages on an upstream session and reject whatever the shed policy refused."""
+        shed = await upstream.send(messages, stats)
+        sent = len(messages) - len(shed)
+        stats.messages_out += sent
+        stats.bytes_out += sum(len(m) for m in messages) - sum(len(m) for m in shed)
+        if shed:
+            self.reject_overloaded(conn_id, shed)
+
+    def reject_overloaded(self, conn_id, messages):
+        """Tell the client that shed messages were not sent, so it does not wait for them. A shed order is
+        done; the order of a shed replace is still working, and keeps its route."""
+        rejects = []
+        for message in messages:
+            answer = rejection(message, 'overloaded')
+            if answer is None:
+                continue
+            if message_kind(message) == b'order':
+                self.routes.pop(message_id(message), None)
+            rejects.append(answer)
+        logging.warning(f'{self.name}: shed {len(messages)} messages from connection {conn_id}')
+        self.send_to_client(conn_id, rejects)
+
+    def send_to_client(self, conn_id, messages):
+        """Write message payloads back to a client connection, if it is still open."""
+        writer = self.clients.get(conn_id)
+        if writer is None or writer.is_closing() or not messages:
+            return False
+        data = encode_frames(messages)
+        writer.write(data)
+        self.connections[conn_id].bytes_out += len(data)
+        buffered = writer.transport.get_write_buffer_size()
+        if buffered > CLIENT_BUFFER_LIMIT:
+            logging.warning(f'{self.name}: connection {conn_id} is not reading its reports ({buffered} bytes '
+                            f'buffered), disconnecting')
+            writer.transport.abort()
+        return True
+
+    def drop_routes(self, conn_id):
+        """Forget the orders of a closed connection: nobody is left to pass their reports to."""
+        order_ids = [order_id for order_id, route in self.routes.items() if route[0] == conn_id]
+        for order_id in order_ids:
+            del self.routes[order_id]
+        if order_ids:
+            logging.debug(f'{self.name}: connection {conn_id} closed with {len(order_ids)} open orders')
+
+    def on_upstream_message(self, upstream, message):
+        """Called for each complete message read back from an upstream session: pass reports back to the client."""
+        order_id = message_id(message)
+        route = self.routes.get(order_id) if order_id is not None else None
+        if route is None:
+            logging.debug(f'{self.name}: upstream session {upstream.index} sent: {message.decode("utf-8")}')
+            return
+        kind = message_kind(message)
+        if kind == b'fill':
+            route[1] -= int(message_field(message, b'qty') or 0)
+        elif kind == b'replaced':
+            route[1] = int(message_field(message, b'leaves') or 0)
+        if kind in DONE_KINDS or route[1] <= 0:
+            del self.routes[order_id]
+        self.send_to_client(route[0], [message])
+
+    def stats(self):
+        return {
+            'open_connections': len(self.connections),
+            'total_connections': self.total_connections,
+            'total_messages': self.total_messages,
+            'upstreams': [u.stats.as_dict() for u in self.upstreams],
+            'queues': [u.queue.as_dict() for u in self.upstreams],
+            'open_orders': len(self.routes),
+        }
+
+    async def log_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            logging.info(f'{self.name} stats: {self.stats()}')
+
+    async def serve_forever(self):
+        for upstream in self.upstreams:
+            asyncio.create_task(upstream.keep_connected())
+            asyncio.create_task(upstream.write_loop())
+        asyncio.create_task(self.log_stats())
+        if self.channel is not None:
+            await self.accept_handoffs()
+            return
+        self.server = await asyncio.start_server(self.handle_client, self.listen_host, self.listen_port,
+                                                 backlog=LISTEN_BACKLOG, reuse_port=self.reuse_port or None)
+        logging.info(f'{self.name} listening for connections')
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def accept_handoffs(self):
+        """Serve the client sockets a front acceptor passes over self.channel, until it closes."""
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        self.channel.setblocking(False)
+        loop.add_reader(self.channel.fileno(), readable.set)
+        logging.info(f'{self.name} accepting connections handed over by the front acceptor')
+        while True:
+            await readable.wait()
+            readable.clear()
+            while True:
+                try:
+                    data, fds, _, _ = socket.recv_fds(self.channel, 1, 1)
+                except BlockingIOError:
+                    break
+                if not data and not fds:
+                    logging.error(f'{self.name}: front acceptor channel closed')
+                    loop.remove_reader(self.channel.fileno())
+                    return
+                for fd in fds:
+                    reader, writer = await asyncio.open_connection(sock=socket.socket(fileno=fd))
+                    asyncio.create_task(self.handle_client(reader, writer))
+
+
+def run_relay(relay):
+    """Run a Relay on a new event loop until interrupted."""
+    asyncio.run(relay.serve_forever())
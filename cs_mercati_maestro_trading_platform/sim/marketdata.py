@@ -0,0 +1,94 @@
+import logging
+import socket
+import time
+
+from messages import format_message
+
+"""
+Simulator Market Data
+---------------------
+Publishes what happens in the simulator's books on the platform's market data multicast feed
+(224.1.1.1:5007, which the Trading App listens to), so the market data a strategy sees is the
+book it trades against and its own fills show up in it:
+
+    quote sym=red bid=99.99 bidsz=1000 ask=100.01 asksz=1000   top of book (an empty side is left out)
+    trade sym=red qty=100 px=100.0 side=buy                   one execution, side being the taker's
+    heartbeat                                                 every HEARTBEAT_INTERVAL seconds
+
+- Incremental: at the end of a matching cycle each book the cycle touched has its top compared
+  with the last quote published for it, and is only quoted again if it differs, so depth added
+  behind the touch or a cancel away from it publishes nothing. Every execution is printed.
+- Batched: a cycle's messages are sent together, newline-separated, packed into datagrams of up to
+  MAX_DATAGRAM bytes (what a reader of the feed takes in one recvfrom), trades first, in the
+  order they happened, then the quotes they left.
+- Heartbeats: sent by the simulator's main process whatever the books do, so a reader can tell a
+  quiet market from a dead feed (the Trading App's dependency check waits one second for data).
+- A failing send (no multicast route) is logged once and counted, not retried.
+"""
+
+MCAST_GRP = '224.1.1.1'
+MCAST_PORT = 5007
+MCAST_TTL = 2
+MAX_DATAGRAM = 1024
+HEARTBEAT_INTERVAL = 0.5  # Seconds
+
+
+class MarketDataPublisher:
+    def __init__(self, group=MCAST_GRP, port=MCAST_PORT):
+        self.address = (group, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MCAST_TTL)
+        self.changed = set()  # symbols of the books touched this cycle
+        self.quotes = {}  # symbol -> (bid, bid size, ask, ask size) last published
+        self.messages = []  # this cycle's, not sent yet
+        self.stats = {'quotes': 0, 'unchanged': 0, 'trades': 0, 'datagrams': 0, 'bytes': 0, 'errors': 0}
+
+    def trade(self, book, quantity, price, side):
+        """MatchingEngine trades hook."""
+        self.messages.append(format_message('trade', sym=book.symbol, qty=quantity, px=price, side=side))
+        self.stats['trades'] += 1
+
+    def publish(self, books):
+        """End of a matching cycle: quote the books whose top changed, and send the cycle's messages."""
+        for symbol in self.changed:
+            top = books[symbol].top()
+            if self.quotes.get(symbol) == top:
+                self.stats['unchanged'] += 1
+                continue
+            self.quotes[symbol] = top
+            bid, bid_size, ask, ask_size = top
+            self.messages.append(format_message('quote', sym=symbol, bid=bid,
+                                                bidsz=bid_size if bid is not None else None, ask=ask,
+                                                asksz=ask_size if ask is not None else None))
+            self.stats['quotes'] += 1
+        self.changed.clear()
+        if self.messages:
+            self.send(self.messages)
+            self.messages = []
+
+    def heartbeat(self, interval=HEARTBEAT_INTERVAL):
+        """Heartbeat thread."""
+        while True:
+            self.send_datagram(b'heartbeat')
+            time.sleep(interval)
+
+    def send(self, messages):
+        datagram = b''
+        for message in messages:
+            data = message.encode('utf-8')
+            if datagram and len(datagram) + 1 + len(data) > MAX_DATAGRAM:
+                self.send_datagram(datagram)
+                datagram = b''
+            datagram = datagram + b'\n' + data if datagram else data
+        self.send_datagram(datagram)
+
+    def send_datagram(self, datagram):
+        try:
+            self.sock.sendto(datagram, self.address)
+        except OSError as e:
+            if not self.stats['errors']:
+                logging.error(f'Cannot publish market data to {self.address[0]}:{self.address[1]}: {e}')
+            self.stats['errors'] += 1
+            return
+        self.stats['datagrams'] += 1
+        self.stats['bytes'] += len(datagram)
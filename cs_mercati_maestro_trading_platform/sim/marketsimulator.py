@@ -1,3 +1,6 @@
+import argparse
+import collections
+import itertools
 import socket
 import logging
 import os
@@ -6,29 +9,117 @@ import sys
 import threading
 import time
 
+# Shared platform modules live one directory up
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'fix'))
+from fixcodec import (CL_ORD_ID, CXL_REJ_RESPONSE_TO, EXECUTION_REPORT, LIMIT, MARKET, NEW_ORDER_SINGLE,
+                      ORD_STATUS, ORD_TYPE, ORDER_CANCEL_REJECT, ORDER_CANCEL_REPLACE_REQUEST, ORDER_CANCEL_REQUEST,
+                      ORDER_ID, ORDER_QTY, ORIG_CL_ORD_ID, PRICE, SIDE, SIDE_NAMES, SYMBOL, TEXT, TIME_IN_FORCE,
+                      TIME_IN_FORCE_NAMES, FixEncoder, FixError)
+from fixdict import load_dictionary
+from fixsession import FixSession, peek_sender
+from fixstore import MessageStore
+from framing import FrameParser, encode_frames
+from marketdata import MCAST_PORT, MarketDataPublisher
+from matching import BUY, DAY, IOC, SELL, MatchingEngine
+from messages import format_message, parse_message, parse_price, parse_quantity
+from orderflow import MARKETABLE, PASSIVE, OrderFlow
+from shards import CANCEL, CANCEL_ALL, REPLACE, REPORT, RESULT, SUBMIT, ShardRouter, serve
+from workers import Supervisor
+
 """
 Market Simulator App
 ---------------------
-This application receives orders from the FIX Engine and sends fill messages back to the FIX Engine.
-The fill messages simulate trade fills and alternate between "fill 1 red" and "fill 1 blue".
+This application receives orders from the FIX Engine, matches them in per-symbol limit order books
+(see matching.py: price-time priority, limit/market orders, DAY/GTC/IOC/FOK, partial fills, cancel
+and cancel/replace) and sends the execution reports back to the FIX Engine over the same connection.
 
-- Receiving: TCP from FIX Engine on localhost:5010.
-- Sending: TCP back to FIX Engine on localhost:5009.
-- Dependencies: None
+- Receiving: TCP from FIX Engine on localhost:5010. A connection that starts with 8=FIX is a FIX 4.4
+  session (see fix/fixsession.py): NewOrderSingle, OrderCancelRequest and OrderCancelReplaceRequest
+  are answered with ExecutionReports (New, Trade, Canceled, Replaced, Rejected), a cancel or replace
+  for an order that is not working with an OrderCancelReject, and a message that fails validation
+  against fix/FIX44.xml with a session Reject. Sequence numbers are kept per SenderCompID under
+  fixstore/, so a FIX Engine that reconnects or restarts recovers the gap, and its orders stay on
+  the books meanwhile. Anything else is length-prefixed text (see framing.py): order, cancel and
+  replace messages, answered with ack / fill / cancelled / replaced / reject / cancelreject. A text
+  connection's orders are cancelled when it closes.
+- Sending: reports (FIX or text) on the connection of the order's owner. A fill for a resting order
+  goes to the connection that placed it, not the one whose order took it out.
+- House liquidity: the first order in a symbol seeds its book with HOUSE_LEVELS levels a side of
+  HOUSE_SIZE each, one tick apart, placed so that order is at the touch (around REFERENCE_PRICE for
+  a market order). A house order that fills is put back at the far end of its side, so the depth
+  stays the same and the price walks with the order flow.
+- The books and all FIX sessions are used under one lock: a connection thread holds it while it
+  handles what it read (one matching cycle) and writes the reports that caused, one write per
+  connection that has any. Connections stay open for the whole session; nothing is connected per
+  order or per fill.
+- Stats (connections, cycles, reports and writes, and the sockets the process holds with their
+  high-water mark, sampled at every accept) are logged every STATS_INTERVAL seconds, so a steady
+  socket count under load can be checked in the log.
+- Sharded mode (--shards N): the books are split by symbol across N shard processes, each with
+  its own matching engine and house liquidity, and this process becomes the front gateway that
+  keeps the connections and FIX sessions, routes orders to the shards and writes the reports they
+  send back in the order the orders came in (see shards.py). Shards build the report bodies, so
+  the gateway only frames and writes them. OrderIDs and ExecIDs are prefixed with the shard.
+- Background order flow (--flow-rate N): the simulator trades N generated orders/sec of its own
+  across --flow-symbols, with bursty arrivals and mids that diffuse and jump (see orderflow.py,
+  generated in NumPy batches from --flow-seed), so books move and stay populated without an outside
+  feed. The flow keeps at most FLOW_RESTING working orders per symbol, cancelling its oldest.
+- Market data: quote and trade messages derived from the books are published on the multicast
+  feed (224.1.1.1:5007) at the end of every matching cycle, a quote only when a book's top changed
+  (see marketdata.py; --no-market-data to turn it off). In sharded mode each shard publishes its
+  own symbols. The Trading App and the Order Router (its consolidated book and algos) read it; a
+  second simulator on the host, as another router venue, publishes on its own --market-data-port.
+- Dependencies: numpy, only for background order flow
 """
 
 # Logging setup
 log_dir = "logs"
 if not os.path.exists(log_dir):
     os.makedirs(log_dir)
-logging.basicConfig(filename=os.path.join(log_dir, f'marketsimulator_{time.strftime("%y%m%d%H%M%S")}.log'), 
+# Workers import this script again: the environment keeps them on the file of the process that started them
+log_file = os.environ.setdefault('MARKETSIMULATOR_LOG', os.path.join(log_dir, f'marketsimulator_{time.strftime("%y%m%d%H%M%S")}.log'))
+logging.basicConfig(filename=log_file, 
                     level=logging.DEBUG, 
                     format='%(asctime)s %(message)s')
 
 # TCP setup
 HOST = 'localhost'
 PORT_RECEIVE = 5010
-PORT_SEND = 5009
+SENDER_COMP_ID = 'MKTSIM'
+STORE_DIR = 'fixstore'
+DICTIONARY = os.path.join(BASE_DIR, 'fix', 'FIX44.xml')
+TIMER_INTERVAL = 1.0  # Receive timeout, so session timers run on an idle connection
+STATS_INTERVAL = 60  # Seconds between stats log lines
+
+# Matching
+HOUSE_LEVELS = 10  # House price levels per side in a new book (0: none)
+HOUSE_SIZE = 1000  # Quantity of each house level
+TICK = 0.01
+REFERENCE_PRICE = 100.0  # Where a book opened by a market order is seeded
+EXEC_TYPES = {'new': b'0', 'fill': b'F', 'cancelled': b'4', 'replaced': b'5', 'reject': b'8'}
+TEXT_KINDS = {'new': 'ack', 'fill': 'fill', 'cancelled': 'cancelled', 'replaced': 'replaced', 'reject': 'reject'}
+
+# Background order flow
+FLOW_SYMBOLS = 'red,blue'
+FLOW_SEED = 1
+FLOW_RESTING = 100  # Working flow orders per symbol before the oldest is cancelled
+FLOW_CYCLE = 1000  # Most flow orders matched in one cycle, when it runs behind
+
+fix_participants = {}  # SenderCompID -> FixParticipant, kept across reconnects
+book_lock = threading.Lock()  # the books, and every FIX session, are only used under it
+touched = set()  # participants with reports to write, under book_lock
+stats = {'connections': 0, 'accepted': 0, 'cycles': 0, 'reports': 0, 'writes': 0, 'bytes_out': 0,
+         'sockets': 0, 'sockets_high': 0}  # under book_lock
+dictionary = load_dictionary(DICTIONARY)  # incoming FIX orders are validated against it
+exec_ids = itertools.count(1)
+owner_ids = itertools.count(1)  # participants are known to the shards by these
+id_prefix = ''  # prepended to OrderIDs and ExecIDs: '<shard>-' in a shard process
+router = None  # the ShardRouter in sharded mode, where this process is the gateway
+flow = None  # the BackgroundFlow, with --flow-rate
+market_data = None  # the MarketDataPublisher of the process that holds the books, unless disabled
+UNKNOWN_ORDER = 'unknown order or already done'
 
 def signal_handler(sig, frame):
     logging.info("Market Simulator App interrupted and exiting gracefully.")
@@ -36,35 +127,614 @@ def signal_handler(sig, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
+def ord_status(kind, order):
+    if kind == 'reject':
+        return b'8'
+    if kind == 'cancelled':
+        return b'4'
+    if order.filled >= order.quantity:
+        return b'2'
+    return b'1' if order.filled else b'0'
+
+def report_body(kind, order, quantity, price, request):
+    """The ExecutionReport body for an order event. request: (ClOrdID, OrigClOrdID) of a cancel or replace."""
+    cl_ord_id, orig_cl_ord_id = order.client_id, None
+    if request is not None and kind in ('cancelled', 'replaced'):
+        cl_ord_id, orig_cl_ord_id = request
+    fill = kind == 'fill'
+    return FixEncoder.execution_report_body(f'S{id_prefix}{order.order_id}', cl_ord_id, f'E{id_prefix}{next(exec_ids)}',
+                                            EXEC_TYPES[kind], ord_status(kind, order), order.symbol, order.side,
+                                            order.remaining, order.filled, round(order.average_price, 6),
+                                            last_qty=quantity if fill else None, last_px=price if fill else None,
+                                            text=price if kind == 'reject' else None, orig_cl_ord_id=orig_cl_ord_id)
+
+def text_report(kind, order, quantity, price):
+    if kind == 'fill':
+        return format_message('fill', id=order.client_id, sym=order.symbol, qty=quantity, px=price)
+    if kind == 'replaced':
+        return format_message('replaced', id=order.client_id, leaves=order.remaining)
+    if kind == 'reject':
+        return format_message('reject', id=order.client_id, reason=price.replace(' ', '_'))
+    return format_message(TEXT_KINDS[kind], id=order.client_id)
+
+class FixParticipant:
+    """Owner of a FIX session's orders: their events become ExecutionReports on the session."""
+
+    fix = True
+
+    def __init__(self, session):
+        self.session = session
+        self.conn = None
+        self.request = None  # (ClOrdID, OrigClOrdID) of the cancel or replace being applied
+        self.owner_id = next(owner_ids)
+
+    def report(self, kind, order, quantity, price):
+        self.deliver(report_body(kind, order, quantity, price, self.request))
+
+    def deliver(self, body):
+        stats['reports'] += 1
+        self.session.send(EXECUTION_REPORT, body=body)
+
+    def cancel_reject(self, message, response_to, text):
+        self.session.send(ORDER_CANCEL_REJECT, [(ORDER_ID, 'NONE'), (CL_ORD_ID, message.get(CL_ORD_ID)),
+                                                (ORIG_CL_ORD_ID, message.get(ORIG_CL_ORD_ID)), (ORD_STATUS, b'4'),
+                                                (CXL_REJ_RESPONSE_TO, response_to), (TEXT, text)])
+
+    def flush(self):
+        output = self.session.take_output()
+        if output and self.conn is not None:
+            send_or_drop(self, output)
+
+class TextParticipant:
+    """Owner of a text connection's orders: their events become ack/fill/... messages."""
+
+    fix = False
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.output = []
+        self.request = None
+        self.owner_id = next(owner_ids)
+
+    def report(self, kind, order, quantity, price):
+        self.deliver(text_report(kind, order, quantity, price))
+
+    def deliver(self, message):
+        stats['reports'] += 1
+        self.output.append(message)
+
+    def reject(self, order_id, reason):
+        """Refuse a message whose fields cannot make an order, without it reaching the engine."""
+        self.output.append(format_message('reject', id=order_id, reason=reason))
+
+    def cancel_reject(self, order_id, response_to, reason):
+        reason = 'unknown_order' if reason == UNKNOWN_ORDER else reason.replace(' ', '_')
+        self.output.append(format_message('cancelreject', id=order_id, reason=reason, to=response_to))
+
+    def flush(self):
+        if self.output and self.conn is not None:
+            send_or_drop(self, encode_frames(self.output))
+            logging.debug(f'Sent {len(self.output)} reports, last: {self.output[-1]}')
+        self.output.clear()
+
+class HouseLiquidity:
+    """Owner of the simulator's own resting orders, which are put back as they fill."""
+
+    def __init__(self, levels=HOUSE_LEVELS, size=HOUSE_SIZE, tick=TICK):
+        self.levels = levels
+        self.size = size
+        self.tick = tick
+        self.seeded = set()
+        self.refills = []  # (symbol, side, price) of house orders that filled
+        self.client_ids = itertools.count(1)
+
+    def seed(self, symbol, side, price):
+        """Open a book the first time an order arrives for its symbol."""
+        if symbol in self.seeded:
+            return
+        self.seeded.add(symbol)
+        if price is None:
+            best_ask = REFERENCE_PRICE + self.tick
+        else:
+            best_ask = price if side == BUY else price + self.tick
+        for level in range(self.levels):
+            self.place(symbol, SELL, round(best_ask + level * self.tick, 6))
+            self.place(symbol, BUY, round(best_ask - (level + 1) * self.tick, 6))
+
+    def place(self, symbol, side, price):
+        engine.submit(self, f'H{next(self.client_ids)}', symbol, side, self.size, price)
+
+    def report(self, kind, order, quantity, price):
+        if kind == 'fill' and not order.remaining:
+            offset = self.levels * self.tick
+            price = order.price + offset if order.side == SELL else order.price - offset
+            self.refills.append((order.symbol, order.side, round(price, 6)))
+
+    def refill(self):
+        while self.refills:
+            refills, self.refills = self.refills, []
+            for symbol, side, price in refills:
+                self.place(symbol, side, price)
+
+    def flush(self):
+        pass
+
+class ShardOwner:
+    """A gateway participant as seen in a shard process: its reports go back to the gateway."""
+
+    def __init__(self, shard, owner_id, fix):
+        self.shard = shard
+        self.owner_id = owner_id
+        self.fix = fix
+        self.request = None
+
+    def report(self, kind, order, quantity, price):
+        if self.fix:
+            payload = report_body(kind, order, quantity, price, self.request)
+        else:
+            payload = text_report(kind, order, quantity, price)
+        self.shard.entries.append((self.shard.seq, self.owner_id, REPORT, payload))
+
+    def flush(self):
+        pass
+
+class Shard:
+    """A shard process's books: applies the gateway's commands and collects the entries they cause."""
+
+    def __init__(self, index, stats_interval):
+        self.index = index
+        self.owners = {}  # owner ID -> ShardOwner
+        self.seq = 0  # of the command being applied
+        self.entries = []
+        self.commands = 0
+        self.stats_interval = stats_interval
+        self.stats_at = time.monotonic() + stats_interval
+
+    def handle(self, commands):
+        for command in commands:
+            self.apply(command)
+        house.refill()
+        if market_data is not None:
+            market_data.publish(engine.books)
+        touched.clear()
+        entries, self.entries = self.entries, []
+        self.commands += len(commands)
+        if time.monotonic() >= self.stats_at:
+            self.stats_at = time.monotonic() + self.stats_interval
+            logging.info(f'Market Simulator shard {self.index} stats: commands={self.commands} '
+                         f'working_orders={engine.working()} books={len(engine.books)} owners={len(self.owners)} '
+                         f'market_data={market_data.stats if market_data is not None else None}')
+        return entries
+
+    def apply(self, command):
+        op, self.seq, owner_id, fix = command[:4]
+        owner = self.owners.get(owner_id)
+        if owner is None:
+            owner = self.owners[owner_id] = ShardOwner(self, owner_id, fix)
+        if op == SUBMIT:
+            submit(owner, *command[4:])
+            return
+        result = None
+        if op == CANCEL:
+            client_id, owner.request = command[4:]
+            if not engine.cancel(owner, client_id):
+                result = False
+        elif op == REPLACE:
+            client_id, new_client_id, quantity, price, owner.request = command[4:]
+            try:
+                if not engine.replace(owner, client_id, new_client_id, quantity, price):
+                    result = False
+            except ValueError as e:
+                result = str(e)
+        elif op == CANCEL_ALL:
+            engine.cancel_all(owner)
+            del self.owners[owner_id]
+        owner.request = None
+        self.entries.append((self.seq, owner_id, RESULT, result))
+
+def run_shard(index, house_levels, house_size, stats_interval, market_data_port, channel=None):
+    """Shard process entry point (started by the fork server, on a fresh import of this module): match
+    the symbols routed to this shard."""
+    global id_prefix
+    id_prefix = f'{index}-'
+    house.levels = house_levels
+    house.size = house_size
+    if market_data_port:
+        start_market_data(market_data_port)
+    logging.info(f'Market Simulator shard {index} started (pid {os.getpid()})')
+    try:
+        serve(channel, Shard(index, stats_interval).handle)
+    except OSError as e:
+        logging.error(f'Market Simulator shard {index}: {e}')
+
+def send_or_drop(participant, data):
+    try:
+        participant.conn.sendall(data)
+        stats['writes'] += 1
+        stats['bytes_out'] += len(data)
+    except OSError as e:
+        # A stream cut mid-message is useless: close it, and a FIX session recovers on reconnect
+        logging.error(f'Cannot write to {participant.conn}: {e}')
+        try:
+            participant.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        participant.conn = None
+
+def on_event(kind, order, quantity, price):
+    order.owner.report(kind, order, quantity, price)
+    touched.add(order.owner)
+    if market_data is not None:
+        market_data.changed.add(order.symbol)
+
+engine = MatchingEngine(on_event)
+house = HouseLiquidity()
+
+def deliver(owner, payload):
+    owner.deliver(payload)
+    touched.add(owner)
+
+def flush_touched():
+    for owner in touched:
+        owner.flush()
+    touched.clear()
+
+def end_cycle(participant):
+    """Put back filled house orders and write every report the cycle produced, under book_lock.
+
+    In sharded mode the cycle's commands go to the shards instead, and their reports are written as
+    they come back.
+    """
+    house.refill()
+    if router is not None:
+        router.flush()
+    elif market_data is not None:
+        market_data.publish(engine.books)
+    stats['cycles'] += 1
+    touched.add(participant)
+    flush_touched()
+
+def submit(owner, client_id, symbol, side, quantity, price, time_in_force):
+    if router is not None:
+        router.send(symbol, SUBMIT, owner, (client_id, symbol, side, quantity, price, time_in_force))
+        return
+    house.seed(symbol, side, price)
+    engine.submit(owner, client_id, symbol, side, quantity, price, time_in_force)
+    logging.debug(f'Order {client_id}: {side} {quantity} {symbol} at {price or "market"} {time_in_force}')
+
+def start_market_data(port=MCAST_PORT):
+    global market_data
+    market_data = MarketDataPublisher(port=port)
+    engine.trades = market_data.trade
+
+def rejected_later(owner, rejected):
+    """Wrap rejected(reason) for a shard's answer, which arrives after the cycle has been written."""
+    def reject(reason):
+        rejected(reason or UNKNOWN_ORDER)
+        touched.add(owner)
+    return reject
+
+def cancel(owner, client_id, symbol, request, rejected):
+    """Cancel an order. rejected(reason) is called if it is not working. symbol may be None."""
+    if router is not None:
+        router.send(symbol, CANCEL, owner, (client_id, request), rejected_later(owner, rejected))
+        return
+    owner.request = request
+    try:
+        if not engine.cancel(owner, client_id):
+            rejected(UNKNOWN_ORDER)
+    finally:
+        owner.request = None
+
+def replace(owner, client_id, new_client_id, quantity, price, symbol, request, rejected):
+    """Replace an order's quantity and/or price. rejected(reason) is called if that cannot be done."""
+    if router is not None:
+        router.send(symbol, REPLACE, owner, (client_id, new_client_id, quantity, price, request),
+                    rejected_later(owner, rejected))
+        return
+    owner.request = request
+    try:
+        if not engine.replace(owner, client_id, new_client_id, quantity, price):
+            rejected(UNKNOWN_ORDER)
+    except ValueError as e:
+        rejected(str(e))
+    finally:
+        owner.request = None
+
+def cancel_all(owner):
+    if router is not None:
+        router.send(None, CANCEL_ALL, owner, ())
+    else:
+        engine.cancel_all(owner)
+
+class BackgroundFlow:
+    """Owner of the generated background orders: submits them in real time as the OrderFlow times them."""
+
+    fix = False
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.owner_id = next(owner_ids)
+        self.request = None
+        self.client_ids = itertools.count(1)
+        self.resting = [collections.deque() for _ in generator.symbols]  # client IDs, oldest first
+        self.counts = collections.Counter()  # reports by kind, under book_lock
+
+    def report(self, kind, order, quantity, price):
+        self.counts[TEXT_KINDS[kind]] += 1
+
+    def deliver(self, message):
+        self.counts[message.split(' ', 1)[0]] += 1
+
+    def flush(self):
+        pass
+
+    def run(self):
+        started = time.monotonic()
+        while True:
+            cycle = []
+            for event in zip(*[column.tolist() for column in self.generator.next_batch()]):
+                wait = started + event[0] - time.monotonic()
+                if cycle and (wait > 0 or len(cycle) >= FLOW_CYCLE):
+                    self.apply(cycle)
+                    cycle = []
+                if wait > 0:
+                    time.sleep(wait)
+                cycle.append(event)
+            if cycle:
+                self.apply(cycle)
+
+    def apply(self, events):
+        symbols = self.generator.symbols
+        with book_lock:
+            for _, index, kind, side, quantity, price in events:
+                resting = self.resting[index]
+                if kind == PASSIVE:
+                    client_id = f'F{next(self.client_ids)}'
+                    resting.append(client_id)
+                    submit(self, client_id, symbols[index], BUY if side == 0 else SELL, quantity, price, DAY)
+                    if len(resting) > FLOW_RESTING:
+                        self.cancel_oldest(symbols[index], resting)
+                elif kind == MARKETABLE:
+                    submit(self, f'F{next(self.client_ids)}', symbols[index], BUY if side == 0 else SELL, quantity,
+                           price, IOC)
+                elif resting:
+                    self.cancel_oldest(symbols[index], resting)
+            end_cycle(self)
+
+    def cancel_oldest(self, symbol, resting):
+        # It may have filled already: then there is nothing to cancel
+        cancel(self, resting.popleft(), symbol, None, lambda reason: None)
+
+def open_sockets():
+    """Sockets this process holds, from /proc/self/fd (0 where there is no /proc)."""
+    try:
+        fds = os.listdir('/proc/self/fd')
+    except OSError:
+        return 0
+    count = 0
+    for fd in fds:
+        try:
+            count += os.readlink(f'/proc/self/fd/{fd}').startswith('socket:')
+        except OSError:
+            pass  # closed since the listing
+    return count
+
+def sample_sockets():
+    sockets = open_sockets()
+    with book_lock:
+        stats['sockets'] = sockets
+        stats['sockets_high'] = max(stats['sockets_high'], sockets)
+
+def simulator_stats():
+    sample_sockets()
+    with book_lock:
+        if router is not None:
+            books = dict(router.stats, shards=router.count)
+        else:
+            books = {'working_orders': engine.working(), 'books': len(engine.books)}
+            if market_data is not None:
+                books['market_data'] = market_data.stats
+        if flow is not None:
+            books['flow'] = dict(flow.counts)
+        return dict(stats, **books,
+                    reports_per_write=round(stats['reports'] / stats['writes'], 1) if stats['writes'] else 0)
+
+def log_stats(interval):
+    while True:
+        time.sleep(interval)
+        logging.info(f'Market Simulator stats: {simulator_stats()}')
+
 def handle_client(conn, addr):
     logging.debug(f'Connected by {addr}')
+    with book_lock:
+        stats['connections'] += 1
+        stats['accepted'] += 1
+    sample_sockets()
     try:
-        color = "red"
-        while True:
-            data = conn.recv(1024)
-            if not data:
-                break
-            logging.debug(f'Received order: {data.decode("utf-8")}')
-            fill_message = f'fill 1 {color}'
-            color = "blue" if color == "red" else "red"
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((HOST, PORT_SEND))
-                s.sendall(fill_message.encode('utf-8'))
-                logging.debug(f'Sent fill message: {fill_message}')
+        data = conn.recv(65536)
+        if data.startswith(b'8=FIX'):
+            handle_fix_client(conn, addr, data)
+        else:
+            handle_text_client(conn, data)
     except Exception as e:
         logging.error(f'Exception in handling client: {e}')
     finally:
         conn.close()
+        with book_lock:
+            stats['connections'] -= 1
+
+def handle_text_client(conn, data):
+    participant = TextParticipant(conn)
+    parser = FrameParser()
+    try:
+        while data:
+            with book_lock:
+                for frame in parser.feed(data):
+                    handle_text_message(participant, frame.decode('utf-8'))
+                end_cycle(participant)
+            data = conn.recv(65536)
+    finally:
+        with book_lock:
+            participant.conn = None
+            cancel_all(participant)
+            end_cycle(participant)
+
+def handle_text_message(participant, text):
+    kind, fields = parse_message(text)
+    order_id = fields.get('id')
+    if kind == 'order':
+        symbol = fields.get('sym') or fields.get('args', ['red'])[0]
+        side = fields.get('side') if fields.get('side') in (BUY, SELL) else BUY
+        quantity = parse_quantity(fields.get('qty', '1'))
+        price = parse_price(fields['px']) if fields.get('px') else None
+        if quantity is None or (fields.get('px') and price is None):
+            participant.reject(order_id, 'bad_qty' if quantity is None else 'bad_px')
+            return
+        submit(participant, order_id, symbol, side, quantity, price, fields.get('tif', DAY))
+    elif kind == 'cancel' and order_id is not None:
+        cancel(participant, order_id, fields.get('sym'), None,
+               lambda reason: participant.cancel_reject(order_id, 1, reason))
+    elif kind == 'replace' and order_id is not None:
+        quantity = parse_quantity(fields['qty']) if fields.get('qty') else None
+        price = parse_price(fields['px']) if fields.get('px') else None
+        if (fields.get('qty') and quantity is None) or (fields.get('px') and price is None):
+            participant.cancel_reject(order_id, 2, 'bad_qty' if fields.get('qty') and quantity is None else 'bad_px')
+            return
+        replace(participant, order_id, order_id, quantity, price, fields.get('sym'), None,
+                lambda reason: participant.cancel_reject(order_id, 2, reason))
+    else:
+        logging.debug(f'Ignoring message: {text}')
+
+def fix_participant_for(sender):
+    participant = fix_participants.get(sender)
+    if participant is None:
+        store = MessageStore(STORE_DIR, f'{SENDER_COMP_ID}-{sender}')
+        session = FixSession(SENDER_COMP_ID, sender, store, dictionary=dictionary)
+        participant = fix_participants[sender] = FixParticipant(session)
+    return participant
+
+def handle_fix_client(conn, addr, data):
+    while (sender := peek_sender(data)) is None:
+        more = conn.recv(65536)
+        if not more:
+            return
+        data += more
+    with book_lock:
+        participant = fix_participant_for(sender)
+        participant.conn = conn
+        session = participant.session
+        session.connected(initiator=False)
+    conn.settimeout(TIMER_INTERVAL)
+    logging.info(f'FIX session {sender} connected from {addr}')
+    try:
+        while data:
+            with book_lock:
+                for message in session.on_data(data):
+                    handle_fix_message(participant, message)
+                end_cycle(participant)
+            if session.logged_out:
+                break
+            data = None
+            while data is None:
+                try:
+                    data = conn.recv(65536)
+                except socket.timeout:
+                    with book_lock:
+                        if not session.check_timers():
+                            return
+                        participant.flush()
+    except FixError as e:
+        logging.error(f'FIX session {sender}: {e}')
+    finally:
+        with book_lock:
+            if participant.conn is conn:
+                participant.conn = None
+            session.disconnected()
+
+def handle_fix_message(participant, message):
+    msg_type = message.msg_type
+    if msg_type == NEW_ORDER_SINGLE:
+        ord_type = message.get(ORD_TYPE)
+        price = message.get(PRICE)
+        if ord_type == LIMIT and price is None:
+            participant.session.execution_report('NONE', message.get(CL_ORD_ID), f'E{next(exec_ids)}', b'8', b'8',
+                                                 message.get(SYMBOL), SIDE_NAMES.get(message.get(SIDE), BUY), 0, 0,
+                                                 text='limit order without a price')
+            return
+        submit(participant, message.get_str(CL_ORD_ID), message.get_str(SYMBOL),
+               SIDE_NAMES.get(message.get(SIDE), BUY), message.get_int(ORDER_QTY, 1),
+               None if ord_type == MARKET or price is None else float(price),
+               TIME_IN_FORCE_NAMES.get(message.get(TIME_IN_FORCE), DAY))
+    elif msg_type == ORDER_CANCEL_REQUEST:
+        cl_ord_id, orig_cl_ord_id = message.get_str(CL_ORD_ID), message.get_str(ORIG_CL_ORD_ID)
+        cancel(participant, orig_cl_ord_id, message.get_str(SYMBOL), (cl_ord_id, orig_cl_ord_id),
+               lambda reason: participant.cancel_reject(message, b'1', reason))
+    elif msg_type == ORDER_CANCEL_REPLACE_REQUEST:
+        price = message.get(PRICE)
+        cl_ord_id, orig_cl_ord_id = message.get_str(CL_ORD_ID), message.get_str(ORIG_CL_ORD_ID)
+        replace(participant, orig_cl_ord_id, cl_ord_id, message.get_int(ORDER_QTY),
+                None if price is None else float(price), message.get_str(SYMBOL), (cl_ord_id, orig_cl_ord_id),
+                lambda reason: participant.cancel_reject(message, b'2', reason))
+    else:
+        logging.debug(f'Ignoring FIX message: {message}')
+
+def flow_symbol_list(spec):
+    """--flow-symbols: a comma-separated list, or a count N for SYM0 to SYM<N-1>."""
+    if spec.isdigit():
+        return [f'SYM{n}' for n in range(int(spec))]
+    return [symbol for symbol in spec.split(',') if symbol]
 
-def start_server():
+def start_server(port=PORT_RECEIVE, house_levels=HOUSE_LEVELS, house_size=HOUSE_SIZE, stats_interval=STATS_INTERVAL,
+                 shards=0, flow_rate=0, flow_symbols=FLOW_SYMBOLS, flow_seed=FLOW_SEED, publish=True,
+                 market_data_port=MCAST_PORT):
+    global router, flow
+    house.levels = house_levels
+    house.size = house_size
+    if shards:
+        supervisor = Supervisor('Market Simulator shards', shards, run_shard, house_levels, house_size,
+                                stats_interval, market_data_port if publish else None, channels=True, channel_type=socket.SOCK_STREAM)
+        supervisor.start()  # before this process starts any thread
+    threading.Thread(target=log_stats, args=(stats_interval,), daemon=True).start()
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, PORT_RECEIVE))
+        s.bind((HOST, port))
         s.listen()
-        logging.info('Market Simulator listening for connections')
+        if shards:
+            router = ShardRouter(supervisor, book_lock, deliver, flush_touched)
+            router.start()
+        elif publish:
+            start_market_data(market_data_port)
+        if publish:
+            threading.Thread(target=MarketDataPublisher(port=market_data_port).heartbeat, name='market data heartbeat', daemon=True).start()
+        if flow_rate:
+            generator = OrderFlow(flow_symbol_list(flow_symbols), flow_rate, flow_seed, REFERENCE_PRICE, TICK)
+            flow = BackgroundFlow(generator)
+            threading.Thread(target=flow.run, name='order flow', daemon=True).start()
+            logging.info(f'Background order flow: {flow_rate} orders/s in {flow_symbols} (seed {flow_seed})')
+        logging.info(f'Market Simulator listening for connections{f" with {shards} shards" if shards else ""}')
         while True:
             conn, addr = s.accept()
             thread = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
             thread.start()
 
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser(description="Market Simulator")
+    parser.add_argument("--port", type=int, default=PORT_RECEIVE, help="port to accept the FIX Engine on")
+    parser.add_argument("--house-levels", type=int, default=HOUSE_LEVELS,
+                        help="house price levels per side seeded in each new book (0 for none)")
+    parser.add_argument("--house-size", type=int, default=HOUSE_SIZE, help="quantity of each house level")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL, help="seconds between stats log lines")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="split the books by symbol across this many matching processes (0: match in this one)")
+    parser.add_argument("--flow-rate", type=float, default=0,
+                        help="background orders/sec the simulator generates and trades itself (0: none; needs numpy)")
+    parser.add_argument("--flow-symbols", default=FLOW_SYMBOLS,
+                        help="symbols of the background flow: comma-separated, or a count N for SYM0..SYM<N-1>")
+    parser.add_argument("--flow-seed", type=int, default=FLOW_SEED, help="seed that makes the background flow repeat")
+    parser.add_argument("--market-data", action=argparse.BooleanOptionalAction, default=True,
+                        help="publish quotes and trades from the books on the multicast feed")
+    parser.add_argument("--market-data-port", type=int, default=MCAST_PORT,
+                        help="multicast port of the feed, one per simulator on a host")
+    args = parser.parse_args()
+    start_server(args.port, args.house_levels, args.house_size, args.stats_interval, args.shards,
+                 args.flow_rate, args.flow_symbols, args.flow_seed, args.market_data, args.market_data_port)
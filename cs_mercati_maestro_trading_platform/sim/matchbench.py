@@ -0,0 +1,164 @@
+import argparse
+import math
+import random
+import time
+
+from matching import BUY, FOK, IOC, SELL, MatchingEngine
+from orderstore import ITEM_BYTES
+
+"""
+Matching Engine Benchmark
+-------------------------
+Throughput of matching.py in orders/sec, against books with realistic depth: every symbol is
+seeded with LEVELS price levels a side around a mid of 100.00, ORDERS_PER_LEVEL orders each, before
+a case starts. Cases:
+
+- add: passive limit orders that rest inside the seeded range (no match)
+- cancel: passive adds and cancels of random resting orders, half each, so the depth holds
+- aggress: marketable limit orders that take one or a few levels, with partial fills
+- mixed: a flow of 60% passive adds, 25% cancels, 8% marketable limits, 3% market, 2% IOC,
+  1% FOK and 1% replaces
+
+The order flow is generated up front from a fixed seed, so only the engine is timed.
+
+--resting N instead fills the books with N passive orders (the OrderStore preallocated for
+them), reports the memory they take, then cancels them all in a scattered order: the insert and
+cancel rates at that depth.
+
+Usage:
+    python3 matchbench.py --count 200000 --symbols 10
+    python3 matchbench.py --resting 10000000 --symbols 1000
+"""
+
+LEVELS = 50  # Price levels per side at the start of a case
+ORDERS_PER_LEVEL = 20
+TICK = 0.01
+MID = 100.0
+SEED = 45
+
+
+def price_at(ticks):
+    return round(MID + ticks * TICK, 2)
+
+
+def seed_books(engine, symbols, levels, orders_per_level, rng):
+    resting = []
+    for symbol in symbols:
+        for level in range(1, levels + 1):
+            for _ in range(orders_per_level):
+                client_id = len(resting)
+                engine.submit(None, client_id, symbol, SELL, rng.randint(1, 10) * 100, price_at(level))
+                resting.append(client_id)
+                client_id = len(resting)
+                engine.submit(None, client_id, symbol, BUY, rng.randint(1, 10) * 100, price_at(-level))
+                resting.append(client_id)
+    return resting
+
+
+def make_flow(kind, count, symbols, levels, resting, rng):
+    """A list of (operation, arguments) for one case."""
+    flow = []
+    next_id = len(resting)
+    mix = {'add': (1.0,), 'cancel': (0.5, 1.0), 'aggress': (0, 0, 1.0),
+           'mixed': (0.60, 0.85, 0.93, 0.96, 0.98, 0.99, 1.0)}[kind]
+    for _ in range(count):
+        draw = rng.random()
+        symbol = rng.choice(symbols)
+        side = rng.choice((BUY, SELL))
+        sign = -1 if side == BUY else 1  # passive ticks are below the mid for a buy
+        quantity = rng.randint(1, 10) * 100
+        if draw < mix[0]:
+            flow.append(('submit', (None, next_id, symbol, side, quantity, price_at(sign * rng.randint(1, levels)))))
+        elif draw < mix[1]:
+            # Swap-remove, so each order is cancelled at most once
+            index = rng.randrange(len(resting))
+            resting[index], resting[-1] = resting[-1], resting[index]
+            flow.append(('cancel', (None, resting.pop())))
+            continue
+        elif draw < mix[2]:
+            flow.append(('submit', (None, next_id, symbol, side, quantity * 5, price_at(-sign * rng.randint(1, 3)))))
+        elif draw < mix[3]:
+            flow.append(('submit', (None, next_id, symbol, side, quantity, None)))
+        elif draw < mix[4]:
+            flow.append(('submit', (None, next_id, symbol, side, quantity, price_at(-sign), IOC)))
+        elif draw < mix[5]:
+            flow.append(('submit', (None, next_id, symbol, side, quantity * 20, price_at(-sign * 2), FOK)))
+        else:
+            flow.append(('replace', (None, rng.choice(resting), next_id, quantity,
+                                     price_at(sign * rng.randint(1, levels)))))
+        resting.append(next_id)
+        next_id += 1
+    return flow
+
+
+def run_case(kind, count, symbols, levels, orders_per_level):
+    rng = random.Random(SEED)
+    fills = []
+    engine = MatchingEngine(lambda event, order, quantity, price: event == 'fill' and fills.append(quantity))
+    resting = seed_books(engine, symbols, levels, orders_per_level, rng)
+    depth = engine.working()
+    flow = make_flow(kind, count, symbols, levels, resting, rng)
+    operations = {'submit': engine.submit, 'cancel': engine.cancel, 'replace': engine.replace}
+    fills.clear()
+    started = time.perf_counter()
+    for operation, arguments in flow:
+        operations[operation](*arguments)
+    seconds = time.perf_counter() - started
+    print(f'{kind:<8} {count / seconds:>12,.0f} orders/s  ({seconds / count * 1e6:.2f} us/order)  '
+          f'{depth:,} orders resting before, {engine.working():,} after, {len(fills):,} fills')
+    return round(count / seconds)
+
+
+def rss_bytes():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def run_resting(count, symbols, levels):
+    """Insert count resting orders, report their memory, then cancel them all."""
+    before = rss_bytes()
+    engine = MatchingEngine(capacity=count)
+    prices = [price_at(level) for level in range(1, levels + 1)] + [price_at(-level) for level in range(1, levels + 1)]
+    sides = [SELL] * levels + [BUY] * levels
+    started = time.perf_counter()
+    for n in range(count):
+        engine.submit(None, n, symbols[n % len(symbols)], sides[n % (2 * levels)], 100, prices[n % (2 * levels)])
+    seconds = time.perf_counter() - started
+    used = rss_bytes() - before
+    print(f'insert   {count / seconds:>12,.0f} orders/s  ({seconds / count * 1e6:.2f} us/order)  '
+          f'{engine.working():,} resting in {len(symbols):,} books x {2 * levels} levels')
+    print(f'memory   store {engine.store.nbytes() / 2**20:,.0f} MiB ({engine.store.nbytes() / count:.0f} B/order: {ITEM_BYTES} of columns + index), '
+          f'process +{used / 2**20:,.0f} MiB ({used / count:.0f} B/order)')
+    # Visit every order once in a scattered order: a stride coprime with count
+    stride = next(step for step in range(count // 3 + 1, count) if math.gcd(step, count) == 1) if count > 2 else 1
+    started = time.perf_counter()
+    n = 0
+    for _ in range(count):
+        engine.cancel(None, n)
+        n = (n + stride) % count
+    seconds = time.perf_counter() - started
+    print(f'cancel   {count / seconds:>12,.0f} orders/s  ({seconds / count * 1e6:.2f} us/order)  '
+          f'{engine.working():,} left')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching engine benchmark")
+    parser.add_argument("--count", type=int, default=200000, help="orders per case")
+    parser.add_argument("--symbols", type=int, default=10, help="order books")
+    parser.add_argument("--levels", type=int, default=LEVELS, help="price levels per side at the start")
+    parser.add_argument("--orders-per-level", type=int, default=ORDERS_PER_LEVEL, help="orders per level at the start")
+    parser.add_argument("--resting", type=int, help="only measure memory and insert/cancel with this many resting orders")
+    args = parser.parse_args()
+    symbols = [f'SYM{n}' for n in range(args.symbols)]
+    if args.resting:
+        run_resting(args.resting, symbols, args.levels)
+        return
+    for kind in ('add', 'cancel', 'aggress', 'mixed'):
+        run_case(kind, args.count, symbols, args.levels, args.orders_per_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+import heapq
+import itertools
+import math
+import time
+
+from orderstore import MAX_QUANTITY, NONE, SIDES, SIDE_CODES, OrderStore
+
+"""
+Matching Engine
+---------------
+Per-symbol limit order books with price-time priority, for the Market Simulator.
+
+- Orders: limit or market (price None), time in force DAY/GTC (the rest of a limit order rests
+  on the book), IOC (the rest is cancelled) or FOK (filled in full at once, or not at all).
+  Fills are at the resting order's price, possibly partial on either side.
+- Orders are keyed by (owner, client ID): the owner is opaque to the engine (whoever gets the
+  order's execution reports) and client IDs only need to be unique per owner. Cancel and replace
+  find an order through that one index, kept in the store, so a cancel is O(1). A replace that only lowers the
+  quantity keeps the order's place in the queue; one that changes the price or raises the
+  quantity goes to the back, and may trade.
+- A book side keeps a dict of price levels and a heap of their prices: the best level is the top
+  of the heap, so a match costs O(log levels) per level it takes liquidity from. Levels that
+  empty are dropped from the dict and their heap entries skipped when they reach the top. Each
+  level is a FIFO doubly linked list of its orders, so an order leaves it in O(1) from anywhere.
+- Orders live in an OrderStore (see orderstore.py): array columns indexed by slot, with the
+  level lists linked through its prev/next columns, so a deep book is a few arrays rather than
+  one Python object per order. The listener gets an Order, a view of the slot that is only valid
+  during the call.
+
+Every event is passed to the listener as it happens, as listener(kind, order, quantity, price),
+so the order's filled/remaining quantities are current when the caller builds a report from it:
+
+    'new', order, 0, None                order accepted
+    'fill', order, quantity, price       one execution, for each side of every match
+    'cancelled', order, quantity, None   quantity no longer working (cancel, IOC/market rest, FOK kill)
+    'replaced', order, 0, None           cancel/replace applied
+    'reject', order, 0, reason           order not accepted
+
+A trades(book, quantity, price, side) hook, if set, is also called once per execution (after both
+fills), side being the incoming order's: the prints of a market data feed.
+
+See matchbench.py for throughput at realistic book depth.
+"""
+
+BUY = 'buy'
+SELL = 'sell'
+DAY = 'day'
+GTC = 'gtc'
+IOC = 'ioc'
+FOK = 'fok'
+TIMES_IN_FORCE = (DAY, GTC, IOC, FOK)
+
+
+class Order:
+    """A view of one order in the store, for the listener."""
+
+    __slots__ = ('store', 'slot')
+
+    def __init__(self, store, slot):
+        self.store = store
+        self.slot = slot
+
+    @property
+    def order_id(self):
+        return self.store.order_ids[self.slot]
+
+    @property
+    def owner(self):
+        return self.store.owner(self.slot)
+
+    @property
+    def client_id(self):
+        return self.store.client_id(self.slot)
+
+    @property
+    def symbol(self):
+        return self.store.symbol_names[self.store.symbols[self.slot]]
+
+    @property
+    def side(self):
+        return SIDES[self.store.sides[self.slot]]
+
+    @property
+    def price(self):
+        price = self.store.prices[self.slot]
+        return None if math.isnan(price) else price
+
+    @property
+    def quantity(self):
+        return self.store.quantities[self.slot]
+
+    @property
+    def remaining(self):
+        return self.store.remaining[self.slot]
+
+    @property
+    def filled(self):
+        return self.store.quantities[self.slot] - self.store.remaining[self.slot]
+
+    @property
+    def average_price(self):
+        filled = self.filled
+        return self.store.notional[self.slot] / filled if filled else 0.0
+
+    @property
+    def timestamp(self):
+        return self.store.timestamps[self.slot]
+
+    def __repr__(self):
+        return (f'Order({self.client_id} {self.side} {self.remaining}/{self.quantity} {self.symbol} '
+                f'@ {self.price or "MKT"})')
+
+
+class PriceLevel:
+    """Orders resting at one price, oldest first, linked through the store's prev/next columns."""
+
+    __slots__ = ('price', 'head', 'tail', 'quantity', 'count')
+
+    def __init__(self, price):
+        self.price = price
+        self.head = self.tail = NONE
+        self.quantity = 0
+        self.count = 0
+
+    def append(self, store, slot):
+        store.prevs[slot], store.nexts[slot] = self.tail, NONE
+        if self.tail == NONE:
+            self.head = slot
+        else:
+            store.nexts[self.tail] = slot
+        self.tail = slot
+        self.quantity += store.remaining[slot]
+        self.count += 1
+
+    def remove(self, store, slot):
+        prev, next_ = store.prevs[slot], store.nexts[slot]
+        if prev == NONE:
+            self.head = next_
+        else:
+            store.nexts[prev] = next_
+        if next_ == NONE:
+            self.tail = prev
+        else:
+            store.prevs[next_] = prev
+        self.quantity -= store.remaining[slot]
+        self.count -= 1
+
+
+class BookSide:
+    def __init__(self, side):
+        self.side = side
+        self.sign = -1 if side == BUY else 1  # heap keys: the best price is the smallest key
+        self.levels = {}  # price -> PriceLevel
+        self.heap = []
+        self.heaped = set()  # prices with an entry in the heap, live or not
+
+    def best(self):
+        heap, levels = self.heap, self.levels
+        while heap:
+            price = heap[0] * self.sign
+            level = levels.get(price)
+            if level is not None:
+                return level
+            heapq.heappop(heap)
+            self.heaped.discard(price)
+        return None
+
+    def level_for(self, price):
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = PriceLevel(price)
+            if price not in self.heaped:
+                heapq.heappush(self.heap, price * self.sign)
+                self.heaped.add(price)
+        return level
+
+    def remove(self, store, slot):
+        level = self.levels[store.prices[slot]]
+        level.remove(store, slot)
+        if not level.count:
+            del self.levels[level.price]
+
+    def crosses(self, price, limit):
+        """True if a resting price on this side is acceptable to an opposite order limited at limit."""
+        return limit is None or (price <= limit if self.side == SELL else price >= limit)
+
+    def available(self, limit):
+        """Quantity an opposite order limited at limit could take (for FOK)."""
+        return sum(level.quantity for price, level in self.levels.items() if self.crosses(price, limit))
+
+    def depth(self, count):
+        """The best count levels as [(price, quantity, orders)]."""
+        prices = sorted(self.levels, reverse=self.side == BUY)[:count]
+        return [(price, self.levels[price].quantity, self.levels[price].count) for price in prices]
+
+
+class OrderBook:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = BookSide(BUY)
+        self.asks = BookSide(SELL)
+        self.sides = (self.bids, self.asks)  # by side code
+        self.trades = 0
+        self.volume = 0
+
+    def side(self, side):
+        return self.bids if side == BUY else self.asks
+
+    def opposite(self, side):
+        return self.asks if side == BUY else self.bids
+
+    def top(self):
+        """(bid, bid size, ask, ask size), None for an empty side."""
+        bid, ask = self.bids.best(), self.asks.best()
+        return (bid.price if bid else None, bid.quantity if bid else 0,
+                ask.price if ask else None, ask.quantity if ask else 0)
+
+
+def ignore(kind, order, quantity, price):
+    pass
+
+
+class MatchingEngine:
+    def __init__(self, listener=ignore, capacity=None, trades=None):
+        self.listener = listener
+        self.trades = trades
+        self.store = OrderStore() if capacity is None else OrderStore(capacity)
+        self.books = {}  # symbol -> OrderBook
+        self.order_ids = itertools.count(1)
+        self.stats = {'orders': 0, 'cancels': 0, 'replaces': 0, 'fills': 0, 'rejects': 0}
+
+    def book(self, symbol):
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = OrderBook(symbol)
+        return book
+
+    def event(self, kind, slot, quantity, price):
+        self.listener(kind, Order(self.store, slot), quantity, price)
+
+    def submit(self, owner, client_id, symbol, side, quantity, price=None, time_in_force=DAY):
+        """Enter an order. price None is a market order."""
+        self.stats['orders'] += 1
+        reason = None
+        if side not in SIDE_CODES:
+            reason = f'bad side {side}'
+        elif not 0 < quantity <= MAX_QUANTITY:
+            reason = f'bad quantity {quantity}'
+        elif price is not None and not 0 < price < math.inf:  # NaN stands for no price in the store
+            reason = f'bad price {price}'
+        elif time_in_force not in TIMES_IN_FORCE:
+            reason = f'bad time in force {time_in_force}'
+        elif self.store.find(owner, client_id) != NONE:
+            reason = f'duplicate order {client_id}'
+        store = self.store
+        # A rejected order is stored too, for the listener: only with a side and quantity that fit
+        slot = store.allocate(next(self.order_ids), owner, client_id, symbol, side if side in SIDE_CODES else BUY,
+                              quantity if 0 < quantity <= MAX_QUANTITY else 0, price, time.time_ns())
+        if reason is not None:
+            self.stats['rejects'] += 1
+            self.event('reject', slot, 0, reason)
+            store.free(slot)
+            return
+        self.event('new', slot, 0, None)
+        book = self.book(symbol)
+        if time_in_force == FOK and book.opposite(side).available(price) < quantity:
+            self.expire(slot)
+        else:
+            self.match(book, slot, price)
+            if store.remaining[slot] and (price is None or time_in_force in (IOC, FOK)):
+                self.expire(slot)
+        if store.remaining[slot]:
+            self.rest(book, slot)
+        else:
+            store.free(slot)
+
+    def match(self, book, slot, limit):
+        store = self.store
+        remaining = store.remaining
+        opposite = book.sides[1 - store.sides[slot]]
+        side = SIDES[store.sides[slot]]
+        while remaining[slot]:
+            level = opposite.best()
+            if level is None or not opposite.crosses(level.price, limit):
+                break
+            price = level.price
+            resting = level.head
+            while resting != NONE and remaining[slot]:
+                quantity = min(remaining[slot], remaining[resting])
+                following = store.nexts[resting]
+                book.trades += 1
+                book.volume += quantity
+                done = quantity == remaining[resting]
+                if done:
+                    level.remove(store, resting)
+                    store.remove_from_index(resting)
+                else:
+                    level.quantity -= quantity
+                self.execute(resting, quantity, price)
+                self.execute(slot, quantity, price)
+                if self.trades is not None:
+                    self.trades(book, quantity, price, side)
+                if done:
+                    store.free(resting)
+                resting = following
+            if not level.count:
+                del opposite.levels[price]
+
+    def execute(self, slot, quantity, price):
+        self.store.remaining[slot] -= quantity
+        self.store.notional[slot] += quantity * price
+        self.stats['fills'] += 1
+        self.event('fill', slot, quantity, price)
+
+    def expire(self, slot):
+        """Report the rest of an order cancelled. The caller unlinks and frees it."""
+        quantity = self.store.remaining[slot]
+        # Cancelled quantity no longer counts as ordered, so filled = quantity - remaining holds
+        self.store.quantities[slot] -= quantity
+        self.store.remaining[slot] = 0
+        self.event('cancelled', slot, quantity, None)
+
+    def rest(self, book, slot):
+        store = self.store
+        book.sides[store.sides[slot]].level_for(store.prices[slot]).append(store, slot)
+        store.add_to_index(slot)
+
+    def unlink(self, slot):
+        store = self.store
+        self.book(store.symbol_names[store.symbols[slot]]).sides[store.sides[slot]].remove(store, slot)
+
+    def cancel(self, owner, client_id):
+        """Cancel a working order. Returns False if the owner has no such order working."""
+        slot = self.store.find(owner, client_id)
+        if slot == NONE:
+            return False
+        self.cancel_slot(slot)
+        return True
+
+    def cancel_slot(self, slot):
+        self.stats['cancels'] += 1
+        self.store.remove_from_index(slot)
+        self.unlink(slot)
+        self.expire(slot)
+        self.store.free(slot)
+
+    def cancel_all(self, owner):
+        """Cancel every working order of an owner."""
+        store = self.store
+        for slot in store.owner_slots(owner):
+            if store.find(owner, store.client_id(slot)) == slot:
+                self.cancel_slot(slot)
+
+    def replace(self, owner, client_id, new_client_id, quantity=None, price=None):
+        """Change the quantity and/or price of a working order, known as new_client_id from now on.
+
+        quantity is the new total, including what has filled; down to what has filled, the order
+        is cancelled. Returns False if the owner has no such order working. Raises ValueError if
+        new_client_id is taken by another working order, quantity is too large, or price is not a
+        positive finite number.
+        """
+        store = self.store
+        slot = store.find(owner, client_id)
+        if slot == NONE:
+            return False
+        if new_client_id != client_id and store.find(owner, new_client_id) != NONE:
+            raise ValueError(f'duplicate order {new_client_id}')
+        if quantity is not None and quantity > MAX_QUANTITY:
+            raise ValueError(f'bad quantity {quantity}')
+        if price is not None and not 0 < price < math.inf:
+            raise ValueError(f'bad price {price}')
+        self.stats['replaces'] += 1
+        old_quantity, old_price = store.quantities[slot], store.prices[slot]
+        filled = old_quantity - store.remaining[slot]
+        quantity = old_quantity if quantity is None else quantity
+        price = old_price if price is None else price
+        store.remove_from_index(slot)
+        store.set_client_id(slot, new_client_id)
+        if quantity <= filled:
+            self.unlink(slot)
+            self.expire(slot)
+            store.free(slot)
+            return True
+        if price == old_price and quantity <= old_quantity:
+            # Smaller at the same price: keeps its place
+            reduction = old_quantity - quantity
+            book = self.book(store.symbol_names[store.symbols[slot]])
+            book.sides[store.sides[slot]].levels[price].quantity -= reduction
+            store.remaining[slot] -= reduction
+            store.quantities[slot] = quantity
+            store.add_to_index(slot)
+            self.event('replaced', slot, 0, None)
+            return True
+        self.unlink(slot)
+        store.prices[slot] = price
+        store.quantities[slot] = quantity
+        store.remaining[slot] = quantity - filled
+        store.timestamps[slot] = time.time_ns()
+        self.event('replaced', slot, 0, None)
+        book = self.book(store.symbol_names[store.symbols[slot]])
+        self.match(book, slot, price)
+        if store.remaining[slot]:
+            self.rest(book, slot)
+        else:
+            store.free(slot)
+        return True
+
+    def working(self):
+        return self.store.indexed
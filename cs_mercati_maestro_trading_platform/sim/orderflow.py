@@ -0,0 +1,157 @@
+import math
+
+"""
+Order Flow Generator
+--------------------
+Background order flow for the market simulator (marketsimulator.py --flow-rate), so strategies
+trade against moving, populated books without an outside feed. Events are generated with NumPy in
+batches of about BATCH_SIZE at a time, never one random draw per event:
+
+- Arrivals: a Hawkes process per symbol, where every event raises the chance of more in the same
+  symbol (each has a Poisson(BRANCHING) number of children, DECAY/s apart on average), so activity
+  comes in bursts; BRANCHING 0 is a plain Poisson process. Built from its cluster representation,
+  one generation of children at a time for the whole batch. Children that fall after the batch
+  are carried into the next one. The long-run rate over all symbols is the rate asked for.
+- Mid prices: a geometric Brownian motion per symbol (annualised DRIFT and VOLATILITY, a year being
+  YEAR_SECONDS of trading) plus Merton jumps (JUMP_RATE per second, normal log sizes), sampled
+  at each of the symbol's events.
+- Orders: passive DAY limits (PASSIVE_SHARE) a geometric number of ticks behind the mid,
+  marketable IOC limits (MARKETABLE_SHARE) a few ticks through it, and cancels of the symbol's
+  oldest working flow order (the rest). Sizes are a geometric number of LOT shares.
+- Reproducible: everything is drawn from one numpy Generator, so the same seed, symbols and
+  parameters give the same events.
+
+numpy is only imported when a generator is created, so the simulator runs without it when there
+is no background flow.
+"""
+
+BATCH_SIZE = 100000  # Events per batch, on average
+BRANCHING = 0.5  # Mean children per event (0: Poisson arrivals)
+DECAY = 5.0  # Rate at which an event's excitement wears off, per second
+YEAR_SECONDS = 252 * 6.5 * 3600
+DRIFT = 0.0
+VOLATILITY = 0.3
+JUMP_RATE = 0.001  # Jumps per second per symbol
+JUMP_MEAN = 0.0  # Of the log jump size
+JUMP_STD = 0.01
+PASSIVE_SHARE = 0.6
+MARKETABLE_SHARE = 0.25
+PASSIVE_DISTANCE = 0.4  # Geometric p of the ticks behind the mid (mean 1/p - 1)
+MARKETABLE_DISTANCE = 0.7
+LOT = 100
+LOT_SIZE = 0.35  # Geometric p of the lots in an order
+PASSIVE, MARKETABLE, CANCEL = range(3)  # Event kinds
+
+
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Background order flow requires numpy (pip install numpy)")
+    return numpy
+
+
+class OrderFlow:
+    """Generates batches of (times, symbols, kinds, sides, quantities, prices) arrays.
+
+    times are seconds since the start, symbols index into the list given, sides are 0 buy / 1 sell
+    and prices are on the tick grid (market mid for a cancel, which has none).
+    """
+
+    def __init__(self, symbols, rate, seed, price=100.0, tick=0.01, batch_size=BATCH_SIZE,
+                 branching=BRANCHING, decay=DECAY, volatility=VOLATILITY, drift=DRIFT):
+        np = self.np = load_numpy()
+        if not 0 <= branching < 1:
+            raise ValueError(f'branching ratio {branching} must be in [0, 1) for the flow to stay finite')
+        self.symbols = list(symbols)
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+        self.tick = tick
+        self.window = batch_size / rate  # seconds of flow per batch
+        self.branching = branching
+        self.decay = decay
+        self.immigration = rate * (1 - branching)  # a cluster holds 1 / (1 - branching) events on average
+        variance = volatility ** 2 / YEAR_SECONDS
+        jump_compensation = JUMP_RATE * (math.exp(JUMP_MEAN + JUMP_STD ** 2 / 2) - 1)
+        self.drift = drift / YEAR_SECONDS - variance / 2 - jump_compensation  # of the log mid, per second
+        self.diffusion = math.sqrt(variance)
+        self.log_mids = np.full(len(self.symbols), math.log(price))
+        self.last_times = np.zeros(len(self.symbols))
+        self.start = 0.0
+        self.carried_times = np.empty(0)
+        self.carried_symbols = np.empty(0, dtype=np.int64)
+
+    def next_batch(self):
+        times, symbols = self.arrivals()
+        mids = self.mids(times, symbols)
+        return (times, symbols) + self.orders(mids)
+
+    def arrivals(self):
+        """Event times and symbols in the next window, sorted by time."""
+        np, rng = self.np, self.rng
+        start, end = self.start, self.start + self.window
+        self.start = end
+        count = rng.poisson(self.immigration * self.window)
+        generation_times = np.concatenate((rng.uniform(start, end, count), self.carried_times))
+        generation_symbols = np.concatenate((rng.integers(0, len(self.symbols), count), self.carried_symbols))
+        carried = generation_times >= end
+        self.carried_times, self.carried_symbols = generation_times[carried], generation_symbols[carried]
+        generation_times, generation_symbols = generation_times[~carried], generation_symbols[~carried]
+        all_times, all_symbols = [generation_times], [generation_symbols]
+        while len(generation_times) and self.branching:
+            parents = np.repeat(np.arange(len(generation_times)), rng.poisson(self.branching, len(generation_times)))
+            generation_times = generation_times[parents] + rng.exponential(1 / self.decay, len(parents))
+            generation_symbols = generation_symbols[parents]
+            carried = generation_times >= end
+            self.carried_times = np.concatenate((self.carried_times, generation_times[carried]))
+            self.carried_symbols = np.concatenate((self.carried_symbols, generation_symbols[carried]))
+            generation_times, generation_symbols = generation_times[~carried], generation_symbols[~carried]
+            all_times.append(generation_times)
+            all_symbols.append(generation_symbols)
+        times, symbols = np.concatenate(all_times), np.concatenate(all_symbols)
+        order = np.argsort(times, kind='stable')
+        return times[order], symbols[order]
+
+    def mids(self, times, symbols):
+        """Each symbol's mid at its events, carrying on from where the last batch left it."""
+        np, rng = self.np, self.rng
+        count = len(times)
+        if not count:
+            return np.empty(0)
+        order = np.lexsort((times, symbols))  # by symbol, then time
+        symbols, times = symbols[order], times[order]
+        firsts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])  # where each symbol's run starts
+        previous = np.r_[0.0, times[:-1]]
+        previous[firsts] = self.last_times[symbols[firsts]]
+        elapsed = times - previous
+        jumps = rng.poisson(JUMP_RATE * elapsed)
+        steps = (self.drift * elapsed + self.diffusion * np.sqrt(elapsed) * rng.standard_normal(count)
+                 + jumps * JUMP_MEAN + np.sqrt(jumps) * JUMP_STD * rng.standard_normal(count))
+        walked = np.cumsum(steps)
+        # Restart the running total at each run, from the symbol's last mid
+        before = np.r_[0.0, walked[:-1]][firsts]
+        log_mids = walked + np.repeat(self.log_mids[symbols[firsts]] - before, np.diff(np.r_[firsts, count]))
+        lasts = np.r_[firsts[1:], count] - 1
+        self.log_mids[symbols[lasts]] = log_mids[lasts]
+        self.last_times[symbols[lasts]] = times[lasts]
+        mids = np.empty(count)
+        mids[order] = np.exp(log_mids)
+        return mids
+
+    def orders(self, mids):
+        """Kinds, sides, quantities and prices of orders arriving when the mids are as given."""
+        np, rng = self.np, self.rng
+        count = len(mids)
+        draws = rng.random(count)
+        kinds = np.where(draws < PASSIVE_SHARE, PASSIVE, np.where(draws < PASSIVE_SHARE + MARKETABLE_SHARE,
+                                                                   MARKETABLE, CANCEL)).astype(np.int8)
+        sides = rng.integers(0, 2, count, dtype=np.int8)
+        quantities = rng.geometric(LOT_SIZE, count) * LOT
+        passive = kinds == PASSIVE
+        distance = np.where(passive, rng.geometric(PASSIVE_DISTANCE, count) - 1,
+                            rng.geometric(MARKETABLE_DISTANCE, count))
+        # A buy rests below the mid and takes above it; a sell the other way round
+        below = (sides == 0) == passive
+        ticks = np.where(below, np.floor(mids / self.tick) - distance, np.ceil(mids / self.tick) + distance)
+        prices = np.where(kinds == CANCEL, mids, np.round(np.maximum(ticks, 1) * self.tick, 6))
+        return kinds, sides, quantities, prices
@@ -0,0 +1,224 @@
+import array
+import math
+
+"""
+Order Store
+-----------
+The orders of matching.py kept as a struct of arrays: one preallocated array column per field,
+an order being a slot index into all of them, so an order costs its column bytes (ITEM_BYTES,
+65) and its share of the index, not a Python object with a dict of attributes.
+
+- Columns: order ID, owner index, client ID, price (NaN for a market order), quantity, remaining
+  quantity, notional filled, timestamp, side, symbol index, and the prev/next slots that chain
+  the orders of a price level into a FIFO list (NONE at either end).
+- Owners are interned: the column holds an index into a table of the owners with orders in the
+  store, counted so an owner leaves it with its last order. A client ID that is an int is kept
+  in its column as is; any other (a FIX ClOrdID string) is kept in a dict by slot, so text IDs
+  cost their string and an entry, int IDs nothing beyond the column.
+- Index: (owner, client ID) -> slot of the resting orders, in one open-addressed array of slots
+  (linear probing, deleted entries marked and swept when the array is rebuilt), sized for the
+  store's capacity at under INDEX_LOAD. No Python object is made per order.
+- Free slots are chained through the next column, so a freed slot is reused by the next
+  allocation and the columns only grow (doubling) when every slot is in use.
+- Quantities are 32-bit: MAX_QUANTITY is the largest order the store takes.
+
+See matchbench.py --resting for the memory and insert/cancel rates at 10M orders: 72 B an order
+(the columns and the index), so 10M resting orders take some 685 MiB. The columns hold what a
+report needs (IDs, prices, fills, time); a few hundred MB at 10M would mean dropping some of
+them.
+"""
+
+NONE = -1  # No slot: the end of a list
+MAX_QUANTITY = 2 ** 31 - 1
+SIDES = ('buy', 'sell')  # side codes are indexes into this
+SIDE_CODES = {side: code for code, side in enumerate(SIDES)}
+INITIAL_CAPACITY = 1 << 16  # Slots preallocated by default
+COLUMNS = (('order_ids', 'q'), ('owners', 'i'), ('client_keys', 'q'), ('prices', 'd'), ('quantities', 'i'),
+           ('remaining', 'i'), ('notional', 'd'), ('timestamps', 'q'), ('sides', 'b'), ('symbols', 'i'),
+           ('prevs', 'i'), ('nexts', 'i'))
+ITEM_BYTES = sum(array.array(code).itemsize for _, code in COLUMNS)
+EMPTY, DELETED = -1, -2  # Index entries that hold no slot
+INDEX_LOAD = 0.75  # Live and deleted index entries, as a share of the index, before it is rebuilt
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15  # 2^64 / golden ratio: spreads consecutive IDs over the index
+INT64 = range(-2 ** 63, 2 ** 63)
+
+
+def index_bits(count):
+    """Bits of an index that holds count entries under INDEX_LOAD."""
+    return max(4, math.ceil(math.log2(count / INDEX_LOAD + 1)))
+
+
+class OrderStore:
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        for name, code in COLUMNS:
+            setattr(self, name, array.array(code, bytes(array.array(code).itemsize * capacity)))
+        self.capacity = capacity
+        self.owner_objects = []  # owner index -> owner, None once it has no orders
+        self.owner_indexes = {}  # owner -> owner index
+        self.owner_counts = []  # owner index -> orders in the store
+        self.free_owners = []
+        self.client_names = {}  # slot -> client ID that is not an int
+        self.new_index(index_bits(capacity))
+        self.used = 0  # slots handed out at least once; the ones above are untouched
+        self.free_head = NONE
+        self.free_count = 0
+        self.symbol_names = []  # symbol index -> symbol
+        self.symbol_indexes = {}
+
+    def __len__(self):
+        return self.used - self.free_count
+
+    def symbol_index(self, symbol):
+        index = self.symbol_indexes.get(symbol)
+        if index is None:
+            index = self.symbol_indexes[symbol] = len(self.symbol_names)
+            self.symbol_names.append(symbol)
+        return index
+
+    def allocate(self, order_id, owner, client_id, symbol, side, quantity, price, timestamp):
+        """Store a new order and return its slot. price None is a market order."""
+        slot = self.free_head
+        if slot != NONE:
+            self.free_head = self.nexts[slot]
+            self.free_count -= 1
+        else:
+            if self.used == self.capacity:
+                self.grow()
+            slot = self.used
+            self.used += 1
+        self.order_ids[slot] = order_id
+        self.owners[slot] = self.owner_index(owner)
+        self.set_client_id(slot, client_id)
+        self.symbols[slot] = self.symbol_index(symbol)
+        self.sides[slot] = SIDE_CODES[side]
+        self.prices[slot] = math.nan if price is None else price
+        self.quantities[slot] = self.remaining[slot] = quantity
+        self.notional[slot] = 0.0
+        self.timestamps[slot] = timestamp
+        self.prevs[slot] = self.nexts[slot] = NONE
+        return slot
+
+    def free(self, slot):
+        index = self.owners[slot]
+        self.owner_counts[index] -= 1
+        if not self.owner_counts[index]:
+            del self.owner_indexes[self.owner_objects[index]]
+            self.owner_objects[index] = None
+            self.free_owners.append(index)
+        self.owners[slot] = NONE
+        self.client_names.pop(slot, None)
+        self.nexts[slot] = self.free_head
+        self.free_head = slot
+        self.free_count += 1
+
+    def grow(self):
+        for name, code in COLUMNS:
+            column = getattr(self, name)
+            column.frombytes(bytes(column.itemsize * self.capacity))
+        self.capacity *= 2
+
+    def nbytes(self):
+        """Bytes held by the columns and the index (not the owners or client ID strings)."""
+        return ITEM_BYTES * self.capacity + self.index.itemsize * len(self.index)
+
+    # Owners and client IDs
+
+    def owner_index(self, owner):
+        index = self.owner_indexes.get(owner)
+        if index is None:
+            if self.free_owners:
+                index = self.free_owners.pop()
+                self.owner_objects[index] = owner
+            else:
+                index = len(self.owner_objects)
+                self.owner_objects.append(owner)
+                self.owner_counts.append(0)
+            self.owner_indexes[owner] = index
+        self.owner_counts[index] += 1
+        return index
+
+    def owner(self, slot):
+        return self.owner_objects[self.owners[slot]]
+
+    def client_id(self, slot):
+        if slot in self.client_names:
+            return self.client_names[slot]
+        return self.client_keys[slot]
+
+    def set_client_id(self, slot, client_id):
+        if type(client_id) is int and client_id in INT64:
+            self.client_keys[slot] = client_id
+            self.client_names.pop(slot, None)
+        else:
+            self.client_names[slot] = client_id
+
+    def owner_slots(self, owner):
+        """Every slot in use that holds an order of owner: a scan of the owner column, in C."""
+        index = self.owner_indexes.get(owner)
+        slots = []
+        if index is None:
+            return slots
+        owners, slot = self.owners, 0
+        try:
+            while True:
+                slot = owners.index(index, slot, self.used)
+                slots.append(slot)
+                slot += 1
+        except ValueError:
+            return slots
+
+    # (owner, client ID) index of the resting orders
+
+    def new_index(self, bits):
+        self.index = array.array('i', [EMPTY]) * (1 << bits)
+        self.index_shift = 64 - bits
+        self.index_mask = (1 << bits) - 1
+        self.index_used = 0  # live and deleted entries
+        self.index_limit = int(INDEX_LOAD * len(self.index))
+        self.indexed = 0
+
+    def position(self, owner_index, client_id):
+        return ((hash(client_id) + owner_index) * HASH_MULTIPLIER & 0xFFFFFFFFFFFFFFFF) >> self.index_shift
+
+    def find(self, owner, client_id):
+        """The slot of owner's resting order client_id, or NONE."""
+        owner_index = self.owner_indexes.get(owner)
+        if owner_index is None:
+            return NONE
+        index, mask, owners = self.index, self.index_mask, self.owners
+        position = self.position(owner_index, client_id)
+        while True:
+            slot = index[position]
+            if slot == EMPTY:
+                return NONE
+            if slot >= 0 and owners[slot] == owner_index and self.client_id(slot) == client_id:
+                return slot
+            position = (position + 1) & mask
+
+    def add_to_index(self, slot):
+        """Index a resting order. Its (owner, client ID) must not be indexed already."""
+        if self.index_used >= self.index_limit:
+            self.rebuild_index()
+        index, mask = self.index, self.index_mask
+        position = self.position(self.owners[slot], self.client_id(slot))
+        while index[position] >= 0:
+            position = (position + 1) & mask
+        if index[position] == EMPTY:
+            self.index_used += 1
+        index[position] = slot
+        self.indexed += 1
+
+    def remove_from_index(self, slot):
+        index, mask = self.index, self.index_mask
+        position = self.position(self.owners[slot], self.client_id(slot))
+        while index[position] != slot:
+            position = (position + 1) & mask
+        index[position] = DELETED
+        self.indexed -= 1
+
+    def rebuild_index(self):
+        """Sweep the deleted entries, in an index grown (doubled) if the live ones fill it."""
+        slots = [slot for slot in self.index if slot >= 0]
+        self.new_index(max(index_bits(len(slots) * 4 // 3), 64 - self.index_shift))
+        for slot in slots:
+            self.add_to_index(slot)
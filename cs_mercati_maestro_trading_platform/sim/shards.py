@@ -0,0 +1,203 @@
+import bisect
+import itertools
+import logging
+import marshal
+import queue
+import threading
+import time
+import weakref
+import zlib
+from collections import deque
+from operator import itemgetter
+
+from framing import FrameParser, encode_frame
+
+"""
+Symbol Shards
+-------------
+Splits the market simulator's books across N shard processes (marketsimulator.py --shards N),
+so matching runs on N cores. A symbol lives in one shard, picked by a stable hash of its name
+(shard_for), so each book is only ever touched by one process.
+
+The simulator's main process is the front gateway: it keeps every connection and FIX session,
+turns what they send into commands and routes each to its symbol's shard. A cancel or replace
+without a symbol (text clients send none) goes to every shard and only the one holding the order
+applies it.
+
+- Channels: one Unix stream socket per shard (a workers.Supervisor channel), carrying
+  length-prefixed frames (see framing.py) of marshalled lists. The gateway sends one frame of
+  commands per shard per matching cycle; the shard answers each frame with one frame of entries
+  (sequence number, owner ID, REPORT or RESULT, payload): a REPORT payload is a finished FIX
+  ExecutionReport body or text message, built in the shard; a RESULT ends a cancel or replace
+  (None: applied, False: no such order here, or the reason it was rejected).
+- Ordering: every command gets a sequence number. Shards answer in the order they are sent to,
+  so entries are held until every shard has answered all commands below them, then released in
+  sequence order: each client sees its reports in the order it sent the orders, as with one
+  process.
+- Readers: one thread per shard only reads and decodes its channel, and a merger thread applies
+  what they read under the books lock, so a shard never blocks writing while the gateway waits to
+  write to it.
+- A shard that dies is restarted empty by the supervisor. Its unanswered commands are dropped,
+  their cancels and replaces rejected, and its orders are lost.
+"""
+
+SUBMIT, CANCEL, REPLACE, CANCEL_ALL = range(4)  # Command codes
+REPORT, RESULT = range(2)  # Reply entry kinds
+CHANNEL_FRAME_SIZE = 1 << 26  # Limit on a batch frame: a cycle can take out a deep book
+RECV_SIZE = 1 << 18
+RESTART_POLL = 0.1  # Seconds between checks for a restarted shard's new channel
+SHARD_DOWN = 'shard restarting'
+
+
+def shard_for(symbol, count):
+    """The shard of a symbol: stable across processes and restarts (Python's hash() is salted)."""
+    return zlib.crc32(symbol.encode('utf-8')) % count
+
+
+def serve(channel, handle):
+    """Shard loop: answer each frame of commands with the frame of entries handle(commands) returns."""
+    parser = FrameParser(CHANNEL_FRAME_SIZE)
+    while data := channel.recv(RECV_SIZE):
+        for frame in parser.feed(data):
+            channel.sendall(encode_frame(marshal.dumps(handle(marshal.loads(frame)))))
+
+
+class ShardRouter:
+    """The gateway's end of the shard channels. Everything but the readers runs under lock.
+
+    deliver(owner, payload) is called for each report in command order, then end() after each batch.
+    """
+
+    def __init__(self, supervisor, lock, deliver, end):
+        self.supervisor = supervisor  # a workers.Supervisor with channels=True, channel_type=SOCK_STREAM
+        self.count = len(supervisor.workers)
+        self.lock = lock
+        self.deliver = deliver
+        self.end = end
+        self.owners = weakref.WeakValueDictionary()  # owner ID -> participant, while it is referenced
+        self.seqs = itertools.count(1)
+        self.batches = [[] for _ in range(self.count)]  # commands not sent yet, per shard
+        self.in_flight = [deque() for _ in range(self.count)]  # (first seq, request seqs, channel) per batch sent
+        self.requests = {}  # seq -> [answers due, applied, reason, rejected] of a cancel or replace
+        self.held = []  # entries waiting for the answers to lower sequence numbers
+        self.replies = queue.SimpleQueue()  # (shard, entries or the channel that went down), from the readers
+        self.stats = {'commands': 0, 'batches': 0, 'replies': 0, 'held_high': 0, 'lost': 0}
+
+    def start(self):
+        self.supervisor.start()  # the shards before any of these threads, if the caller has not yet
+        threading.Thread(target=self.supervisor.run, name='shard supervisor', daemon=True).start()
+        for shard in range(self.count):
+            threading.Thread(target=self.read, args=(shard,), name=f'shard {shard} reader', daemon=True).start()
+        threading.Thread(target=self.merge, name='shard merger', daemon=True).start()
+
+    def send(self, symbol, op, owner, args, rejected=None):
+        """Queue a command for the shard of symbol, or every shard if symbol is None.
+
+        For a cancel or replace, rejected(reason) is called if no shard applied it (reason None: no
+        shard had the order).
+        """
+        seq = next(self.seqs)
+        self.owners[owner.owner_id] = owner
+        command = (op, seq, owner.owner_id, owner.fix) + args
+        shards = range(self.count) if symbol is None else (shard_for(symbol, self.count),)
+        for shard in shards:
+            self.batches[shard].append(command)
+        if op != SUBMIT:
+            self.requests[seq] = [len(shards), False, None, rejected]
+        self.stats['commands'] += 1
+
+    def flush(self):
+        """Send each shard the commands queued for it, as one frame."""
+        for shard, batch in enumerate(self.batches):
+            if not batch:
+                continue
+            self.batches[shard] = []
+            requests = [command[1] for command in batch if command[0] != SUBMIT]
+            channel = self.supervisor.workers[shard].channel
+            try:
+                if channel is None:
+                    raise OSError('not started')
+                channel.setblocking(True)  # the supervisor leaves its end non-blocking
+                channel.sendall(encode_frame(marshal.dumps(batch)))
+            except OSError as e:
+                logging.error(f'Shard {shard} is down, dropping {len(batch)} commands: {e}')
+                self.stats['lost'] += len(batch)
+                for seq in requests:
+                    self.answer(seq, SHARD_DOWN)
+                continue
+            self.in_flight[shard].append((batch[0][1], requests, channel))
+            self.stats['batches'] += 1
+
+    def read(self, shard):
+        """Reader thread: queue every frame the shard answers with, across its restarts."""
+        worker = self.supervisor.workers[shard]
+        while True:
+            channel = worker.channel
+            if channel is None:
+                time.sleep(RESTART_POLL)
+                continue
+            parser = FrameParser(CHANNEL_FRAME_SIZE)
+            try:
+                channel.setblocking(True)
+                while data := channel.recv(RECV_SIZE):
+                    for frame in parser.feed(data):
+                        self.replies.put((shard, marshal.loads(frame)))
+            except (OSError, ValueError) as e:
+                logging.error(f'Shard {shard} channel failed: {e}')
+            self.replies.put((shard, channel))
+            while worker.channel is channel:
+                time.sleep(RESTART_POLL)
+
+    def merge(self):
+        """Merger thread: release held entries as the shards answer."""
+        while True:
+            shard, entries = self.replies.get()
+            with self.lock:
+                if not isinstance(entries, list):
+                    self.lost(shard, entries)
+                else:
+                    self.in_flight[shard].popleft()
+                    self.held.extend(entries)
+                    self.stats['replies'] += len(entries)
+                    self.stats['held_high'] = max(self.stats['held_high'], len(self.held))
+                self.release()
+                self.end()
+
+    def lost(self, shard, channel):
+        """Give up on what was sent on a channel that closed (later batches went to its replacement)."""
+        batches = self.in_flight[shard]
+        lost = 0
+        while batches and batches[0][2] is channel:
+            for seq in batches.popleft()[1]:
+                self.answer(seq, SHARD_DOWN)
+            lost += 1
+        logging.error(f'Shard {shard} went down with {lost} batches unanswered')
+
+    def release(self):
+        """Deliver the held entries no unanswered command comes before, in sequence order."""
+        held = self.held
+        held.sort(key=itemgetter(0))  # stable: one shard's entries for a sequence number keep their order
+        watermark = min((batches[0][0] for batches in self.in_flight if batches), default=None)
+        count = len(held) if watermark is None else bisect.bisect_left(held, watermark, key=itemgetter(0))
+        for seq, owner_id, kind, payload in held[:count]:
+            if kind == REPORT:
+                owner = self.owners.get(owner_id)
+                if owner is not None:
+                    self.deliver(owner, payload)
+            else:
+                self.answer(seq, payload)
+        del held[:count]
+
+    def answer(self, seq, result):
+        request = self.requests.get(seq)
+        if request is None:
+            return
+        request[0] -= 1
+        if result is None:
+            request[1] = True
+        elif result is not False:
+            request[2] = result
+        if not request[0]:
+            del self.requests[seq]
+            if not request[1] and request[3] is not None:
+                request[3](request[2])
@@ -0,0 +1,295 @@
+import bisect
+import csv
+import logging
+import time
+
+from messages import SIDES, format_order, parse_price, parse_quantity
+
+"""
+Execution Algorithms
+--------------------
+Parent orders sent to the router (parent id=... sym=... side=... qty=... algo=twap|vwap|pov
+duration=<s> [slices=<n>] [rate=<0-1>] [px=<limit>]) are sliced over time into child orders
+<parent id>.<n>, which the router routes like any other order.
+
+- twap: equal slices at equal intervals over the duration.
+- vwap: slices weighted by a historical intraday volume curve (load_volume_curve()).
+- pov:  every interval, top children up to rate x market volume traded since the parent started
+        (from the trades on the venues' market data feeds, see feeds.py).
+
+A parent is checked field by field before it starts, and a bad one is refused with the reason
+(bad_id, bad_algo, bad_sym, bad_side, bad_qty, bad_px, bad_duration, bad_slices, bad_rate) for the
+router to reject it with. A parent is done when it is filled, or when it sends no more slices and
+every child is filled or over (cancelled, rejected); on_done(parent) is then called, and the router
+reports what became of the rest. A cancelled parent stops slicing and is done once its children
+are out of the market.
+
+Every parent has exactly one pending timer in the router's TimerWheel. Slippage is measured
+against the consolidated mid (or the far touch) at arrival, in basis points, positive = worse.
+A parent that arrives before the book has a quote for its symbol is measured against the price
+of its first child fill instead.
+"""
+
+ALGOS = ('twap', 'vwap', 'pov')
+DEFAULT_DURATION = 600.0  # Seconds
+MAX_DURATION = 86400.0
+DEFAULT_INTERVAL = 10.0  # Seconds between slices when slices= is not given
+MAX_SLICES = 10000
+POV_INTERVAL = 5.0
+DEFAULT_RATE = 0.1  # Share of market volume for pov
+
+# Fraction of daily volume per 30 minute bucket from 09:30 to 16:00: the usual U shape
+DEFAULT_VOLUME_CURVE = [(9.5 + i / 2, w) for i, w in enumerate(
+    [0.130, 0.090, 0.075, 0.065, 0.060, 0.055, 0.055, 0.058, 0.062, 0.068, 0.075, 0.090, 0.117])]
+
+
+def load_volume_curve(path):
+    """Load a volume curve CSV of HH:MM,fraction rows (bucket start, share of daily volume)."""
+    curve = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or not row[0][:1].isdigit():
+                continue
+            hours, minutes = row[0].split(':')
+            curve.append((int(hours) + int(minutes) / 60, float(row[1])))
+    curve.sort()
+    total = sum(weight for _, weight in curve)
+    return [(start, weight / total) for start, weight in curve]
+
+
+def _hour_of_day(timestamp):
+    local = time.localtime(timestamp)
+    return local.tm_hour + local.tm_min / 60 + local.tm_sec / 3600
+
+
+def curve_weights(curve, start, end, slices):
+    """Share of curve volume in each of slices equal intervals of [start, end] (epoch seconds)."""
+    starts = [bucket for bucket, _ in curve]
+    width = (starts[1] - starts[0]) if len(starts) > 1 else 24.0
+    step = (end - start) / slices
+    weights = []
+    for n in range(slices):
+        hour = _hour_of_day(start + (n + 0.5) * step)
+        index = bisect.bisect_right(starts, hour) - 1
+        inside = 0 <= index and hour < starts[index] + width
+        weights.append(curve[index][1] if inside else 0.0)
+    total = sum(weights)
+    if not total:
+        return [1.0 / slices] * slices  # Outside the curve's hours: fall back to TWAP
+    return [weight / total for weight in weights]
+
+
+class ParentOrder:
+    __slots__ = ('order_id', 'conn_id', 'symbol', 'side', 'quantity', 'limit', 'algo', 'start', 'end',
+                 'interval', 'targets', 'slice', 'rate', 'market_volume', 'sent', 'filled', 'notional',
+                 'priced', 'arrival_price', 'children', 'timer', 'lost', 'reason', 'cancelled', 'done')
+
+    def __init__(self, order_id, conn_id, symbol, side, quantity, limit, algo, duration, interval):
+        self.order_id = order_id
+        self.conn_id = conn_id
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.limit = limit
+        self.algo = algo
+        self.start = time.time()
+        self.end = self.start + duration
+        self.interval = interval
+        self.targets = []  # cumulative quantity to have sent after each slice (twap/vwap)
+        self.slice = 0
+        self.rate = 0.0
+        self.market_volume = 0
+        self.sent = 0
+        self.filled = 0
+        self.notional = 0.0  # sum of fill quantity x price, for fills that report a price
+        self.priced = 0  # quantity behind notional
+        self.arrival_price = None
+        self.children = []  # child order IDs
+        self.timer = None
+        self.lost = 0  # quantity of children that ended unfilled (cancelled, rejected)
+        self.reason = None  # of the last child reject
+        self.cancelled = False  # by the client
+        self.done = False
+
+    def slippage_bps(self):
+        if not self.arrival_price or not self.priced:
+            return None
+        average = self.notional / self.priced
+        sign = 1 if self.side == 'buy' else -1
+        return round(sign * (average - self.arrival_price) / self.arrival_price * 10000, 2) or 0.0  # not -0.0
+
+    def summary(self):
+        return {'id': self.order_id, 'algo': self.algo, 'symbol': self.symbol, 'side': self.side,
+                'quantity': self.quantity, 'sent': self.sent, 'filled': self.filled, 'lost': self.lost,
+                'children': len(self.children), 'arrival_price': self.arrival_price,
+                'slippage_bps': self.slippage_bps()}
+
+
+class AlgoEngine:
+    """Slices parent orders. The router provides submit(conn_id, message), cancel_children(conn_id, child_ids)
+    and on_done(parent)."""
+
+    def __init__(self, wheel, book, submit, cancel_children, on_done, volume_curve=None):
+        self.wheel = wheel
+        self.book = book
+        self.submit = submit
+        self.cancel_children = cancel_children
+        self.on_done = on_done
+        self.volume_curve = volume_curve or DEFAULT_VOLUME_CURVE
+        self.parents = {}  # parent ID -> ParentOrder, while working
+        self.child_parents = {}  # child ID -> ParentOrder
+        self.pov_parents = {}  # symbol -> set of working pov ParentOrders
+        self.completed = 0
+
+    def new_parent(self, conn_id, fields):
+        """The ParentOrder of a parent order message, not started. Raises ValueError(reason) on a bad message."""
+        order_id = fields.get('id')
+        if not order_id or order_id in self.parents:
+            raise ValueError('bad_id')
+        algo = fields.get('algo', 'twap')
+        if algo not in ALGOS:
+            raise ValueError('bad_algo')
+        if not fields.get('sym'):
+            raise ValueError('bad_sym')
+        if fields.get('side') not in SIDES:
+            raise ValueError('bad_side')
+        quantity = parse_quantity(fields.get('qty'))
+        if quantity is None:
+            raise ValueError('bad_qty')
+        if 'px' in fields and parse_price(fields['px']) is None:
+            raise ValueError('bad_px')
+        duration = parse_price(fields.get('duration', str(DEFAULT_DURATION)))
+        if duration is None or duration > MAX_DURATION:
+            raise ValueError('bad_duration')
+        if 'slices' in fields:
+            slices = parse_quantity(fields['slices'])
+            if slices is None or slices > MAX_SLICES:
+                raise ValueError('bad_slices')
+        else:
+            slices = max(1, int(duration / DEFAULT_INTERVAL))
+        rate = parse_price(fields.get('rate', str(DEFAULT_RATE)))
+        if algo == 'pov' and (rate is None or rate > 1):
+            raise ValueError('bad_rate')
+        interval = POV_INTERVAL if algo == 'pov' else duration / slices
+        parent = ParentOrder(order_id, conn_id, fields['sym'], fields['side'], quantity, fields.get('px'), algo,
+                             duration, interval)
+        if algo == 'pov':
+            parent.rate = rate
+            self.pov_parents.setdefault(parent.symbol, set()).add(parent)
+        else:
+            weights = [1.0 / slices] * slices if algo == 'twap' else \
+                curve_weights(self.volume_curve, parent.start, parent.end, slices)
+            cumulative = 0.0
+            for weight in weights:
+                cumulative += weight
+                parent.targets.append(round(parent.quantity * cumulative))
+            parent.targets[-1] = parent.quantity
+        return parent
+
+    def start(self, parent):
+        """Start working a parent from new_parent()."""
+        parent.arrival_price = self.arrival_price(parent)
+        self.parents[parent.order_id] = parent
+        logging.info(f'Parent {parent.order_id}: {parent.algo} {parent.side} {parent.quantity} {parent.symbol} '
+                     f'over {parent.end - parent.start:.0f}s every {parent.interval:.2f}s')
+        # First slice goes out now, the rest on the timer wheel
+        self.on_timer(parent)
+        return parent
+
+    def arrival_price(self, parent):
+        bid, ask = self.book.best_bid(parent.symbol), self.book.best_ask(parent.symbol)
+        if bid and ask:
+            return (bid[0] + ask[0]) / 2
+        far = ask if parent.side == 'buy' else bid
+        return far[0] if far else None
+
+    def on_timer(self, parent):
+        if parent.done:
+            return
+        now = time.time()
+        if parent.algo == 'pov':
+            target = min(parent.quantity, int(parent.market_volume * parent.rate))
+            last = now >= parent.end
+        else:
+            target = parent.targets[parent.slice]
+            parent.slice += 1
+            last = parent.slice >= len(parent.targets)
+        quantity = target - parent.sent
+        if quantity > 0:
+            child_id = f'{parent.order_id}.{len(parent.children) + 1}'
+            parent.children.append(child_id)
+            self.child_parents[child_id] = parent
+            parent.sent += quantity
+            self.submit(parent.conn_id, format_order(parent.symbol, parent.side, quantity, parent.limit,
+                                                     order_id=child_id))
+        if last or parent.sent >= parent.quantity:
+            parent.timer = None
+            self.check_done(parent)
+            return
+        parent.timer = self.wheel.schedule(parent.interval, self.on_timer, parent)
+
+    def on_fill(self, child_id, quantity, price=None):
+        parent = self.child_parents.get(child_id)
+        if parent is None:
+            return False
+        parent.filled += quantity
+        if price is not None:
+            parent.notional += quantity * price
+            parent.priced += quantity
+            if parent.arrival_price is None:
+                parent.arrival_price = price  # no quote at arrival
+        if parent.filled >= parent.quantity:
+            self.finish(parent)
+        else:
+            self.check_done(parent)
+        return True
+
+    def on_child_done(self, child_id, unfilled, reason=None):
+        """A child order ended (cancelled or rejected) with unfilled quantity left."""
+        parent = self.child_parents.get(child_id)
+        if parent is None:
+            return False
+        parent.lost += unfilled
+        if reason is not None:
+            parent.reason = reason
+        self.check_done(parent)
+        return True
+
+    def check_done(self, parent):
+        """Finish a parent that sends no more slices once none of its children is working."""
+        if parent.timer is None and parent.filled + parent.lost >= parent.sent:
+            self.finish(parent)
+
+    def on_trade(self, symbol, quantity):
+        for parent in self.pov_parents.get(symbol, ()):
+            parent.market_volume += quantity
+
+    def cancel(self, parent_id):
+        parent = self.parents.get(parent_id)
+        if parent is None:
+            return False
+        parent.cancelled = True
+        if parent.timer is not None:
+            parent.timer.cancel()
+            parent.timer = None
+        self.cancel_children(parent.conn_id, parent.children)
+        self.check_done(parent)
+        return True
+
+    def finish(self, parent):
+        if parent.done:
+            return
+        parent.done = True
+        if parent.timer is not None:
+            parent.timer.cancel()
+        del self.parents[parent.order_id]
+        for child in parent.children:
+            self.child_parents.pop(child, None)
+        self.pov_parents.get(parent.symbol, set()).discard(parent)
+        self.completed += 1
+        logging.info(f'Parent done: {parent.summary()}')
+        self.on_done(parent)
+
+    def stats(self):
+        return {'active_parents': len(self.parents), 'completed_parents': self.completed,
+                'active_timers': self.wheel.active}
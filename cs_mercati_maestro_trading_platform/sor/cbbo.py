@@ -0,0 +1,173 @@
+import heapq
+
+"""
+Consolidated Best Bid/Offer
+---------------------------
+Top of book across venues, per symbol, for routing decisions. Each venue's quote replaces its
+previous one in an indexed binary heap per side, so an update costs O(log venues), the best
+price is O(1), and walking the k best venues for a split costs O(k log k) without copying.
+"""
+
+
+class IndexedHeap:
+    """Binary min-heap of (key, item) with a position index so any item can be updated or removed."""
+
+    def __init__(self):
+        self.heap = []  # [key, item]
+        self.positions = {}  # item -> index in heap
+
+    def __len__(self):
+        return len(self.heap)
+
+    def peek(self):
+        return self.heap[0] if self.heap else None
+
+    def set(self, item, key):
+        index = self.positions.get(item)
+        if index is None:
+            self.heap.append([key, item])
+            self.positions[item] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+            return
+        old = self.heap[index][0]
+        self.heap[index][0] = key
+        if key < old:
+            self._sift_up(index)
+        else:
+            self._sift_down(index)
+
+    def remove(self, item):
+        index = self.positions.pop(item, None)
+        if index is None:
+            return
+        last = self.heap.pop()
+        if index < len(self.heap):
+            self.heap[index] = last
+            self.positions[last[1]] = index
+            self._sift_up(index)
+            self._sift_down(self.positions[last[1]])
+
+    def ordered(self):
+        """Yield (key, item) best first, lazily, by best-first traversal of the heap tree."""
+        heap = self.heap
+        if not heap:
+            return
+        frontier = [(heap[0][0], 0)]
+        while frontier:
+            key, index = heapq.heappop(frontier)
+            yield key, heap[index][1]
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child][0], child))
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.positions[heap[i][1]] = i
+        self.positions[heap[j][1]] = j
+
+    def _sift_up(self, index):
+        heap = self.heap
+        while index:
+            parent = (index - 1) >> 1
+            if heap[index][0] >= heap[parent][0]:
+                break
+            self._swap(index, parent)
+            index = parent
+
+    def _sift_down(self, index):
+        heap = self.heap
+        size = len(heap)
+        while True:
+            smallest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and heap[child][0] < heap[smallest][0]:
+                    smallest = child
+            if smallest == index:
+                return
+            self._swap(index, smallest)
+            index = smallest
+
+
+class SymbolQuotes:
+    def __init__(self):
+        self.quotes = {}  # venue -> [bid, bid_size, ask, ask_size]
+        self.bids = IndexedHeap()  # key (-price, -size): best bid first
+        self.asks = IndexedHeap()  # key (price, -size): best ask first
+
+    def update(self, venue, bid, bid_size, ask, ask_size):
+        self.quotes[venue] = [bid, bid_size, ask, ask_size]
+        self._index(venue)
+
+    def take(self, venue, side, quantity):
+        """Reduce a venue's displayed size after routing quantity against it."""
+        quote = self.quotes[venue]
+        size = 3 if side == 'buy' else 1
+        quote[size] = max(0, quote[size] - quantity)
+        self._index(venue)
+
+    def _index(self, venue):
+        bid, bid_size, ask, ask_size = self.quotes[venue]
+        if bid is not None and bid_size > 0:
+            self.bids.set(venue, (-bid, -bid_size))
+        else:
+            self.bids.remove(venue)
+        if ask is not None and ask_size > 0:
+            self.asks.set(venue, (ask, -ask_size))
+        else:
+            self.asks.remove(venue)
+
+
+class ConsolidatedBook:
+    def __init__(self):
+        self.symbols = {}  # symbol -> SymbolQuotes
+        self.updates = 0
+
+    def update(self, venue, symbol, bid=None, bid_size=0, ask=None, ask_size=0):
+        """Replace venue's top of book for symbol. A missing side means the venue has no quote there."""
+        quotes = self.symbols.get(symbol)
+        if quotes is None:
+            quotes = self.symbols[symbol] = SymbolQuotes()
+        quotes.update(venue, bid, bid_size, ask, ask_size)
+        self.updates += 1
+
+    def best_bid(self, symbol):
+        """Return (price, size, venue) or None."""
+        return self._best(symbol, 'bids', -1)
+
+    def best_ask(self, symbol):
+        return self._best(symbol, 'asks', 1)
+
+    def _best(self, symbol, side, sign):
+        quotes = self.symbols.get(symbol)
+        top = quotes and getattr(quotes, side).peek()
+        if not top:
+            return None
+        (price, size), venue = top
+        return sign * price, -size, venue
+
+    def split(self, symbol, side, quantity, limit=None):
+        """Allocate a marketable order across venues, best price first.
+
+        Returns ([(venue, quantity, price)], unallocated quantity). Allocated quantity is taken out
+        of the displayed sizes so back-to-back orders don't all chase the same liquidity before the
+        venues quote again.
+        """
+        quotes = self.symbols.get(symbol)
+        if quotes is None:
+            return [], quantity
+        book, sign = (quotes.asks, 1) if side == 'buy' else (quotes.bids, -1)
+        allocations = []
+        remaining = quantity
+        for (key_price, key_size), venue in book.ordered():
+            price = sign * key_price
+            if limit is not None and (price > limit if side == 'buy' else price < limit):
+                break
+            take = min(remaining, -key_size)
+            allocations.append((venue, take, price))
+            remaining -= take
+            if not remaining:
+                break
+        for venue, take, _ in allocations:
+            quotes.take(venue, side, take)
+        return allocations, remaining
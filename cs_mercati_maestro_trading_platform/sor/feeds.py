@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import socket
+import struct
+
+"""
+Venue Market Data Feeds
+-----------------------
+The market data the router routes on: every venue's Market Simulator publishes quote and trade
+messages derived from its books on a multicast feed (see sim/marketdata.py), several to a
+datagram, one per line, with heartbeats in between. The router joins each venue's feed on its
+event loop and hands every quote and trade to it with the venue it came from, for the
+consolidated book (cbbo.py) and the algos (algos.py).
+
+Venues are told apart by feed, so venues on one host need their simulators publishing on
+different ports (marketsimulator.py --market-data-port), each given to the router with
+--feed <venue>=<group>:<port>. A single venue defaults to the platform feed, 224.1.1.1:5007.
+"""
+
+MCAST_GRP = '224.1.1.1'
+MCAST_PORT = 5007
+
+
+def parse_feed(text, venue_names):
+    """Parse 'group:port' or 'venue=group:port' from the command line into (venue, (group, port))."""
+    name, sep, address = text.rpartition('=')
+    group, _, port = address.rpartition(':')
+    if not sep:
+        name = venue_names[0]
+    if name not in venue_names:
+        raise ValueError(f'feed {text} is for an unknown venue')
+    return name, (group or MCAST_GRP, int(port))
+
+
+def feed_socket(group, port):
+    """A non-blocking UDP socket joined to a multicast group."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # the Trading App and other workers join it too
+    sock.bind(('', port))
+    mreq = struct.pack("4sl", socket.inet_aton(group), socket.INADDR_ANY)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    sock.setblocking(False)
+    return sock
+
+
+class FeedProtocol(asyncio.DatagramProtocol):
+    """Passes each message of one venue's feed to on_message(venue, text)."""
+
+    def __init__(self, venue, on_message):
+        self.venue = venue
+        self.on_message = on_message
+        self.datagrams = 0
+        self.messages = 0
+
+    def datagram_received(self, data, addr):
+        self.datagrams += 1
+        for message in data.decode('utf-8', 'replace').splitlines():
+            if message != 'heartbeat':
+                self.messages += 1
+                self.on_message(self.venue, message)
+
+    def error_received(self, exc):
+        logging.error(f'Market data feed of {self.venue.name}: {exc}')
+
+
+async def join_feed(venue, group, port, on_message):
+    """Start receiving a venue's feed on the running loop. Returns its FeedProtocol."""
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_datagram_endpoint(lambda: FeedProtocol(venue, on_message),
+                                                      sock=feed_socket(group, port))
+    logging.info(f'Joined the market data feed of {venue.name} on {group}:{port}')
+    return protocol
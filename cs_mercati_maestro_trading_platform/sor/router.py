@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import time
+
+from algos import AlgoEngine
+from cbbo import ConsolidatedBook
+from feeds import join_feed
+from messages import format_message, format_order, parse_message, parse_price, parse_quantity
+from relaycore import QUEUE_DEPTH, Relay, UpstreamSession, rejection
+from timerwheel import TimerWheel
+from venues import STRATEGIES, RoutedOrder, Venue
+
+"""
+Smart Order Router
+------------------
+Relay that routes each order to one of several venues (FIX Engine / Market Simulator instances)
+using a pluggable strategy (see venues.py). Cancels follow their order to the venue it was
+routed to. Acks, fills, cancels and rejects read back on the venue sessions keep the venue
+stats (outstanding orders, EWMA ack latency, fill rate) live, and are passed back to the client
+connection that sent the order (see report_to_client). An order whose qty or px is not a valid
+number is answered with reject id=.. reason=bad_qty / bad_px and not routed. Venue messages with
+bad numbers are logged and ignored.
+
+Venue quotes (quote sym=... bid=... bidsz=... ask=... asksz=...) maintain a consolidated top of
+book (see cbbo.py). They come from each venue's market data feed (see feeds.py), and are also
+taken on the venue sessions. A marketable order is split across the venues quoting the best
+prices, as child orders <id>.<n>. Any quantity beyond the displayed liquidity goes to the
+strategy's venue. A cancel of a split order goes to each child. A replace of one is answered with
+cancelreject reason=split_order (its quantity is spread over venues). Once the last child is done,
+any quantity the children left unfilled is reported as the order's reject or cancelled. Trades on the feeds are the market volume of the POV algo.
+
+Parent orders (parent id=... algo=twap|vwap|pov ...) are sliced into child orders over time by the
+AlgoEngine (see algos.py), driven by a single TimerWheel ticked from one task on the event loop.
+"""
+
+TIMER_TICK = 0.01  # Seconds per timer wheel tick
+
+
+class SmartOrderRouter(Relay):
+    def __init__(self, name, listen_host, listen_port, venues, strategy='round-robin', sessions=2,
+                 stats_interval=60, volume_curve=None, queue_depth=QUEUE_DEPTH, shed_policy='block',
+                 reuse_port=False, channel=None, feeds=None):
+        super().__init__(name, listen_host, listen_port, None, None, sessions=0, stats_interval=stats_interval,
+                         queue_depth=queue_depth, shed_policy=shed_policy, reuse_port=reuse_port, channel=channel)
+        self.venues = []
+        for venue_name, host, port in venues:
+            venue = Venue(venue_name, host, port, [])
+            for i in range(sessions):
+                session = UpstreamSession(self, f'{venue_name}-{i}', host, port)
+                session.venue = venue
+                venue.sessions.append(session)
+            self.venues.append(venue)
+            self.upstreams.extend(venue.sessions)
+        self.venues_by_name = {venue.name: venue for venue in self.venues}
+        self.feeds = feeds or {}  # venue name -> (multicast group, port) of its market data
+        self.feed_protocols = []
+        self.strategy = STRATEGIES[strategy]()
+        self.book = ConsolidatedBook()
+        self.orders = {}  # order ID -> RoutedOrder, until the order is done
+        self.children = {}  # parent order ID -> child order IDs of a split order
+        self.split_ends = {}  # split order ID -> [filled, unfilled, reject reason, cancelled] of its done children
+        self.wheel = TimerWheel(TIMER_TICK)
+        self.algos = AlgoEngine(self.wheel, self.book, self.submit_child, self.cancel_children, self.parent_done,
+                                volume_curve)
+        logging.info(f'{self.name} routing to {self.venues} with {self.strategy.name}')
+
+    def route(self, conn_id, message):
+        """Return [(venue, message)] to send for one client message, or None if it cannot be routed."""
+        kind, fields = parse_message(message.decode('utf-8'))
+        order_id = fields.get('id')
+        if kind == 'order':
+            return self.route_order(conn_id, message, fields)
+        if kind == 'parent':
+            try:
+                parent = self.algos.new_parent(conn_id, fields)
+            except ValueError as e:
+                logging.warning(f'{self.name}: rejecting {message.decode("utf-8")}: {e}')
+                self.send_to_client(conn_id, [format_message('reject', id=order_id, reason=e).encode('utf-8')])
+                return []
+            self.send_to_client(conn_id, [format_message('ack', id=order_id).encode('utf-8')])
+            self.algos.start(parent)
+            return []
+        if kind == 'cancel' and order_id in self.algos.parents:
+            self.algos.cancel(order_id)  # cancelled once its children are (parent_done)
+            return []
+        if order_id is not None:
+            # Cancels and other order-specific messages follow the order, or its children
+            if order_id in self.children:
+                if kind == 'replace':
+                    logging.warning(f'{self.name}: cannot replace split order {message.decode("utf-8")}')
+                    self.send_to_client(conn_id, [format_message('cancelreject', id=order_id, reason='split_order',
+                                                                 to=2).encode('utf-8')])
+                    return []
+                others = {key: value for key, value in fields.items() if key not in ('id', 'args')}
+                return [(self.orders[child].venue, format_message(kind, id=child, **others).encode('utf-8'))
+                        for child in self.children[order_id] if child in self.orders]
+            order = self.orders.get(order_id)
+            if order is None or order.conn_id != conn_id:
+                logging.warning(f'{self.name}: no routed order for {message.decode("utf-8")}')
+                answer = rejection(message, 'unknown_order')
+                if answer is not None:
+                    self.send_to_client(conn_id, [answer])
+                return None
+            return [(order.venue, message)]
+        return [(self.strategy.choose(self.venues, fields), message)]
+
+    def route_order(self, conn_id, message, fields):
+        order_id = fields.get('id')
+        ordered = quantity = parse_quantity(fields.get('qty', '1'))
+        limit = parse_price(fields['px']) if fields.get('px') else None
+        if quantity is None or (fields.get('px') and limit is None):
+            reason = 'bad_qty' if quantity is None else 'bad_px'
+            logging.warning(f'{self.name}: rejecting {message.decode("utf-8")}: {reason}')
+            self.send_to_client(conn_id, [format_message('reject', id=order_id, reason=reason).encode('utf-8')])
+            return []
+        venues = [venue for venue in self.venues if venue.available] or self.venues
+        allocations = []
+        if order_id is not None and fields.get('sym') and fields.get('side'):
+            allocations, quantity = self.book.split(fields['sym'], fields['side'], quantity, limit)
+        if not allocations or (len(allocations) == 1 and not quantity):
+            # Not marketable, or one venue shows it all: no split needed
+            venue = self.venues_by_name[allocations[0][0]] if allocations else self.strategy.choose(venues, fields)
+            quantity = ordered
+            if order_id is not None:
+                self.orders[order_id] = RoutedOrder(venue, conn_id, quantity)
+            venue.stats.on_routed()
+            return [(venue, message)]
+
+        # Marketable against the consolidated book: one child per venue, best price first
+        if quantity:
+            allocations.append((self.strategy.choose(venues, fields).name, quantity, None))
+        routed = []
+        children = self.children[order_id] = []
+        for n, (venue_name, child_quantity, _) in enumerate(allocations, 1):
+            venue = self.venues_by_name[venue_name]
+            child_id = f'{order_id}.{n}'
+            children.append(child_id)
+            self.orders[child_id] = RoutedOrder(venue, conn_id, child_quantity, parent_id=order_id)
+            venue.stats.on_routed()
+            child = format_order(fields['sym'], fields['side'], child_quantity, fields.get('px'), order_id=child_id)
+            routed.append((venue, child.encode('utf-8')))
+        logging.debug(f'{self.name}: split {order_id} into {[(v, q, p) for v, q, p in allocations]}')
+        return routed
+
+    async def dispatch(self, conn_id, stats, messages):
+        batches = {}  # session -> messages, so each venue still gets one write per read
+        for message in messages:
+            routed = self.route(conn_id, message)
+            if routed is None:
+                stats.dropped += 1
+                continue
+            for venue, venue_message in routed:
+                batches.setdefault(venue.session_for(conn_id), []).append(venue_message)
+        for session, batch in batches.items():
+            await self.forward(session, conn_id, stats, batch)
+
+    def reject_overloaded(self, conn_id, messages):
+        """Shed orders are done at their venue (a shed replace leaves its order working). A split order
+        hears about its shed children from order_done, with the rest of their outcome."""
+        client_messages = []
+        for message in messages:
+            kind, fields = parse_message(message.decode('utf-8'))
+            order = self.orders.get(fields.get('id'))
+            if order is not None and kind == 'order':
+                self.order_done(fields['id'], order, rejected=True, reason='overloaded')
+                if order.parent_id is not None:
+                    continue
+            client_messages.append(message)
+        super().reject_overloaded(conn_id, client_messages)
+
+    def submit_child(self, conn_id, message):
+        """Route and send an algo child order from a timer callback."""
+        for venue, venue_message in self.route_order(conn_id, message.encode('utf-8'), parse_message(message)[1]):
+            if venue.session_for(conn_id).send_nowait([venue_message]):
+                venue_id = parse_message(venue_message.decode('utf-8'))[1]['id']
+                self.order_done(venue_id, self.orders[venue_id], rejected=True, reason='overloaded')
+                logging.error(f'{self.name}: venue {venue.name} overloaded, child order shed: {message}')
+
+    def cancel_children(self, conn_id, child_ids):
+        """Cancel the still-working algo child orders of a parent, from a timer or cancel callback."""
+        for child_id in child_ids:
+            if child_id not in self.orders and child_id not in self.children:
+                continue
+            for venue, message in self.route(conn_id, format_message('cancel', id=child_id).encode('utf-8')) or []:
+                venue.session_for(conn_id).send_nowait([message])
+
+    async def run_timers(self):
+        while True:
+            await asyncio.sleep(TIMER_TICK)
+            self.wheel.advance()
+
+    async def serve_forever(self):
+        asyncio.create_task(self.run_timers())
+        for venue_name, (group, port) in self.feeds.items():
+            try:
+                self.feed_protocols.append(await join_feed(self.venues_by_name[venue_name], group, port,
+                                                           self.on_market_data))
+            except OSError as e:
+                logging.error(f'{self.name}: cannot join the market data feed of {venue_name} on {group}:{port}: {e}')
+        await super().serve_forever()
+
+    def on_market_data(self, venue, text):
+        kind, fields = parse_message(text)
+        if kind == 'quote':
+            self.on_quote(venue, fields)
+        elif kind == 'trade':
+            self.on_trade(venue, fields)
+
+    def on_upstream_message(self, upstream, message):
+        kind, fields = parse_message(message.decode('utf-8'))
+        if kind == 'quote':
+            self.on_quote(upstream.venue, fields)
+            return
+        if kind == 'trade':
+            self.on_trade(upstream.venue, fields)
+            return
+        order = self.orders.get(fields.get('id'))
+        if order is None:
+            logging.debug(f'{self.name}: {upstream.venue.name} sent: {message.decode("utf-8")}')
+            return
+        valid = True
+        if kind == 'fill':
+            quantity = parse_quantity(fields.get('qty'))
+            price = parse_price(fields['px']) if fields.get('px') else None
+            valid = quantity is not None and (price is not None or not fields.get('px'))
+        elif kind == 'replaced':
+            leaves = parse_quantity(fields.get('leaves', '0'), minimum=0)
+            valid = leaves is not None
+        if not valid:
+            logging.warning(f'{self.name}: bad report from {upstream.venue.name}: {message.decode("utf-8")}')
+            return
+        self.report_to_client(order, kind, fields, message)
+        stats = order.venue.stats
+        if kind in ('ack', 'fill') and not order.acked:
+            order.acked = True
+            stats.on_ack(time.perf_counter() - order.sent_at)
+        if kind == 'fill':
+            order.filled += quantity
+            stats.on_fill(quantity)
+            self.algos.on_fill(order.parent_id or fields['id'], quantity, price)
+            if order.filled >= order.quantity:
+                self.order_done(fields['id'], order)
+        elif kind == 'replaced':
+            order.quantity = order.filled + leaves
+        elif kind == 'cancelled':
+            self.order_done(fields['id'], order, cancelled=True)
+        elif kind == 'reject':
+            self.order_done(fields['id'], order, rejected=True, reason=fields.get('reason'))
+
+    def report_to_client(self, order, kind, fields, message):
+        """Pass a venue report back to the client that sent the order, under the ID the client knows.
+
+        Reports on a split or algo child go out under the client's order: fills as they come, and a
+        split order's acks. A split order's end is reported by order_done once its last child is
+        done; an algo parent is acked when it starts and ended by parent_done.
+        """
+        client_id = order.parent_id or fields['id']
+        parent = self.algos.child_parents.get(client_id)
+        if parent is not None:
+            client_id = parent.order_id
+        if client_id != fields['id']:
+            if kind == 'fill':
+                message = format_message('fill', id=client_id, sym=fields.get('sym'), qty=fields.get('qty'),
+                                         px=fields.get('px'))
+            elif kind == 'ack' and parent is None:
+                message = format_message('ack', id=client_id)
+            else:
+                return
+            message = message.encode('utf-8')
+        self.send_to_client(order.conn_id, [message])
+
+    def order_done(self, order_id, order, rejected=False, cancelled=False, reason=None):
+        del self.orders[order_id]
+        order.venue.stats.on_done(order.filled, order.quantity, rejected=rejected, cancelled=cancelled)
+        if rejected or cancelled:
+            self.algos.on_child_done(order.parent_id or order_id, order.quantity - order.filled, reason)
+        if order.parent_id is not None and order.parent_id in self.children:
+            end = self.split_ends.setdefault(order.parent_id, [0, 0, None, False])
+            end[0] += order.filled
+            end[1] += max(0, order.quantity - order.filled)
+            end[2] = reason or end[2]
+            end[3] = end[3] or cancelled
+            if not any(child in self.orders for child in self.children[order.parent_id]):
+                del self.children[order.parent_id]
+                self.split_done(order.parent_id, order.conn_id, *self.split_ends.pop(order.parent_id))
+
+    def split_done(self, order_id, conn_id, filled, unfilled, reason, cancelled):
+        """Tell the client what became of the quantity a split order's children left unfilled: rejected if
+        they were all rejected, else cancelled. An algo child's parent hears it from the AlgoEngine."""
+        if not unfilled or order_id in self.algos.child_parents:
+            return
+        rejected = not filled and not cancelled and reason is not None
+        message = format_message('reject' if rejected else 'cancelled', id=order_id, reason=reason)
+        self.send_to_client(conn_id, [message.encode('utf-8')])
+
+    def parent_done(self, parent):
+        """Tell the client what became of an algo parent's unfilled quantity: rejected if nothing of it
+        filled because its children were rejected, else cancelled (by the client, or expired)."""
+        if parent.filled >= parent.quantity:
+            return
+        rejected = not parent.filled and not parent.cancelled and parent.reason is not None
+        message = format_message('reject' if rejected else 'cancelled', id=parent.order_id,
+                                 reason=None if parent.cancelled else parent.reason)
+        self.send_to_client(parent.conn_id, [message.encode('utf-8')])
+
+    def on_trade(self, venue, fields):
+        quantity = parse_quantity(fields.get('qty'))
+        if quantity is None:
+            logging.warning(f'{self.name}: bad trade from {venue.name}: {fields}')
+            return
+        self.algos.on_trade(fields.get('sym'), quantity)
+
+    def on_quote(self, venue, fields):
+        bid = parse_price(fields['bid']) if fields.get('bid') else None
+        ask = parse_price(fields['ask']) if fields.get('ask') else None
+        bid_size = parse_quantity(fields.get('bidsz', '0'), minimum=0)
+        ask_size = parse_quantity(fields.get('asksz', '0'), minimum=0)
+        if (not fields.get('sym') or None in (bid_size, ask_size) or (fields.get('bid') and bid is None)
+                or (fields.get('ask') and ask is None)):
+            logging.warning(f'{self.name}: bad quote from {venue.name}: {fields}')
+            return
+        self.book.update(venue.name, fields['sym'], bid, bid_size, ask, ask_size)
+
+    def stats(self):
+        stats = super().stats()
+        stats['open_orders'] = len(self.orders)
+        stats['quote_updates'] = self.book.updates
+        stats['feed_messages'] = {protocol.venue.name: protocol.messages for protocol in self.feed_protocols}
+        stats['algos'] = self.algos.stats()
+        stats['venues'] = {venue.name: venue.stats.as_dict() for venue in self.venues}
+        return stats
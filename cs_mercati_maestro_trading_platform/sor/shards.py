@@ -0,0 +1,186 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import socket
+import threading
+
+from framing import HEADER, HEADER_SIZE
+from messages import parse_message
+from relaycore import LISTEN_BACKLOG
+
+"""
+Trader Sharding
+---------------
+Keeps every trader on one router worker, so per-trader ordering and state live in one process.
+
+A front acceptor owns port 5008. For each new connection it peeks (MSG_PEEK) at the client's
+first frame, logon trader=<ID>, looks the trader up on a consistent hash ring of worker indexes
+and passes the socket to that worker as a file descriptor over its Unix channel
+(socket.send_fds). The worker then reads the connection from the start, logon included, and the
+front never touches it again.
+
+- Each worker owns VNODES points on the ring, so traders spread evenly, and adding or removing a
+  worker only moves the traders between its points and their neighbours (about 1/N of them).
+- If a trader's worker is down (being restarted by the supervisor), the connection goes to the
+  next worker clockwise on the ring, and the trader moves back on their next connection.
+- A client that sends no logon within LOGON_TIMEOUT is sharded by its address.
+"""
+
+VNODES = 160  # Ring points per worker
+LOGON_TIMEOUT = 5.0
+MAX_LOGON_SIZE = 256
+PEEK_RETRY = 0.001  # Seconds between peeks while the logon frame is incomplete
+STATS_INTERVAL = 60
+
+
+def ring_hash(key):
+    """Stable 64-bit hash (Python's hash() is salted per process)."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hash ring mapping keys (trader IDs) to nodes (worker indexes)."""
+
+    def __init__(self, nodes=(), vnodes=VNODES):
+        self.vnodes = vnodes
+        self.points = []  # sorted ring positions
+        self.owners = {}  # ring position -> node
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for replica in range(self.vnodes):
+            point = ring_hash(f'{node}#{replica}')
+            if point not in self.owners:
+                bisect.insort(self.points, point)
+                self.owners[point] = node
+
+    def remove(self, node):
+        self.points = [point for point in self.points if self.owners[point] != node]
+        self.owners = {point: self.owners[point] for point in self.points}
+
+    def nodes_for(self, key):
+        """Yield distinct nodes clockwise from key: its owner first, then the fallbacks in order."""
+        points = self.points
+        start = bisect.bisect(points, ring_hash(key))
+        seen = set()
+        for offset in range(len(points)):
+            node = self.owners[points[(start + offset) % len(points)]]
+            if node not in seen:
+                seen.add(node)
+                yield node
+
+    def node_for(self, key):
+        return next(self.nodes_for(key), None)
+
+
+class FrontAcceptor:
+    """Accepts clients on host:port and hands each to the worker that owns its trader."""
+
+    def __init__(self, name, host, port, supervisor):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.supervisor = supervisor  # a workers.Supervisor with channels=True
+        self.ring = HashRing(worker.index for worker in supervisor.workers)
+        self.handoffs = [0] * len(supervisor.workers)
+        self.fallbacks = 0  # handed to a worker other than the trader's owner
+        self.no_logon = 0
+        self.refused = 0  # no worker could take the connection
+
+    async def read_logon(self, client):
+        """Peek at the first frame and return its trader, or None if it isn't a logon."""
+        loop = asyncio.get_running_loop()
+        while True:
+            readable = loop.create_future()
+            loop.add_reader(client.fileno(), readable.set_result, None)
+            try:
+                await readable
+            finally:
+                loop.remove_reader(client.fileno())
+            data = client.recv(HEADER_SIZE + MAX_LOGON_SIZE, socket.MSG_PEEK)
+            if not data:
+                return None
+            if len(data) >= HEADER_SIZE:
+                length = HEADER.unpack_from(data)[0]
+                if length > MAX_LOGON_SIZE:
+                    return None
+                if len(data) >= HEADER_SIZE + length:
+                    kind, fields = parse_message(data[HEADER_SIZE:HEADER_SIZE + length].decode('utf-8', 'replace'))
+                    return fields.get('trader') if kind == 'logon' else None
+            await asyncio.sleep(PEEK_RETRY)
+
+    def hand_off(self, client, key):
+        """Pass the client socket to the first live worker for key. Returns the worker index or None."""
+        for index in self.ring.nodes_for(key):
+            worker = self.supervisor.workers[index]
+            channel = worker.channel
+            if worker.process is None or channel is None:
+                continue
+            try:
+                socket.send_fds(channel, [b'c'], [client.fileno()])
+            except OSError as e:
+                logging.warning(f'{self.name}: worker {index} did not take a connection: {e}')
+                continue
+            return index
+        return None
+
+    async def handle(self, client):
+        # The socket is closed here on every path: a worker that takes it has its own descriptor
+        try:
+            try:
+                peer = client.getpeername()
+            except OSError as e:
+                logging.warning(f'{self.name}: client gone before its logon: {e}')
+                return
+            try:
+                trader = await asyncio.wait_for(self.read_logon(client), LOGON_TIMEOUT)
+            except (asyncio.TimeoutError, OSError):
+                trader = None
+            if trader is None:
+                self.no_logon += 1
+                logging.warning(f'{self.name}: no logon from {peer}, sharding by address')
+            index = self.hand_off(client, trader or f'{peer[0]}:{peer[1]}')
+        finally:
+            client.close()
+        if index is None:
+            self.refused += 1
+            logging.error(f'{self.name}: no worker available for {peer}, connection closed')
+            return
+        self.handoffs[index] += 1
+        if trader is not None and index != self.ring.node_for(trader):
+            self.fallbacks += 1
+        logging.debug(f'{self.name}: trader {trader} from {peer} -> worker {index}')
+
+    def stats(self):
+        return {'handoffs': self.handoffs, 'fallbacks': self.fallbacks, 'no_logon': self.no_logon,
+                'refused': self.refused}
+
+    async def log_stats(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            logging.info(f'{self.name} front stats: {self.stats()}')
+
+    async def serve_forever(self):
+        loop = asyncio.get_running_loop()
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(LISTEN_BACKLOG)
+        listener.setblocking(False)
+        threading.Thread(target=self.supervisor.run, name='supervisor', daemon=True).start()
+        asyncio.create_task(self.log_stats())
+        logging.info(f'{self.name} front acceptor listening, sharding traders over '
+                     f'{len(self.supervisor.workers)} workers')
+        while True:
+            client, _ = await loop.sock_accept(listener)
+            client.setblocking(False)
+            asyncio.create_task(self.handle(client))
+
+    def run(self):
+        self.supervisor.start()  # before the event loop and any thread
+        try:
+            asyncio.run(self.serve_forever())
+        finally:
+            self.supervisor.stop()
@@ -1,18 +1,46 @@
-import socket
+import argparse
 import logging
 import os
 import signal
 import sys
-import threading
 import time
 
+# Shared platform modules live one directory up
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+from algos import load_volume_curve
+from feeds import MCAST_GRP, MCAST_PORT, parse_feed
+from passthrough import PassThroughRelay
+from relaycore import QUEUE_DEPTH, SHED_POLICIES, run_relay
+from router import SmartOrderRouter
+from shards import FrontAcceptor
+from venues import STRATEGIES, parse_venue
+from workers import Supervisor
+
 """
 Order Router App
 ----------------
-This application receives orders from the Trading App and forwards them to the FIX Engine.
+This application receives orders from the Trading App and routes them across one or more venues
+(FIX Engine / Market Simulator instances) with a pluggable strategy: round-robin, least outstanding
+orders or lowest measured ack latency (see router.py and venues.py). Parent orders are sliced into
+child orders over time with TWAP, VWAP or percent-of-volume (see algos.py).
 
 - Receiving: TCP from Trading App on localhost:5008.
-- Sending: TCP to FIX Engine on localhost:5009.
+- Sending: TCP to FIX Engine on localhost:5009, or to every --venue given.
+- Market data: each venue's quotes and trades, from its simulator's multicast feed (--feed, by
+  default 224.1.1.1:5007 for a single venue), keep a consolidated book that marketable orders are
+  split on and feed the algos (see feeds.py and cbbo.py).
+- Connections: all clients are served by one asyncio event loop and multiplexed onto
+  UPSTREAM_SESSIONS shared upstream connections (see relaycore.py).
+- Overload: each upstream session queues at most --queue-depth messages. When a venue falls
+  behind, --shed-policy block pushes back on the clients, reject-new rejects new orders with
+  reason=overloaded. Cancels are never shed.
+- --passthrough: raw mode for a single venue. Bytes are spliced kernel to kernel between each
+  client and its own venue connection, with no routing (see passthrough.py).
+- --workers N: N router processes share port 5008 with SO_REUSEPORT, each with its own venue
+  sessions, under a supervisor that restarts any that die (see workers.py).
+- --shard-by-trader (with --workers): a front acceptor owns port 5008 instead and hands each
+  connection to a worker picked by consistent hash of the trader in its logon (see shards.py).
 - Dependencies: None
 """
 
@@ -20,7 +48,9 @@ This application receives orders from the Trading App and forwards them to the F
 log_dir = "logs"
 if not os.path.exists(log_dir):
     os.makedirs(log_dir)
-logging.basicConfig(filename=os.path.join(log_dir, f'orderrouter_{time.strftime("%y%m%d%H%M%S")}.log'), 
+# Workers import this script again: the environment keeps them on the file of the process that started them
+log_file = os.environ.setdefault('ORDERROUTER_LOG', os.path.join(log_dir, f'orderrouter_{time.strftime("%y%m%d%H%M%S")}.log'))
+logging.basicConfig(filename=log_file, 
                     level=logging.DEBUG, 
                     format='%(asctime)s %(message)s')
 
@@ -28,6 +58,7 @@ logging.basicConfig(filename=os.path.join(log_dir, f'orderrouter_{time.strftime(
 HOST = 'localhost'
 PORT_RECEIVE = 5008
 PORT_SEND = 5009
+UPSTREAM_SESSIONS = 2  # Upstream connections per venue, shared by all clients
 
 def signal_handler(sig, frame):
     logging.info("Order Router App interrupted and exiting gracefully.")
@@ -35,31 +66,66 @@ def signal_handler(sig, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
-def handle_client(conn, addr):
-    logging.debug(f'Connected by {addr}')
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST, PORT_SEND))
-        try:
-            while True:
-                data = conn.recv(1024)
-                if not data:
-                    break
-                logging.debug(f'Received order: {data.decode("utf-8")}')
-                s.sendall(data)
-        except Exception as e:
-            logging.error(f'Exception in handling client: {e}')
-        finally:
-            conn.close()
+def relay_name(worker):
+    return 'Order Router' if worker is None else f'Order Router {worker}'
+
+def start_server(venues, strategy, sessions=UPSTREAM_SESSIONS, volume_curve=None, queue_depth=QUEUE_DEPTH,
+                 shed_policy='block', feeds=None, worker=None, channel=None):
+    relay = SmartOrderRouter(relay_name(worker), HOST, PORT_RECEIVE, venues, strategy=strategy, sessions=sessions,
+                             volume_curve=volume_curve, queue_depth=queue_depth, shed_policy=shed_policy,
+                             reuse_port=worker is not None, channel=channel, feeds=feeds)
+    run_relay(relay)
 
-def start_server():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, PORT_RECEIVE))
-        s.listen()
-        logging.info('Order Router listening for connections')
-        while True:
-            conn, addr = s.accept()
-            thread = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
-            thread.start()
+def start_passthrough(venue, worker=None):
+    _, host, port = venue
+    run_relay(PassThroughRelay(relay_name(worker), HOST, PORT_RECEIVE, host, port, reuse_port=worker is not None))
+
+def run_worker(index, target, *args, **kwargs):
+    """Worker process entry point: run target on the port shared with the other workers, or on its channel."""
+    target(*args, worker=index, **kwargs)
 
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser(description="Order Router")
+    parser.add_argument("--venue", action="append", default=[],
+                        help="venue as [name=]host:port, repeat for several (default: localhost:5009)")
+    parser.add_argument("--feed", action="append", default=[],
+                        help="venue market data as [venue=]group:port, repeat per venue "
+                             f"(default: {MCAST_GRP}:{MCAST_PORT} for a single venue)")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="round-robin", help="venue selection")
+    parser.add_argument("--sessions", type=int, default=UPSTREAM_SESSIONS, help="upstream sessions per venue")
+    parser.add_argument("--volume-curve", help="VWAP volume curve CSV (HH:MM,fraction rows)")
+    parser.add_argument("--queue-depth", type=int, default=QUEUE_DEPTH, help="messages queued per upstream session")
+    parser.add_argument("--shed-policy", choices=SHED_POLICIES, default="block", help="what to do when a queue is full")
+    parser.add_argument("--passthrough", action="store_true", help="splice bytes to a single venue without routing")
+    parser.add_argument("--workers", type=int, default=1, help="router processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument("--shard-by-trader", action="store_true",
+                        help="keep each trader on one worker, behind a front acceptor")
+    args = parser.parse_args()
+    if args.shard_by_trader and (args.workers < 2 or args.passthrough):
+        parser.error("--shard-by-trader needs --workers 2 or more, without --passthrough")
+    venues = [parse_venue(text, i) for i, text in enumerate(args.venue or [f'{HOST}:{PORT_SEND}'])]
+    if args.passthrough:
+        if len(venues) > 1:
+            parser.error("--passthrough takes a single --venue")
+        target, target_args = start_passthrough, (venues[0],)
+    else:
+        venue_names = [name for name, _, _ in venues]
+        try:
+            feeds = dict(parse_feed(text, venue_names) for text in args.feed)
+        except ValueError as e:
+            parser.error(str(e))
+        if not args.feed and len(venues) == 1:
+            feeds = {venue_names[0]: (MCAST_GRP, MCAST_PORT)}
+        for name in venue_names:
+            if name not in feeds:
+                logging.warning(f"Venue {name} has no market data feed (--feed): no quotes or trades from it")
+        volume_curve = load_volume_curve(args.volume_curve) if args.volume_curve else None
+        target, target_args = start_server, (venues, args.strategy, args.sessions, volume_curve, args.queue_depth,
+                                             args.shed_policy, feeds)
+    if args.shard_by_trader:
+        supervisor = Supervisor('Order Router', args.workers, run_worker, target, *target_args, channels=True)
+        FrontAcceptor('Order Router', HOST, PORT_RECEIVE, supervisor).run()
+    elif args.workers > 1:
+        Supervisor('Order Router', args.workers, run_worker, target, *target_args).run()
+    else:
+        target(*target_args)
@@ -0,0 +1,87 @@
+import math
+import time
+
+"""
+Hierarchical Timer Wheel
+------------------------
+Schedules callbacks for the router's parent orders without a thread, task or sleep per timer.
+Level 0 has WHEEL_SIZE slots of one tick each; every higher level has WHEEL_SIZE slots each
+covering a full turn of the level below. Scheduling and cancelling are O(1); a timer is moved
+down at most LEVELS - 1 times before it fires. advance() is called from one periodic task on the
+event loop and fires everything that has come due.
+"""
+
+WHEEL_BITS = 8
+WHEEL_SIZE = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SIZE - 1
+LEVELS = 4  # 256^4 ticks: ~1.4 years at 10ms
+
+
+class Timer:
+    __slots__ = ('expires', 'callback', 'args', 'cancelled')
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires  # tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    def __init__(self, tick=0.01, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.start = clock()
+        self.current = 0  # last tick processed
+        self.levels = [[[] for _ in range(WHEEL_SIZE)] for _ in range(LEVELS)]
+        self.active = 0
+
+    def schedule(self, delay, callback, *args):
+        """Call callback(*args) after delay seconds (rounded up to the next tick). Returns a Timer."""
+        expires = self.current + max(1, math.ceil((self.clock() + delay - self.start) / self.tick) - self.current)
+        timer = Timer(expires, callback, args)
+        self._insert(timer)
+        self.active += 1
+        return timer
+
+    def _insert(self, timer):
+        delta = timer.expires - self.current
+        for level in range(LEVELS):
+            if delta < WHEEL_SIZE << (WHEEL_BITS * level) or level == LEVELS - 1:
+                slot = (timer.expires >> (WHEEL_BITS * level)) & WHEEL_MASK
+                self.levels[level][slot].append(timer)
+                return
+
+    def advance(self, now=None):
+        """Fire every timer due by now. Returns the number fired."""
+        target = int(((self.clock() if now is None else now) - self.start) / self.tick)
+        fired = 0
+        while self.current < target:
+            self.current += 1
+            # Cascade: when a lower level wraps, redistribute the matching slot of the level above
+            for level in range(1, LEVELS):
+                if self.current & ((1 << (WHEEL_BITS * level)) - 1):
+                    break
+                slot = self.levels[level][(self.current >> (WHEEL_BITS * level)) & WHEEL_MASK]
+                self.levels[level][(self.current >> (WHEEL_BITS * level)) & WHEEL_MASK] = []
+                for timer in slot:
+                    if not timer.cancelled:
+                        self._insert(timer)
+                    else:
+                        self.active -= 1
+            slot = self.levels[0][self.current & WHEEL_MASK]
+            if not slot:
+                continue
+            self.levels[0][self.current & WHEEL_MASK] = []
+            for timer in slot:
+                if timer.expires > self.current:
+                    self._insert(timer)  # beyond the top level's range: not due yet
+                    continue
+                self.active -= 1
+                if not timer.cancelled:
+                    timer.callback(*timer.args)
+                    fired += 1
+        return fired
@@ -0,0 +1,140 @@
+import itertools
+import time
+
+"""
+Venues and Routing Strategies
+-----------------------------
+A Venue is one FIX Engine / Market Simulator instance the Order Router can send orders to,
+with its own pool of upstream sessions and live VenueStats:
+
+- outstanding orders (routed, not yet filled, cancelled or rejected)
+- EWMA of the order -> ack round trip
+- order, ack, fill, reject and cancel counters, and an EWMA of the fill rate of completed orders
+
+Strategies pick a venue per order. New ones subclass RoutingStrategy and are registered in
+STRATEGIES under the name accepted by sor.py --strategy.
+"""
+
+EWMA_ALPHA = 0.2  # Weight of the newest sample
+
+
+def ewma(previous, sample, alpha=EWMA_ALPHA):
+    return sample if previous is None else previous + alpha * (sample - previous)
+
+
+class VenueStats:
+    def __init__(self):
+        self.outstanding = 0
+        self.orders = 0
+        self.acks = 0
+        self.fills = 0
+        self.filled_quantity = 0
+        self.rejects = 0
+        self.cancels = 0
+        self.ack_latency = None  # EWMA seconds
+        self.fill_rate = None  # EWMA of filled / ordered quantity per completed order
+
+    def on_routed(self):
+        self.orders += 1
+        self.outstanding += 1
+
+    def on_ack(self, latency):
+        self.acks += 1
+        self.ack_latency = ewma(self.ack_latency, latency)
+
+    def on_fill(self, quantity):
+        self.fills += 1
+        self.filled_quantity += quantity
+
+    def on_done(self, filled, quantity, rejected=False, cancelled=False):
+        """Order reached a terminal state."""
+        self.outstanding = max(0, self.outstanding - 1)
+        self.rejects += rejected
+        self.cancels += cancelled
+        if quantity:
+            self.fill_rate = ewma(self.fill_rate, filled / quantity)
+
+    def as_dict(self):
+        stats = dict(vars(self))
+        if self.ack_latency is not None:
+            stats['ack_latency'] = round(self.ack_latency * 1000, 3)  # ms
+        if self.fill_rate is not None:
+            stats['fill_rate'] = round(self.fill_rate, 4)
+        return stats
+
+
+class Venue:
+    def __init__(self, name, host, port, sessions):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.sessions = sessions  # UpstreamSessions, created by the router
+        self.stats = VenueStats()
+
+    def session_for(self, conn_id):
+        return self.sessions[conn_id % len(self.sessions)]
+
+    @property
+    def available(self):
+        return any(session.connected for session in self.sessions)
+
+    def __repr__(self):
+        return f"{self.name} ({self.host}:{self.port})"
+
+
+class RoutingStrategy:
+    """Chooses a venue for an order. venues is never empty."""
+
+    name = None
+
+    def choose(self, venues, order):
+        raise NotImplementedError
+
+
+class RoundRobin(RoutingStrategy):
+    name = 'round-robin'
+
+    def __init__(self):
+        self.counter = itertools.count()
+
+    def choose(self, venues, order):
+        return venues[next(self.counter) % len(venues)]
+
+
+class LeastOutstanding(RoutingStrategy):
+    name = 'least-outstanding'
+
+    def choose(self, venues, order):
+        return min(venues, key=lambda venue: venue.stats.outstanding)
+
+
+class LowestLatency(RoutingStrategy):
+    """Lowest EWMA ack latency. Unmeasured venues go first so every venue gets sampled."""
+
+    name = 'lowest-latency'
+
+    def choose(self, venues, order):
+        return min(venues, key=lambda venue: (venue.stats.ack_latency or 0.0, venue.stats.outstanding))
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (RoundRobin, LeastOutstanding, LowestLatency)}
+
+
+def parse_venue(text, index):
+    """Parse 'host:port' or 'name=host:port' from the command line into (name, host, port)."""
+    name, sep, address = text.rpartition('=')
+    host, _, port = address.rpartition(':')
+    return (name if sep else f'venue{index}'), host or 'localhost', int(port)
+
+
+class RoutedOrder:
+    __slots__ = ('venue', 'conn_id', 'quantity', 'filled', 'sent_at', 'acked', 'parent_id')
+
+    def __init__(self, venue, conn_id, quantity, parent_id=None):
+        self.venue = venue
+        self.conn_id = conn_id
+        self.quantity = quantity
+        self.parent_id = parent_id  # set on child orders of a split
+        self.filled = 0
+        self.sent_at = time.perf_counter()
+        self.acked = False
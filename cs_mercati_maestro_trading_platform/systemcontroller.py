@@ -31,7 +31,6 @@ LOG_FILE = os.path.join(LOG_DIR, 'platform_controller.log')
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s', filename=LOG_FILE, filemode='a')
 
 # Paths to the scripts for each app
-MARKET_DATA_APP = os.path.join(BASE_DIR, 'dati', 'dati.py')
 TRADING_APP = os.path.join(BASE_DIR, 'maestro.py')  # Trading App is in the same directory as this controller script
 ORDER_ROUTER_APP = os.path.join(BASE_DIR, 'sor', 'sor.py')
 FIX_ENGINE_APP = os.path.join(BASE_DIR, 'fix', 'fix.py')
@@ -39,7 +38,6 @@ MARKET_SIMULATOR_APP = os.path.join(BASE_DIR, 'sim', 'marketsimulator.py')
 
 # List of all app scripts with their names
 APPS = {
-        "MARKET_DATA": MARKET_DATA_APP,
         "TRADING": TRADING_APP,
         "ORDER_ROUTER": ORDER_ROUTER_APP,
         "FIX_ENGINE": FIX_ENGINE_APP,
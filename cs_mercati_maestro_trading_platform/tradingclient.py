@@ -0,0 +1,490 @@
+#!/usr/bin/python3
+import argparse
+import logging
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+
+from framing import FrameError, FrameParser, encode_frame, encode_frames
+from messages import format_message, format_order, parse_message
+
+"""
+Trading Client
+--------------
+Headless core of the Trading Front End. It owns the market data listener, the order session to the
+Order Router and the client state, so the Tk GUI (maestro.py), automated strategies and load tests
+all share the same order path. Many instances can run per box without a display.
+
+- Receiving: Multicast from 224.1.1.1 on port 5007: the Market Simulator's quote and trade
+  messages (see sim/marketdata.py), batched several to a datagram one per line.
+- Sending: TCP to Order Router on localhost:5008 over one persistent session, one
+  length-prefixed frame per message (see framing.py and messages.py). The session opens with
+  logon trader=<trader ID>.
+- Order state: every order carries a client order ID (id=<trader>-<n>) and is tracked in
+  TradingClient.orders through pending -> acked -> partially filled -> filled / cancelled / rejected,
+  driven by ack/fill/cancelled/reject messages read back on the order session.
+- Dependencies: None
+
+Usage:
+    python3 tradingclient.py --order red --count 10 --interval 0.5
+    python3 tradingclient.py --listen 30
+    python3 basket.py orders.csv   (basket submission, see basket.py)
+"""
+
+# Multicast setup
+MCAST_GRP = '224.1.1.1'
+MCAST_PORT = 5007
+
+# TCP setup
+ROUTER_HOST = 'localhost'
+ROUTER_PORT = 5008
+
+# Components checked by check_dependencies, by TCP port
+COMPONENT_PORTS = {
+    "OrderRouter": 5008,
+    "FIXEngine": 5009,
+    "MarketSimulator": 5010
+}
+
+
+class MarketDataListener(threading.Thread):
+    def __init__(self, data_queue, update_status_callback):
+        super().__init__(daemon=True)
+        self.data_queue = data_queue
+        self.update_status_callback = update_status_callback
+        self.running = True
+
+        logging.debug("Initializing MarketDataListener")
+
+        # Set up the socket for receiving multicast data
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind(('', MCAST_PORT))
+            logging.info(f"Socket bound to ('', {MCAST_PORT})")
+
+            # Join the multicast group
+            mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            logging.info(f"MarketDataListener joined multicast group {MCAST_GRP} on port {MCAST_PORT}")
+
+            # Set socket timeout
+            self.sock.settimeout(1)  # 1 second timeout
+        except Exception as e:
+            logging.error(f"Failed to initialize MarketDataListener: {e}")
+
+    def run(self):
+        logging.debug("MarketDataListener thread started")
+        while self.running:
+            try:
+                # Receive data from the multicast group
+                data, addr = self.sock.recvfrom(1024)
+                source_ip, source_port = addr
+                # The Market Simulator batches a matching cycle's messages, one per line
+                for message in data.decode('utf-8').splitlines():
+                    if message != 'heartbeat':
+                        self.data_queue.put((message, source_ip, source_port))
+                        logging.debug(f"Received market data message from {source_ip}:{source_port}: {message}")
+                self.update_status_callback("green")  # Update status light to green on successful data reception
+            except socket.timeout:
+                # This is normal, just continue
+                continue
+            except Exception as e:
+                if not self.running:
+                    break
+                logging.error(f"Error receiving market data message: {e}")
+                self.update_status_callback("red")  # Update status light to red on error
+                time.sleep(1)  # Avoid tight loop on persistent errors
+
+    def stop(self):
+        self.running = False
+        try:
+            self.sock.close()
+            logging.info("MarketDataListener stopped")
+        except Exception as e:
+            logging.error(f"Error closing MarketDataListener socket: {e}")
+
+
+# Client order states
+PENDING = "pending"
+ACKED = "acked"
+PARTIALLY_FILLED = "partially filled"
+FILLED = "filled"
+CANCELLED = "cancelled"
+REJECTED = "rejected"
+
+TERMINAL_STATES = (FILLED, CANCELLED, REJECTED)
+
+
+class ClientOrder:
+    """One row of the client order state table."""
+
+    __slots__ = ('order_id', 'symbol', 'side', 'quantity', 'price', 'status', 'filled', 'reason',
+                 'sent_at', 'ack_latency', 'fill_latency', 'updated_at')
+
+    def __init__(self, order_id, symbol, side, quantity, price):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.price = price
+        self.status = PENDING
+        self.filled = 0
+        self.reason = None  # of a reject
+        self.sent_at = time.perf_counter()
+        self.ack_latency = None  # seconds from send to ack
+        self.fill_latency = None  # seconds from send to complete fill
+        self.updated_at = self.sent_at
+
+    def __repr__(self):
+        return (f"{self.order_id} {self.side} {self.quantity} {self.symbol} "
+                f"@ {self.price or 'MKT'}: {self.status} ({self.filled}/{self.quantity})")
+
+
+class OrderSessionReader(threading.Thread):
+    """Reads framed messages sent back on the order session."""
+
+    def __init__(self, sock, message_callback):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.message_callback = message_callback
+
+    def run(self):
+        parser = FrameParser()
+        while True:
+            try:
+                data = self.sock.recv(65536)
+                messages = parser.feed(data)
+            except (OSError, FrameError) as e:
+                logging.debug(f"Order session read ended: {e}")
+                break
+            if not data:
+                break
+            for message in messages:
+                self.message_callback(message.decode('utf-8'))
+        logging.debug("Order session reader stopped")
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class TradingClient:
+    """Headless trading client: market data listener, order session and state.
+
+    The GUI registers callbacks; scripts call the methods directly. Nothing here touches tkinter.
+    """
+
+    def __init__(self, router_host=ROUTER_HOST, router_port=ROUTER_PORT, market_data=True, trader_id=None):
+        self.router_host = router_host
+        self.router_port = router_port
+        self.market_data = market_data
+        self.data_queue = queue.Queue()
+        self.listener = None
+        self.sock = None
+        self.lock = threading.Lock()
+        self.status_callbacks = []
+        self.order_callbacks = []
+        self.reader = None
+
+        # Client state
+        self.trader_id = trader_id or f"T{os.getpid()}"
+        self.market_data_status = "grey"
+        self.last_market_data = None
+        self.orders_sent = 0
+        self.orders = {}  # client order ID -> ClientOrder
+        self.order_sequence = 0
+
+    def start(self):
+        """Start the market data listener (if enabled). Does not block."""
+        if self.market_data and self.listener is None:
+            logging.debug("Starting MarketDataListener")
+            self.listener = MarketDataListener(self.data_queue, self.on_market_data_status)
+            self.listener.start()
+        return self
+
+    def stop(self):
+        """Stop the listener and close the order session."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.disconnect()
+
+    def add_status_callback(self, callback):
+        """Register a callback(color) invoked from the listener thread on market data status changes."""
+        self.status_callbacks.append(callback)
+
+    def add_order_callback(self, callback):
+        """Register a callback(order) invoked from the session reader thread whenever an order changes state."""
+        self.order_callbacks.append(callback)
+
+    def on_market_data_status(self, color):
+        self.market_data_status = color
+        for callback in self.status_callbacks:
+            callback(color)
+
+    def get_market_data(self):
+        """Drain and return all queued (message, source_ip, source_port) tuples."""
+        messages = []
+        try:
+            while True:
+                messages.append(self.data_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if messages:
+            self.last_market_data = messages[-1]
+        return messages
+
+    def connect(self):
+        """Open the order session to the Order Router. Raises ConnectionRefusedError if it is down."""
+        with self.lock:
+            if self.sock is None:
+                logging.info(f"Connecting to Order Router at {self.router_host}:{self.router_port}")
+                self.sock = socket.create_connection((self.router_host, self.router_port))
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                # First message names the trader, so a sharded router keeps this trader on one worker
+                self.sock.sendall(encode_frame(format_message('logon', trader=self.trader_id)))
+                self.reader = OrderSessionReader(self.sock, self.on_order_message)
+                self.reader.start()
+        return self
+
+    def disconnect(self):
+        with self.lock:
+            if self.sock is not None:
+                try:
+                    self.sock.close()
+                    logging.info("Order session closed")
+                except Exception as e:
+                    logging.error(f"Error closing order session: {e}")
+                self.sock = None
+                self.reader = None
+
+    def new_order_id(self):
+        self.order_sequence += 1
+        return f"{self.trader_id}-{self.order_sequence}"
+
+    def send_order(self, symbol, side='buy', quantity=1, price=None):
+        """Send one order over the order session. Returns its ClientOrder."""
+        logging.debug(f"Preparing to send order: {symbol} {side} {quantity} {price}")
+        return self.send_orders([(symbol, side, quantity, price)])[0]
+
+    def send_orders(self, orders):
+        """Send a batch of (symbol, side, quantity, price) orders in one write. Returns their ClientOrders."""
+        client_orders = [ClientOrder(self.new_order_id(), *order) for order in orders]
+        messages = [format_order(o.symbol, o.side, o.quantity, o.price, order_id=o.order_id) for o in client_orders]
+        # Stamped before the write: an ack can come back before sendall returns
+        sent_at = time.perf_counter()
+        for order in client_orders:
+            order.sent_at = sent_at
+            self.orders[order.order_id] = order
+        try:
+            self.send_messages(messages)
+        except OSError:
+            for order in client_orders:
+                del self.orders[order.order_id]
+            raise
+        self.orders_sent += len(client_orders)
+        return client_orders
+
+    def cancel_order(self, order_id):
+        """Request cancellation of a working order. Its state changes when the cancel is confirmed."""
+        order = self.orders[order_id]
+        if order.status in TERMINAL_STATES:
+            return False
+        self.send_messages([format_message('cancel', id=order_id)])
+        return True
+
+    def send_messages(self, messages):
+        """Write messages in one sendall, reconnecting once if the session was dropped."""
+        data = encode_frames(messages)
+        for attempt in range(2):
+            self.connect()
+            try:
+                with self.lock:
+                    self.sock.sendall(data)
+                break
+            except OSError as e:
+                logging.warning(f"Order session dropped ({e}), reconnecting")
+                self.disconnect()
+                if attempt:
+                    raise
+        logging.debug(f'Sent {len(messages)} messages to {self.router_host}:{self.router_port}')
+
+    def on_order_message(self, text):
+        """Apply an ack/fill/cancelled/reject message to the order state table."""
+        kind, fields = parse_message(text)
+        order = self.orders.get(fields.get('id'))
+        if order is None:
+            logging.debug(f"Ignoring message for unknown order: {text}")
+            return
+        now = time.perf_counter()
+        if kind == 'ack':
+            if order.status == PENDING:
+                order.status = ACKED
+            if order.ack_latency is None:  # split and algo orders are acked once per child
+                order.ack_latency = now - order.sent_at
+        elif kind == 'fill':
+            order.filled += int(fields.get('qty', 0))
+            if order.ack_latency is None:
+                order.ack_latency = now - order.sent_at
+            if order.filled >= order.quantity:
+                order.status = FILLED
+                order.fill_latency = now - order.sent_at
+            else:
+                order.status = PARTIALLY_FILLED
+        elif kind == 'cancelled':
+            order.status = CANCELLED
+        elif kind == 'reject':
+            order.status = REJECTED
+            order.reason = fields.get('reason')
+            logging.warning(f"Order {order.order_id} rejected: {fields.get('reason', '')}")
+        else:
+            logging.debug(f"Ignoring order session message: {text}")
+            return
+        order.updated_at = now
+        logging.debug(f"Order update: {order}")
+        for callback in self.order_callbacks:
+            callback(order)
+
+    def order_counts(self):
+        """Return {status: number of orders}."""
+        counts = {}
+        for order in self.orders.values():
+            counts[order.status] = counts.get(order.status, 0) + 1
+        return counts
+
+    def latency_summary(self):
+        """Return ack and fill round-trip latency percentiles in milliseconds."""
+        summary = {}
+        for name in ('ack_latency', 'fill_latency'):
+            values = sorted(getattr(o, name) for o in self.orders.values() if getattr(o, name) is not None)
+            if values:
+                summary[name] = {
+                    'count': len(values),
+                    'p50_ms': round(_percentile(values, 0.50) * 1000, 3),
+                    'p99_ms': round(_percentile(values, 0.99) * 1000, 3),
+                    'max_ms': round(values[-1] * 1000, 3),
+                }
+        return summary
+
+    def ping_component(self, port):
+        logging.debug(f"Pinging component on port {port}")
+        # Check if a component is reachable via TCP
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                destination_ip = 'localhost'
+                logging.info(f"Trying to connect to {destination_ip}:{port}")
+                s.connect((destination_ip, port))
+            logging.debug(f"Component on port {port} is up")
+            return True
+        except ConnectionRefusedError:
+            logging.debug(f"Component on port {port} is down")
+            return False
+        except Exception as e:
+            logging.error(f"Error pinging component on port {port}: {e}")
+            return False
+
+    def check_market_data_multicast(self):
+        logging.debug("Checking market data multicast")
+        try:
+            # Set up the socket for receiving multicast data
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', MCAST_PORT))
+
+            # Join the multicast group
+            mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+
+            # Attempt to receive data
+            sock.settimeout(1)
+            try:
+                data, _ = sock.recvfrom(1024)
+                logging.debug("Successfully received multicast data")
+                return True
+            except socket.timeout:
+                logging.error("Failed to receive multicast data within the timeout period")
+                return False
+            finally:
+                sock.close()
+        except Exception as e:
+            logging.error(f"Error checking market data multicast: {e}")
+            return False
+
+    def check_dependencies(self):
+        """Return {component: bool} for the TCP components and the market data multicast."""
+        logging.debug("Checking dependencies")
+        status = {component: self.ping_component(port) for component, port in COMPONENT_PORTS.items()}
+        status["MarketData"] = self.check_market_data_multicast()
+        for component, up in status.items():
+            logging.debug(f"Component {component} status: {'up' if up else 'down'}")
+        return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless trading client")
+    parser.add_argument("--host", default=ROUTER_HOST, help="Order Router host")
+    parser.add_argument("--port", type=int, default=ROUTER_PORT, help="Order Router port")
+    parser.add_argument("--order", choices=["red", "blue"], help="colour of the orders to send")
+    parser.add_argument("--side", choices=["buy", "sell"], default="buy", help="order side")
+    parser.add_argument("--quantity", type=int, default=1, help="order quantity")
+    parser.add_argument("--price", type=float, help="limit price (default: market)")
+    parser.add_argument("--count", type=int, default=1, help="number of orders to send")
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between orders")
+    parser.add_argument("--listen", type=float, default=0.0, help="seconds to print market data for")
+    parser.add_argument("--no-market-data", action="store_true", help="do not join the multicast feed")
+    parser.add_argument("--check", action="store_true", help="print component status and exit")
+    parser.add_argument("--wait", type=float, default=0.0, help="seconds to wait for acks/fills after sending")
+    args = parser.parse_args(argv)
+
+    log_dir = "logs"
+    os.makedirs(log_dir, exist_ok=True)
+    logging.basicConfig(filename=os.path.join(log_dir, f'tradingclient_{time.strftime("%y%m%d%H%M%S")}.log'),
+                        level=logging.DEBUG,
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    client = TradingClient(args.host, args.port, market_data=not args.no_market_data and args.listen > 0)
+    client.start()
+    try:
+        if args.check:
+            for component, up in client.check_dependencies().items():
+                print(f"{component}: {'up' if up else 'down'}")
+            return 0
+
+        if args.order:
+            start = time.perf_counter()
+            try:
+                for i in range(args.count):
+                    client.send_order(args.order, args.side, args.quantity, args.price)
+                    if args.interval:
+                        time.sleep(args.interval)
+            except ConnectionRefusedError:
+                print("Order Router is down. Cannot send order.", file=sys.stderr)
+                return 1
+            elapsed = time.perf_counter() - start
+            print(f"Sent {client.orders_sent} orders in {elapsed:.3f}s")
+
+            deadline = time.monotonic() + args.wait
+            while time.monotonic() < deadline and any(
+                    o.status not in TERMINAL_STATES for o in client.orders.values()):
+                time.sleep(0.01)
+            print(f"Order states: {client.order_counts()}")
+            for name, stats in client.latency_summary().items():
+                print(f"{name}: {stats}")
+
+        deadline = time.monotonic() + args.listen
+        while time.monotonic() < deadline:
+            for message, source_ip, source_port in client.get_market_data():
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {message} from {source_ip}:{source_port}")
+            time.sleep(0.1)
+        return 0
+    finally:
+        client.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import socket
+import time
+
+"""
+Worker Supervisor
+-----------------
+Pre-forks N worker processes for a component and keeps them running. Each worker binds the same
+port with SO_REUSEPORT (Relay(reuse_port=True)), so the kernel spreads incoming connections across
+them and every worker runs its own event loop, upstream sessions and GIL.
+
+- Workers are forked by a multiprocessing fork server (START_METHOD), a single-threaded process
+  exec'd for the purpose, never from the supervisor's own process: that one runs threads and event
+  loops, and a child forked from it can inherit a lock another thread held and hang on it. A worker
+  inherits none of the supervisor's sockets, only its channel. The target and its arguments are
+  pickled, so the target must be a module-level function, and each worker imports the component's
+  script again before running it (sor.py and marketsimulator.py pass their log file down in the
+  environment, so workers and their restarts log to the supervisor's file).
+- A worker that exits is restarted. One that dies within MIN_UPTIME of starting is restarted after
+  a delay that doubles up to MAX_RESTART_DELAY, so a crash loop doesn't spin.
+- Stopping the supervisor (Ctrl-C or SIGTERM) terminates all workers.
+- With channels=True each worker also gets a Unix socket to the supervisor process (a new one on
+  every restart), which a front acceptor uses to hand it connections (see sor/shards.py). It is a
+  SOCK_SEQPACKET pair unless channel_type says otherwise: the market simulator's shards stream
+  framed batches over SOCK_STREAM (see sim/shards.py).
+"""
+
+RESTART_DELAY = 0.5  # Seconds before restarting a worker that died
+MAX_RESTART_DELAY = 30.0
+START_METHOD = 'forkserver'
+MIN_UPTIME = 5.0  # Seconds a worker must run for its restart delay to reset
+STOP_TIMEOUT = 5.0
+POLL_INTERVAL = 1.0  # Longest wait between checks that the supervisor is still running
+
+
+class Worker:
+    __slots__ = ('index', 'process', 'started', 'restarts', 'delay', 'channel')
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.started = 0.0
+        self.restarts = 0
+        self.delay = RESTART_DELAY
+        self.channel = None  # Supervisor's end of the socket pair to the worker, with channels=True
+
+
+def run_worker(target, index, args, channel):
+    """Worker process entry point."""
+    if channel is None:
+        target(index, *args)
+    else:
+        target(index, *args, channel=channel)
+
+
+class Supervisor:
+    """Runs target(index, *args) in count worker processes and restarts any that exit.
+
+    With channels=True the target is called as target(index, *args, channel=<socket>).
+    """
+
+    def __init__(self, name, count, target, *args, channels=False, channel_type=socket.SOCK_SEQPACKET):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.channels = channels
+        self.channel_type = channel_type
+        self.workers = [Worker(index) for index in range(count)]
+        self.restart_at = {}  # worker index -> monotonic time to restart it
+        self.context = multiprocessing.get_context(START_METHOD)
+        self.running = False
+
+    def spawn(self, worker):
+        channel = None
+        if self.channels:
+            if worker.channel is not None:
+                worker.channel.close()
+            worker.channel, channel = socket.socketpair(socket.AF_UNIX, self.channel_type)
+            worker.channel.setblocking(False)  # a stuck worker must not stall the process handing it work
+        worker.process = self.context.Process(target=run_worker, args=(self.target, worker.index, self.args, channel),
+                                              name=f'{self.name} worker {worker.index}')
+        worker.process.start()
+        if channel is not None:
+            channel.close()
+        worker.started = time.monotonic()
+        logging.info(f'{self.name}: started worker {worker.index} (pid {worker.process.pid})')
+
+    def on_exit(self, worker):
+        uptime = time.monotonic() - worker.started
+        logging.error(f'{self.name}: worker {worker.index} (pid {worker.process.pid}) exited with code '
+                      f'{worker.process.exitcode} after {uptime:.1f}s')
+        worker.delay = RESTART_DELAY if uptime >= MIN_UPTIME else min(worker.delay * 2, MAX_RESTART_DELAY)
+        worker.process = None
+        if not self.running:
+            return
+        worker.restarts += 1
+        self.restart_at[worker.index] = time.monotonic() + worker.delay
+
+    def start(self):
+        """Start every worker now. run() starts any not started yet, and may then run in a thread."""
+        self.running = True
+        for worker in self.workers:
+            if worker.process is None:
+                self.spawn(worker)
+
+    def run(self):
+        """Keep the workers running until stopped, starting them first if start() was not called."""
+        self.start()
+        try:
+            while self.running:
+                now = time.monotonic()
+                for index, when in list(self.restart_at.items()):
+                    if when <= now:
+                        del self.restart_at[index]
+                        self.spawn(self.workers[index])
+                sentinels = {w.process.sentinel: w for w in self.workers if w.process is not None}
+                timeout = min([POLL_INTERVAL] + [max(0.0, when - now) for when in self.restart_at.values()])
+                for sentinel in multiprocessing.connection.wait(list(sentinels), timeout):
+                    sentinels[sentinel].process.join()
+                    self.on_exit(sentinels[sentinel])
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        live = [w.process for w in self.workers if w.process is not None and w.process.is_alive()]
+        for process in live:
+            process.terminate()
+        for process in live:
+            process.join(STOP_TIMEOUT)
+        logging.info(f'{self.name}: stopped {len(live)} workers')